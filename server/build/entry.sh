@@ -12,5 +12,15 @@ sleep 5;
 
 #cd /opt/src && python3 manage.py makemigrations
 cd /opt/src && python3 manage.py migrate
+# then each shard of POSTGRES_SHARD_HOSTS, whose ids start above the default database's
+for number in $(seq 1 $(echo "$POSTGRES_SHARD_HOSTS" | tr ',' '\n' | grep -c .)); do
+    cd /opt/src && python3 manage.py migrate --database shard_$number
+done
+
+cd /opt/src && python3 manage.py build_feedback_table
+
+cd /opt/src && python3 manage.py build_opening_book
 
-cd /opt/src && python3 manage.py runserver 0.0.0.0:8000
+# serve with an ASGI server rather than runserver: game events are streamed by an async view, which WSGI
+# buffers until the stream ends, and the async views bound each process's database connections, see mastermind.asgi
+cd /opt/src && uvicorn mastermind.asgi:application --host 0.0.0.0 --port 8000
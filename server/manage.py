@@ -3,6 +3,9 @@ import os
 import sys
 
 if __name__ == '__main__':
+    # the tests run with the databases they need to stand in for replicas and shards
+    if sys.argv[1:2] == ['test']:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mastermind.test_settings')
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mastermind.settings')
     try:
         from django.core.management import execute_from_command_line
@@ -0,0 +1,16 @@
+"""
+ASGI config for mastermind project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+served by an ASGI server such as uvicorn so async views like server-sent events don't hold a thread per connection.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mastermind.settings')
+# the async versions of the busiest views, which bound the database connections each process opens, see mastermind.db_threads
+os.environ.setdefault('ASYNC_VIEWS', '1')
+
+application = get_asgi_application()
@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connections
+from django.http import HttpRequest, HttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from typing import Callable, Dict, Optional, Tuple, Type
+import asyncio
+import contextvars
+
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return this process's pool of database threads, which bounds the requests of ThreadedView views using the database at a time."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.ASYNC_DB_THREADS, thread_name_prefix='db')
+    return _executor
+
+
+def run_view(view: Callable, request: HttpRequest, args: Tuple, kwargs: Dict) -> HttpResponse:
+    """Handle a request with a sync view and render its response, then close the thread's connections like the end of a sync request."""
+    try:
+        response = view(request, *args, **kwargs)
+        # rendered on the pool's thread with the rest of the request's sync work, rather than on another thread of django's
+        if hasattr(response, 'render') and callable(response.render):
+            response = response.render()
+        return response
+    finally:
+        # the thread's next request runs in another context, with connections of its own
+        connections.close_all()
+
+
+
+class ThreadedView(View):
+    """Async view handling each request with a sync rest framework view run in this process's pool of database threads.
+
+    Under ASGI, django runs each request's sync view on a thread of its own, so a process opens a database connection
+        per concurrent request. These views run in a pool of ASYNC_DB_THREADS threads instead, which bounds the connections
+        of each process: requests beyond it wait for a thread, so these views serve fewer requests at a time than plain sync views.
+    """
+
+    # the rest framework view handling the requests, and the view function made from it by as_view
+    view_class: Type[View]
+    sync_view: Optional[Callable] = None
+
+    # every method is dispatched to the sync view, which answers the methods it doesn't allow itself
+    view_is_async = True
+
+    @classmethod
+    def as_view(cls, **initkwargs) -> Callable:
+        # the rest framework view checks csrf tokens itself when authenticating with a session
+        return csrf_exempt(super(ThreadedView, cls).as_view(sync_view=cls.view_class.as_view(), **initkwargs))
+
+    async def dispatch(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        # in a copy of the request's context, which holds its metrics, replica pin and shard
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(get_executor(), context.run, run_view, self.sync_view, request, args, kwargs)
@@ -0,0 +1,180 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.backends.signals import connection_created
+from django.http import HttpRequest, HttpResponse, HttpResponseForbidden
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+from rest_framework import serializers
+from typing import Callable, Iterator, Optional
+import ipaddress
+import os
+import time
+
+
+
+REQUESTS = Counter('mastermind_requests_total', 'Requests by URL name, method and status code.', ['view', 'method', 'status'])
+REQUEST_LATENCY = Histogram('mastermind_request_latency_seconds', 'Request latency by URL name.', ['view', 'method'])
+DB_QUERIES = Histogram(
+    'mastermind_db_queries', 'Database queries per request by URL name.', ['view'],
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 50, 100)
+)
+DB_TIME = Histogram('mastermind_db_time_seconds', 'Time spent in database queries per request by URL name.', ['view'])
+SERIALIZER_TIME = Histogram('mastermind_serializer_time_seconds', 'Time spent in serializers per request by URL name.', ['view'])
+RESPONSE_SIZE = Histogram(
+    'mastermind_response_size_bytes', 'Response body size by URL name.', ['view'],
+    buckets=(0, 64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+)
+TOKEN_CACHE_LOOKUPS = Counter('mastermind_token_cache_lookups_total', 'Lookups of the auth token cache by result, hit or miss.', ['result'])
+# summed over the live worker processes when running multiprocess, each process having its own cache
+TOKEN_CACHE_SIZE = Gauge('mastermind_token_cache_size', 'Tokens held by the auth token cache.', multiprocess_mode='livesum')
+
+
+class RequestMetrics:
+    """The database and serializer usage of the request being handled."""
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        # serializers nest, only the outermost one is timed
+        self.serializer_depth = 0
+
+
+_current_request: ContextVar[Optional[RequestMetrics]] = ContextVar('current_request_metrics', default=None)
+
+
+def record_query(execute: Callable, sql: str, params: tuple, many: bool, context: dict):
+    """Database execute wrapper counting and timing each query of the request being handled, whichever thread runs it."""
+    request_metrics = _current_request.get()
+    if request_metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        request_metrics.queries += 1
+        request_metrics.db_time += time.perf_counter() - start
+
+
+def install_query_recorder(sender: type, connection: BaseDatabaseWrapper, **kwargs) -> None:
+    """Record the queries of a database connection, on connection_created so the connections of every thread record them."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_query_recorder)
+
+
+@contextmanager
+def serializer_timer() -> Iterator[None]:
+    """Add the time spent in the block to the current request's serializer time."""
+    request_metrics = _current_request.get()
+    if request_metrics is None:
+        yield
+        return
+    request_metrics.serializer_depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        request_metrics.serializer_depth -= 1
+        if request_metrics.serializer_depth == 0:
+            request_metrics.serializer_time += time.perf_counter() - start
+
+
+
+class SerializerTimingMixin:
+    """Serializer mixin recording the time spent validating and representing data."""
+
+    def is_valid(self, *args, **kwargs) -> bool:
+        with serializer_timer():
+            return super(SerializerTimingMixin, self).is_valid(*args, **kwargs)
+
+    @property
+    def data(self):
+        with serializer_timer():
+            return super(SerializerTimingMixin, self).data
+
+
+
+class TimedListSerializer(SerializerTimingMixin, serializers.ListSerializer):
+    """List serializer recording the time spent validating and representing data, for serializers used with many=True."""
+
+
+
+class MetricsMiddleware:
+    """Middleware recording the latency, database queries, serializer time and response size of each request by URL name.
+
+    It's sync and async, so under ASGI requests to async views aren't switched to a sync thread and back for it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable) -> None:
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        # connections opened before this was loaded, later ones are set up by install_query_recorder
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(type(connection), connection)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if self.async_mode:
+            return self.__acall__(request)
+        request_metrics = RequestMetrics()
+        token = _current_request.set(request_metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        self.observe(request, response, request_metrics, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        request_metrics = RequestMetrics()
+        token = _current_request.set(request_metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        self.observe(request, response, request_metrics, time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def observe(request: HttpRequest, response: HttpResponse, request_metrics: RequestMetrics, latency: float) -> None:
+        """Record a handled request's metrics."""
+        view = request.resolver_match.url_name if request.resolver_match else 'unmatched'
+        REQUESTS.labels(view, request.method, response.status_code).inc()
+        REQUEST_LATENCY.labels(view, request.method).observe(latency)
+        DB_QUERIES.labels(view).observe(request_metrics.queries)
+        DB_TIME.labels(view).observe(request_metrics.db_time)
+        SERIALIZER_TIME.labels(view).observe(request_metrics.serializer_time)
+        # streamed responses are written after the middleware returns
+        if not response.streaming:
+            RESPONSE_SIZE.labels(view).observe(len(response.content))
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """Return every metric in the Prometheus text format, aggregated across worker processes when running multiprocess.
+
+    Only clients whose address is in the METRICS_ALLOWED_NETWORKS setting are answered, as the metrics expose the API's usage.
+    """
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return HttpResponseForbidden()
+    if not any(address in ipaddress.ip_network(network) for network in settings.METRICS_ALLOWED_NETWORKS):
+        return HttpResponseForbidden()
+    registry = REGISTRY
+    # each worker process writes its metrics to files in this directory, see the prometheus_client multiprocess docs
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,106 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Model
+from django.http import HttpRequest, HttpResponse
+from typing import Callable, Optional, Type
+import hashlib
+import random
+
+
+
+# the methods of requests which only read, the others may write and pin their client to the primary
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# whether the request being handled must read from the primary, set by ReplicaPinningMiddleware
+_use_primary: ContextVar[bool] = ContextVar('use_primary', default=False)
+
+
+def pin_key(request: HttpRequest) -> Optional[str]:
+    """Return the cache key pinning a request's client to the primary, from its auth token, or None for anonymous requests."""
+    # the token is hashed so it isn't stored in the cache
+    key = request.GET.get('token')
+    authorization = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(authorization) == 2 and authorization[0] == 'Token':
+        key = authorization[1]
+    if not key:
+        return None
+    return 'replica-pin:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+
+class ReplicaRouter:
+    """Database router sending reads to a random replica of REPLICA_DATABASES and writes to the primary.
+
+    Reads go to the primary instead while it's in a transaction, for auth tokens, and for requests pinned to it,
+        see ReplicaPinningMiddleware.
+    """
+
+    def db_for_read(self, model: Type[Model], **hints) -> str:
+        if not settings.REPLICA_DATABASES or _use_primary.get():
+            return DEFAULT_DB_ALIAS
+        # a transaction, or a row locked for update, must see its own writes
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        # a client which just logged in authenticates with a token the replicas may not have yet,
+            # tokens are mostly read from the token cache so this adds little to the primary's load
+        if model._meta.app_label == 'authtoken':
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.REPLICA_DATABASES)
+
+    def db_for_write(self, model: Type[Model], **hints) -> str:
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1: Model, obj2: Model, **hints) -> bool:
+        # the replicas hold the same rows as the primary
+        return True
+
+
+
+class ReplicaPinningMiddleware:
+    """Middleware reading from the primary for requests which may write, and for REPLICA_PIN_SECONDS after them for the same client.
+
+    The pins are kept in the default cache, so it must be shared by every process for a client to stay pinned across them.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable) -> None:
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if self.async_mode:
+            return self.__acall__(request)
+        if not settings.REPLICA_DATABASES:
+            return self.get_response(request)
+        key = pin_key(request)
+        writes = request.method not in SAFE_METHODS
+        token = _use_primary.set(writes or (key is not None and cache.get(key) is not None))
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_primary.reset(token)
+        # pinned once the request is done, so replicas have until the pin expires to catch up on its writes
+        if writes and key is not None:
+            cache.set(key, True, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        if not settings.REPLICA_DATABASES:
+            return await self.get_response(request)
+        key = pin_key(request)
+        writes = request.method not in SAFE_METHODS
+        token = _use_primary.set(writes or (key is not None and await cache.aget(key) is not None))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _use_primary.reset(token)
+        if writes and key is not None:
+            await cache.aset(key, True, settings.REPLICA_PIN_SECONDS)
+        return response
@@ -39,11 +39,13 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'rest_framework.authtoken',
-    'users',
+    'users.apps.UsersConfig',
     'mastermind_api',
 ]
 
 MIDDLEWARE = [
+    'mastermind.metrics.MetricsMiddleware',
+    'mastermind.routers.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -72,6 +74,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'mastermind.wsgi.application'
+ASGI_APPLICATION = 'mastermind.asgi.application'
 
 
 # Database
@@ -92,6 +95,46 @@ DATABASES = {
     }
 }
 
+# Read replicas of the default database as a comma separated list of hosts sharing its name and credentials,
+    # see mastermind.routers.ReplicaRouter. Without any, everything is read from the default database
+REPLICA_HOSTS = [host for host in os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',') if host]
+for number, host in enumerate(REPLICA_HOSTS, 1):
+    DATABASES['replica_{}'.format(number)] = dict(
+        DATABASES['default'], HOST=host, TEST={'NAME': 'test_{}_replica_{}'.format(DATABASES['default']['NAME'], number)}
+    )
+REPLICA_DATABASES = ['replica_{}'.format(number) for number in range(1, len(REPLICA_HOSTS) + 1)]
+
+# The seconds a client reads from the primary after a request which may write, so it sees its own writes
+    # however far behind the replicas are
+REPLICA_PIN_SECONDS = float(os.environ.get('REPLICA_PIN_SECONDS', 5))
+
+# Shards holding the games, moves and stats of their users, see mastermind_api.sharding, as a comma separated list of hosts
+    # sharing the default database's name and credentials. The default database is the first shard, with the games
+    # from before sharding, and holds the users and the directory of their shards. Without any, nothing is sharded
+SHARD_HOSTS = [host for host in os.environ.get('POSTGRES_SHARD_HOSTS', '').split(',') if host]
+for number, host in enumerate(SHARD_HOSTS, 1):
+    DATABASES['shard_{}'.format(number)] = dict(
+        DATABASES['default'], HOST=host, TEST={'NAME': 'test_{}_shard_{}'.format(DATABASES['default']['NAME'], number)}
+    )
+SHARD_DATABASES = ['default'] + ['shard_{}'.format(number) for number in range(1, len(SHARD_HOSTS) + 1)]
+
+# Ids are interleaved across shards so rows keep them when users move between shards, which caps the number of shards,
+    # and the seconds each process caches a user's shard for
+MAX_SHARDS = int(os.environ.get('MAX_SHARDS', 16))
+SHARD_DIRECTORY_TTL = float(os.environ.get('SHARD_DIRECTORY_TTL', 60))
+
+# Sharded models go to their shard, everything else to the default database or its replicas
+DATABASE_ROUTERS = ['mastermind_api.sharding.ShardRouter', 'mastermind.routers.ReplicaRouter']
+
+# The pins of clients to the primary are cached, a cache shared by every process is needed when running several,
+    # for example django.core.cache.backends.redis.RedisCache
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -135,6 +178,54 @@ AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
   'DEFAULT_AUTHENTICATION_CLASSES': (
-      'rest_framework.authentication.TokenAuthentication',
+      'users.authentication.CachedTokenAuthentication',
     )
 }
+
+# Directory holding the precomputed feedback tables built by `manage.py build_feedback_table`
+FEEDBACK_TABLE_DIR = os.environ.get('FEEDBACK_TABLE_DIR', os.path.join(BASE_DIR, 'data'))
+
+# The largest feedback table in bytes that may be built, a table holds a byte for every pair of codes,
+    # so the default fits 4 holes of up to 11 colors while 5 holes of 8 colors would already take 1 GiB
+FEEDBACK_TABLE_MAX_BYTES = int(os.environ.get('FEEDBACK_TABLE_MAX_BYTES', 256 * 1024 ** 2))
+
+# Directory holding the opening books of early guesses built by `manage.py build_opening_book`
+OPENING_BOOK_DIR = os.environ.get('OPENING_BOOK_DIR', FEEDBACK_TABLE_DIR)
+
+# Bounds of the per process cache of auth tokens used by users.authentication.CachedTokenAuthentication,
+    # the time to live also bounds how long other processes keep using a deleted token or deactivated user
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+TOKEN_CACHE_TTL = float(os.environ.get('TOKEN_CACHE_TTL', 60))
+
+# The networks whose clients may read the metrics endpoint, as a comma separated list of addresses or CIDR networks,
+    # the local host by default, the Prometheus server's address or network must be added when it scrapes from another host
+METRICS_ALLOWED_NETWORKS = [network for network in os.environ.get('METRICS_ALLOWED_NETWORKS', '127.0.0.1,::1').split(',') if network]
+
+# The processes searching guesses in parallel when the server plays a game, 0 or 1 searches in the request's process,
+    # the seconds each of its moves may spend searching before settling for the best guess found so far,
+    # and the seconds all of a game's moves may spend searching, after which they play the first code left without a search
+SOLVER_WORKERS = int(os.environ.get('SOLVER_WORKERS', os.cpu_count() or 1))
+SOLVER_MOVE_BUDGET = float(os.environ.get('SOLVER_MOVE_BUDGET', 2))
+SOLVER_GAME_BUDGET = float(os.environ.get('SOLVER_GAME_BUDGET', 10))
+
+# Where new games store their moves: 'rows' for a Move row each, or 'inline' for an array on the game's own row,
+    # which makes playing a move a single update and reading a game a single row, see `manage.py convert_move_storage`
+GAME_MOVE_STORAGE = os.environ.get('GAME_MOVE_STORAGE', 'rows')
+
+# The cache of the CACHES setting holding the state of games in progress, so a move doesn't read its game first,
+    # and the seconds a game's state is kept after its last move, see mastermind_api.game_cache
+GAME_STATE_CACHE = os.environ.get('GAME_STATE_CACHE', 'default')
+GAME_STATE_CACHE_TTL = float(os.environ.get('GAME_STATE_CACHE_TTL', 3600))
+
+# Server-sent events of new moves, see mastermind_api.events: the class carrying them between processes,
+    # the Postgres NOTIFY channel it uses, the seconds between keepalive comments on idle streams,
+    # and the events a subscriber can fall behind by before its stream is closed for it to reconnect and catch up
+EVENTS_NOTIFIER = os.environ.get('EVENTS_NOTIFIER', 'mastermind_api.events.PostgresNotifier')
+EVENTS_CHANNEL = os.environ.get('EVENTS_CHANNEL', 'mastermind_moves')
+EVENTS_KEEPALIVE = float(os.environ.get('EVENTS_KEEPALIVE', 15))
+EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', 100))
+
+# Whether creating and getting games and creating moves are served by async views, on by default under ASGI, see mastermind.asgi,
+    # and the threads per process those views run their database work on, which bounds the connections each process opens
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '0') == '1'
+ASYNC_DB_THREADS = int(os.environ.get('ASYNC_DB_THREADS', 32))
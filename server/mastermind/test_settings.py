@@ -0,0 +1,12 @@
+from mastermind.settings import *  # noqa: F401,F403
+from mastermind.settings import DATABASES
+
+
+
+# Databases standing in for a read replica and two shards when none are configured, on the default database's host,
+    # so the replica and sharding tests have several databases. The settings still read from and shard to none of them,
+    # the tests override REPLICA_DATABASES and SHARD_DATABASES to use them
+for alias in ['replica_1', 'shard_1', 'shard_2']:
+    DATABASES.setdefault(alias, dict(
+        DATABASES['default'], TEST={'NAME': 'test_{}_{}'.format(DATABASES['default']['NAME'], alias)}
+    ))
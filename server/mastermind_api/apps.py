@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, post_save, pre_delete
 
 
 
 class MastermindApiConfig(AppConfig):
     name = 'mastermind_api'
+
+    def ready(self) -> None:
+        """Keep the shards' ids interleaved, delete users' rows from every shard and cache saved games' states."""
+        from django.conf import settings
+        from mastermind_api import signals
+        from mastermind_api.models import Game
+        post_migrate.connect(signals.interleave_shard_ids, sender=self)
+        pre_delete.connect(signals.delete_user_rows, sender=settings.AUTH_USER_MODEL)
+        post_save.connect(signals.store_game_state, sender=Game)
@@ -0,0 +1,49 @@
+from mastermind_api import feedback_table, scoring
+import numpy as np
+
+
+
+def all_candidates(number_of_holes: int, number_of_colors: int) -> np.ndarray:
+    """Return the packed code of every possible code of a game configuration."""
+    return np.arange(number_of_colors ** number_of_holes, dtype=np.int64)
+
+
+def to_bytes(candidates: np.ndarray, number_of_holes: int, number_of_colors: int) -> bytes:
+    """Return a bitset with one bit per possible code, set for each of the candidates' packed codes."""
+    bits = np.zeros(number_of_colors ** number_of_holes, dtype=bool)
+    bits[candidates] = True
+    return np.packbits(bits, bitorder='little').tobytes()
+
+
+def from_bytes(data: bytes, number_of_holes: int, number_of_colors: int) -> np.ndarray:
+    """Return the packed codes set in a bitset made by to_bytes, only unpacking its bytes with a bit set."""
+    array = np.frombuffer(data, dtype=np.uint8)
+    indices = np.flatnonzero(array)
+    bits = np.unpackbits(array[indices, np.newaxis], axis=1, bitorder='little').astype(bool)
+    return (indices[:, np.newaxis] * 8 + np.arange(8))[bits].astype(np.int64)
+
+
+def clear_bits(data: bytes, codes: np.ndarray) -> bytes:
+    """Return a copy of a bitset made by to_bytes with the bits of the codes' packed codes cleared.
+
+    Takes time proportional to the number of codes, beyond copying the bitset.
+    """
+    array = np.frombuffer(data, dtype=np.uint8).copy()
+    codes = np.asarray(codes, dtype=np.int64)
+    np.bitwise_and.at(array, codes >> 3, (~(np.int64(1) << (codes & 7))).astype(np.uint8))
+    return array.tobytes()
+
+
+def narrow(candidates: np.ndarray, guess: np.ndarray, blacks: int, whites: int, number_of_holes: int, number_of_colors: int) -> np.ndarray:
+    """Return the candidates' packed codes which would have given a guess of color indices the same blacks and whites.
+
+    Takes time proportional to the number of candidates.
+    """
+    table = feedback_table.get_table(number_of_holes, number_of_colors)
+    if table is not None:
+        # the table is indexed by packed codes, so the candidates don't need unpacking
+        feedback = table[candidates, scoring.pack_codes(guess, number_of_colors)[0]]
+        return candidates[feedback == feedback_table.encode_feedback(blacks, whites, number_of_holes)]
+    codes = scoring.unpack_codes(candidates, number_of_holes, number_of_colors)
+    candidate_blacks, candidate_whites = feedback_table.score(codes, guess, number_of_holes, number_of_colors)
+    return candidates[(candidate_blacks == blacks) & (candidate_whites == whites)]
@@ -0,0 +1,219 @@
+from abc import ABC, abstractmethod
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils.module_loading import import_string
+from mastermind_api.models import Game, Move
+from typing import Dict, List, Optional, Set
+import asyncio
+import json
+import logging
+import psycopg2
+import psycopg2.extensions
+import select
+import threading
+
+
+
+logger = logging.getLogger(__name__)
+
+
+
+class Subscription:
+    """A subscriber's queue of events for a game, read on the event loop it subscribed from."""
+
+    def __init__(self, game_id: int, loop: asyncio.AbstractEventLoop, queue_size: int) -> None:
+        self.game_id = game_id
+        self.loop = loop
+        self.queue_size = queue_size
+        self.queue: asyncio.Queue = asyncio.Queue()
+        # set when the subscriber fell behind or the events may have gaps,
+            # the subscriber should then reconnect and catch up from the database
+        self.closed = False
+
+    def deliver(self, event: Optional[Dict]) -> None:
+        """Queue an event, or close the subscription on None or when it's queue_size events behind, on the subscription's event loop."""
+        if self.closed:
+            return
+        if event is None or self.queue.qsize() >= self.queue_size:
+            self.closed = True
+            # None tells the subscriber it's closed
+            self.queue.put_nowait(None)
+            return
+        self.queue.put_nowait(event)
+
+
+
+class Broker:
+    """Fans the events of each game out to this process's subscribers, published from any thread."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # game id to its subscriptions, only games with subscribers have an entry
+        self._subscriptions: Dict[int, Set[Subscription]] = {}
+
+    def subscribe(self, game_id: int) -> Subscription:
+        """Return a new subscription to a game's events, must be called from the event loop it's read on."""
+        subscription = Subscription(game_id, asyncio.get_running_loop(), settings.EVENTS_QUEUE_SIZE)
+        with self._lock:
+            self._subscriptions.setdefault(game_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Stop delivering events to a subscription."""
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.game_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.game_id]
+
+    def publish(self, game_id: int, event: Optional[Dict]) -> None:
+        """Deliver an event to every subscriber of a game, only costing a dictionary lookup for games without subscribers."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(game_id, ()))
+        for subscription in subscriptions:
+            subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+
+    def close_all(self) -> None:
+        """Close every subscription, so subscribers reconnect and catch up on events that may have been missed."""
+        with self._lock:
+            subscriptions = [subscription for game in self._subscriptions.values() for subscription in game]
+        for subscription in subscriptions:
+            subscription.loop.call_soon_threadsafe(subscription.deliver, None)
+
+    def count(self) -> int:
+        """Return the number of subscriptions."""
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+
+broker = Broker()
+
+
+
+class Notifier(ABC):
+    """Carries the events of moves from the process that created them to the broker of every process, see EVENTS_NOTIFIER."""
+
+    @abstractmethod
+    def publish(self, events: List[Dict], using: str) -> None:
+        """Send events from inside the transaction creating their moves on the using database, they're only delivered if it commits."""
+
+    def get_channel(self) -> Optional[str]:
+        """Return the NOTIFY channel a move's claim notifies its event on in the same query, or None to publish it, see Game.record_move."""
+        return None
+
+    def start(self) -> None:
+        """Start delivering events to this process's broker, called when the process gets its first subscriber."""
+
+
+
+class LocalNotifier(Notifier):
+    """Notifier delivering events to subscribers in the same process only, for a single process server."""
+
+    def publish(self, events: List[Dict], using: str) -> None:
+        def deliver() -> None:
+            for event in events:
+                broker.publish(event['game'], event)
+        transaction.on_commit(deliver, using=using)
+
+
+
+class PostgresNotifier(Notifier):
+    """Notifier sending events through Postgres NOTIFY, each process listening on its own connection to each shard.
+
+    NOTIFY is transactional, so events are only delivered once their moves are committed, in commit order.
+    """
+
+    # seconds between checks that the listening connection is still up, and before reconnecting after an error
+    POLL_INTERVAL = 5
+    RECONNECT_DELAY = 1
+
+    def __init__(self) -> None:
+        self.channel = settings.EVENTS_CHANNEL
+        self._lock = threading.Lock()
+        # a listener thread per database, and an event set once it first listens to the channel
+        self._threads: Dict[str, threading.Thread] = {}
+        self._listening: Dict[str, threading.Event] = {}
+        self._stopping = threading.Event()
+
+    def publish(self, events: List[Dict], using: str) -> None:
+        # one query however many moves were created, on the connection of the moves' transaction
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload',
+                [self.channel, [json.dumps(event) for event in events]]
+            )
+
+    def get_channel(self) -> Optional[str]:
+        return self.channel
+
+    def start(self) -> None:
+        """Start the listener threads and wait for them to listen, so no move committed after this returns is missed."""
+        with self._lock:
+            for using in settings.SHARD_DATABASES:
+                if using not in self._threads:
+                    self._listening[using] = threading.Event()
+                    self._threads[using] = threading.Thread(target=self.listen, args=(using,), name='events-listener-' + using, daemon=True)
+                    self._threads[using].start()
+            listening = list(self._listening.values())
+        for event in listening:
+            event.wait(self.POLL_INTERVAL)
+
+    def stop(self) -> None:
+        """Stop the listener threads, waiting for them to close their connections."""
+        with self._lock:
+            self._stopping.set()
+            for thread in self._threads.values():
+                thread.join()
+            self._threads.clear()
+            self._listening.clear()
+            self._stopping.clear()
+
+    def listen(self, using: str) -> None:
+        """Deliver the notifications of the channel on a database to the broker, reconnecting when the connection is lost."""
+        listening = self._listening[using]
+        while not self._stopping.is_set():
+            listener = None
+            try:
+                # a connection of its own, outside of django's connection handling, which stays idle between notifications
+                listener = psycopg2.connect(**connections[using].get_connection_params())
+                listener.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with listener.cursor() as cursor:
+                    cursor.execute('LISTEN ' + self.channel)
+                if listening.is_set():
+                    # notifications sent while reconnecting were lost
+                    broker.close_all()
+                listening.set()
+                while not self._stopping.is_set():
+                    if select.select([listener], [], [], self.POLL_INTERVAL) == ([], [], []):
+                        # an idle connection's failure is only noticed by using it
+                        with listener.cursor() as cursor:
+                            cursor.execute('SELECT 1')
+                        continue
+                    listener.poll()
+                    while listener.notifies:
+                        event = json.loads(listener.notifies.pop(0).payload)
+                        broker.publish(event['game'], event)
+            except psycopg2.Error:
+                logger.exception('Events listener lost its connection, reconnecting')
+                self._stopping.wait(self.RECONNECT_DELAY)
+            finally:
+                if listener is not None:
+                    listener.close()
+
+
+_notifier: Optional[Notifier] = None
+
+
+def get_notifier() -> Notifier:
+    """Return this process's notifier, the class named by the EVENTS_NOTIFIER setting."""
+    global _notifier
+    if _notifier is None:
+        _notifier = import_string(settings.EVENTS_NOTIFIER)()
+    return _notifier
+
+
+def publish_moves(game: Game, moves: List[Move]) -> None:
+    """Publish the events of moves just created, the last of them being the game's moves_played move."""
+    first = game.moves_played - len(moves) + 1
+    get_notifier().publish([move.get_event(number) for number, move in enumerate(moves, first)], router.db_for_write(Move))
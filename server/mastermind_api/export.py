@@ -0,0 +1,131 @@
+from asgiref.sync import sync_to_async
+from django.db.models import QuerySet
+from mastermind_api.models import Game, Move
+from mastermind_api import scoring
+from typing import AsyncIterator, Dict, Generator, Iterator, List, Optional
+import csv
+import itertools
+import json
+
+
+
+# the rows fetched from the database's server-side cursor at a time
+CHUNK_SIZE = 2000
+GAME_FIELDS = ['id', 'codebreaker', 'mode', 'number_of_moves', 'number_of_holes', 'number_of_colors', 'code', 'moves_played', 'status']
+MOVE_FIELDS = ['id', 'game', 'codebreaker', 'code', 'blacks', 'whites']
+
+
+def unpack_code(packed_code: int, number_of_holes: int, number_of_colors: int) -> List:
+    """Return the color names of a packed code, like Game.unpack_code without a game."""
+    return [Game.COLOR_CHOICES[index] for index in scoring.unpack_codes(packed_code, number_of_holes, number_of_colors)]
+
+
+def filter_ids(queryset: QuerySet, min_id: Optional[int], max_id: Optional[int]) -> QuerySet:
+    """Return the queryset ordered by id and limited to an inclusive id range."""
+    if min_id is not None:
+        queryset = queryset.filter(id__gte=min_id)
+    if max_id is not None:
+        queryset = queryset.filter(id__lte=max_id)
+    return queryset.order_by('id')
+
+
+def game_rows(min_id: Optional[int] = None, max_id: Optional[int] = None, user: Optional[int] = None, using: Optional[str] = None) -> Iterator[Dict]:
+    """Yield every game of a database, or the one chosen by the routers, as a dict of GAME_FIELDS, fetching them in chunks from a server-side cursor."""
+    games = filter_ids(Game.objects.using(using), min_id, max_id)
+    if user is not None:
+        games = games.filter(codebreaker_id=user)
+    modes = dict(Game.MODE_CHOICES)
+    statuses = dict(Game.STATUS_CHOICES)
+    columns = ('id', 'codebreaker_id', 'mode', 'number_of_moves', 'number_of_holes', 'number_of_colors', 'packed_code', 'moves_played', 'status')
+    # plain tuples rather than model instances, read from the cursor a chunk at a time
+    for game_id, codebreaker, mode, moves, holes, colors, packed_code, moves_played, status in games.values_list(*columns).iterator(chunk_size=CHUNK_SIZE):
+        yield {
+            'id': game_id,
+            'codebreaker': codebreaker,
+            'mode': modes[mode],
+            'number_of_moves': moves,
+            'number_of_holes': holes,
+            'number_of_colors': colors,
+            'code': unpack_code(packed_code, holes, colors),
+            'moves_played': moves_played,
+            'status': statuses[status]
+        }
+
+
+def move_rows(min_id: Optional[int] = None, max_id: Optional[int] = None, user: Optional[int] = None, using: Optional[str] = None) -> Iterator[Dict]:
+    """Yield every move of a database, or the one chosen by the routers, as a dict of MOVE_FIELDS, fetching them with their game's configuration in chunks.
+
+    The moves of games storing them inline follow the Move rows, game by game, with a null id.
+    """
+    moves = filter_ids(Move.objects.using(using), min_id, max_id)
+    if user is not None:
+        moves = moves.filter(game__codebreaker_id=user)
+    columns = ('id', 'game_id', 'game__codebreaker_id', 'packed_code', 'blacks', 'whites', 'game__number_of_holes', 'game__number_of_colors')
+    for move_id, game_id, codebreaker, packed_code, blacks, whites, holes, colors in moves.values_list(*columns).iterator(chunk_size=CHUNK_SIZE):
+        yield {
+            'id': move_id,
+            'game': game_id,
+            'codebreaker': codebreaker,
+            'code': unpack_code(packed_code, holes, colors),
+            'blacks': blacks,
+            'whites': whites
+        }
+    # inline moves have no ids, so they're only in exports without an id range
+    if min_id is not None or max_id is not None:
+        return
+    games = Game.objects.using(using).filter(inline_moves__isnull=False).order_by('id')
+    if user is not None:
+        games = games.filter(codebreaker_id=user)
+    columns = ('id', 'codebreaker_id', 'number_of_holes', 'number_of_colors', 'inline_moves')
+    for game_id, codebreaker, holes, colors, inline_moves in games.values_list(*columns).iterator(chunk_size=CHUNK_SIZE):
+        for value in inline_moves:
+            packed_code, blacks, whites = Game.decode_move(value, holes)
+            yield {
+                'id': None,
+                'game': game_id,
+                'codebreaker': codebreaker,
+                'code': unpack_code(packed_code, holes, colors),
+                'blacks': blacks,
+                'whites': whites
+            }
+
+
+def ndjson_lines(rows: Iterator[Dict]) -> Iterator[str]:
+    """Yield each row as a line of JSON."""
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+
+async def async_lines(lines: Generator[str, None, None]) -> AsyncIterator[str]:
+    """Yield the lines of a generator CHUNK_SIZE lines at a time, each chunk read on the request's sync thread.
+
+    Under ASGI django reads a sync iterator into a list before sending any of it, which would hold the whole export in memory,
+        the chunks are read on the same thread so the database cursor is always used from the thread that opened it.
+    """
+    read_chunk = sync_to_async(lambda: ''.join(itertools.islice(lines, CHUNK_SIZE)))
+    try:
+        while True:
+            chunk = await read_chunk()
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        # closes the cursor when the client disconnected before the end
+        await sync_to_async(lines.close)()
+
+
+
+class Echo:
+    """File-like object returning what's written to it, so the csv module's lines can be yielded instead of buffered."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def csv_lines(rows: Iterator[Dict], fields: List) -> Iterator[str]:
+    """Yield a header line then each row as a CSV line, with codes written as space separated color names."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([' '.join(row[field]) if field == 'code' else row[field] for field in fields])
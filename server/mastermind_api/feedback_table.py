@@ -0,0 +1,85 @@
+from django.conf import settings
+from mastermind_api import scoring
+from typing import Dict, Optional, Tuple
+import numpy as np
+import os
+
+
+
+# memory-mapped tables already opened by this process, keyed by (number_of_holes, number_of_colors),
+    # only tables found on disk are kept so a table built after the process started is picked up by its next lookup
+_tables: Dict[Tuple[int, int], np.ndarray] = {}
+
+
+def encode_feedback(blacks: np.ndarray, whites: np.ndarray, number_of_holes: int) -> np.ndarray:
+    """Return the blacks and whites of a move packed into a single byte."""
+    return (np.asarray(blacks) * (number_of_holes + 1) + np.asarray(whites)).astype(np.uint8)
+
+
+def decode_feedback(feedback: np.ndarray, number_of_holes: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the blacks and whites packed into feedback bytes."""
+    return np.divmod(np.asarray(feedback, dtype=np.intp), number_of_holes + 1)
+
+
+def table_path(number_of_holes: int, number_of_colors: int) -> str:
+    """Return the path of the feedback table file for a game configuration."""
+    return os.path.join(settings.FEEDBACK_TABLE_DIR, 'feedback_{}x{}.npy'.format(number_of_holes, number_of_colors))
+
+
+def table_bytes(number_of_holes: int, number_of_colors: int) -> int:
+    """Return the size in bytes of the feedback table of a game configuration, one byte per (secret, guess) pair."""
+    return (number_of_colors ** number_of_holes) ** 2
+
+
+def build_table(number_of_holes: int, number_of_colors: int, rows_per_chunk: int = 64) -> np.ndarray:
+    """Return the feedback of every guess (columns) against every secret (rows), both indexed by their packed code.
+
+    Raises a ValueError for configurations whose table is larger than the FEEDBACK_TABLE_MAX_BYTES setting.
+    """
+    if table_bytes(number_of_holes, number_of_colors) > settings.FEEDBACK_TABLE_MAX_BYTES:
+        raise ValueError('The {}x{} feedback table would take {} bytes, more than FEEDBACK_TABLE_MAX_BYTES ({}).'.format(
+            number_of_holes, number_of_colors, table_bytes(number_of_holes, number_of_colors), settings.FEEDBACK_TABLE_MAX_BYTES
+        ))
+    size = number_of_colors ** number_of_holes
+    codes = scoring.unpack_codes(np.arange(size), number_of_holes, number_of_colors)
+    table = np.empty((size, size), dtype=np.uint8)
+    # score the secrets in chunks of rows so the histograms stay small for larger configurations
+    for start in range(0, size, rows_per_chunk):
+        secrets = codes[start:start + rows_per_chunk]
+        blacks, whites = scoring.score(np.repeat(secrets, size, axis=0), np.tile(codes, (len(secrets), 1)), number_of_colors)
+        table[start:start + len(secrets)] = encode_feedback(blacks, whites, number_of_holes).reshape(len(secrets), size)
+    return table
+
+
+def get_table(number_of_holes: int, number_of_colors: int) -> Optional[np.ndarray]:
+    """Return the read-only memory-mapped feedback table for a game configuration, or None if it hasn't been built.
+
+    The file is mapped rather than read, so every worker process shares the same physical pages through the page cache.
+    """
+    key = (number_of_holes, number_of_colors)
+    if key not in _tables:
+        path = table_path(number_of_holes, number_of_colors)
+        if not os.path.exists(path):
+            return None
+        _tables[key] = np.load(path, mmap_mode='r')
+    return _tables[key]
+
+
+def lookup(secrets: np.ndarray, guesses: np.ndarray, number_of_holes: int, number_of_colors: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Return the blacks and whites of each (secret, guess) pair of color indices from the feedback table, or None if there's no table.
+
+    Like scoring.score, a single code is broadcast against the other array.
+    """
+    table = get_table(number_of_holes, number_of_colors)
+    if table is None:
+        return None
+    feedback = table[scoring.pack_codes(secrets, number_of_colors), scoring.pack_codes(guesses, number_of_colors)]
+    return decode_feedback(feedback, number_of_holes)
+
+
+def score(secrets: np.ndarray, guesses: np.ndarray, number_of_holes: int, number_of_colors: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the blacks and whites of each (secret, guess) pair of color indices, from the feedback table if there is one."""
+    counts = lookup(secrets, guesses, number_of_holes, number_of_colors)
+    if counts is None:
+        counts = scoring.score(secrets, guesses, number_of_colors)
+    return counts
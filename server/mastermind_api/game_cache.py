@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router, transaction
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from mastermind_api.models import Game
+from typing import Dict, Optional
+
+
+
+# the fields of a game kept in the cache, every field but its candidate codes which can be large,
+    # whether it has candidate codes is kept instead, see has_candidates
+FIELDS = [field.attname for field in Game._meta.concrete_fields if field.attname != 'candidates']
+
+
+def cache_key(game_id: int) -> str:
+    """Return the cache key of a game's state, game ids being unique across shards."""
+    return 'game-state:{}'.format(game_id)
+
+
+def get_cache():
+    """Return the cache holding the games' states, see the GAME_STATE_CACHE setting."""
+    return caches[settings.GAME_STATE_CACHE]
+
+
+def get_game(game_id: int) -> Optional[Game]:
+    """Return a game with its candidate codes deferred, from the cache or else from its database, None if it doesn't exist.
+
+    A cached game may be stale when the cache isn't shared by every process, moves are claimed on the game's
+        moves played so a stale game's claim fails and reads its current state, see Game.record_move.
+    """
+    state = get_cache().get(cache_key(game_id))
+    if state is None:
+        # games are only cached by writes, once they're committed
+        return Game.objects.defer('candidates').annotate(
+            has_candidates=ExpressionWrapper(Q(candidates__isnull=False), output_field=BooleanField())
+        ).filter(pk=game_id).first()
+    game = Game.from_db(router.db_for_read(Game), FIELDS, [state[field] for field in FIELDS])
+    game.has_candidates = state['has_candidates']
+    return game
+
+
+def has_candidates(game: Game) -> bool:
+    """Return whether a hint has been asked for the game, so its candidate codes are kept, without reading them when they're deferred."""
+    if 'candidates' in game.get_deferred_fields():
+        return game.has_candidates
+    return game.candidates is not None
+
+
+def get_state(game: Game) -> Dict:
+    """Return the cached state of a game."""
+    state = dict((field, getattr(game, field)) for field in FIELDS)
+    state['has_candidates'] = has_candidates(game)
+    return state
+
+
+def store(game: Game) -> None:
+    """Cache a game's state once the transaction writing it on its database commits, or evict it if the game is over.
+
+    Games that are over can't change anymore, so they aren't kept.
+    """
+    key = cache_key(game.pk)
+    if game.status != Game.STATUS_IN_PROGRESS:
+        transaction.on_commit(lambda: get_cache().delete(key), using=game._state.db)
+        return
+    state = get_state(game)
+    transaction.on_commit(lambda: get_cache().set(key, state, settings.GAME_STATE_CACHE_TTL), using=game._state.db)
+
+
+def evict(game_id: int) -> None:
+    """Remove a game's state from the cache."""
+    get_cache().delete(cache_key(game_id))
@@ -0,0 +1,149 @@
+from django.core.management.base import BaseCommand, CommandError
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+import http.client
+import json
+import numpy as np
+import random
+import threading
+import time
+import uuid
+
+
+
+class Client:
+    """A player keeping one HTTP connection to the server, recording the latency of each request by endpoint."""
+
+    def __init__(self, url: str, timeout: float) -> None:
+        parts = urlsplit(url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(parts.hostname, parts.port, timeout=timeout)
+        self.prefix = parts.path.rstrip('/')
+        self.token: Optional[str] = None
+        # endpoint to the seconds each of its requests took, and to the number of failed requests
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def request(self, endpoint: str, method: str, path: str, body: Optional[Dict] = None) -> Tuple[int, Optional[Dict]]:
+        """Send a request and return its status code and JSON body, reconnecting on the next request after a connection error.
+
+        Connection errors, server errors and bodies which aren't JSON are counted as the endpoint's errors, returned with a None body.
+        """
+        headers = {'Content-Type': 'application/json'}
+        if self.token is not None:
+            headers['Authorization'] = 'Token ' + self.token
+        start = time.perf_counter()
+        try:
+            self.connection.request(method, self.prefix + path, json.dumps(body) if body is not None else None, headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            return 0, None
+        self.latencies.setdefault(endpoint, []).append(time.perf_counter() - start)
+        try:
+            data = json.loads(content) if content else None
+        except ValueError:
+            data = None
+        if response.status >= 500 or (content and data is None):
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            return response.status, None
+        return response.status, data
+
+    def register(self) -> None:
+        """Register a new user to play as."""
+        name = 'load-' + uuid.uuid4().hex[:16]
+        status, data = self.request('register', 'POST', '/users/register/', {
+            'username': name, 'email': name + '@test.com', 'password': uuid.uuid4().hex
+        })
+        if status != 201 or data is None:
+            raise CommandError('Registering a user failed with status {}.'.format(status))
+        self.token = data['token']
+
+    def play(self, deadline: float, rng: random.Random) -> None:
+        """Play games with random guesses until the deadline, getting the game's details after each move like a polling client."""
+        while time.perf_counter() < deadline:
+            status, game = self.request('create game', 'POST', '/api/games/', {})
+            if status != 201 or game is None:
+                continue
+            playing = True
+            while playing and time.perf_counter() < deadline:
+                code = [rng.choice(game['color_choices']) for _ in range(game['number_of_holes'])]
+                status, _ = self.request('create move', 'POST', '/api/moves/', {'game': game['id'], 'code': code})
+                if status != 201:
+                    break
+                status, details = self.request('game details', 'GET', '/api/games/{}/'.format(game['id']))
+                playing = status == 200 and details is not None and details['status'] == 'in_progress'
+
+
+
+class Command(BaseCommand):
+    """Command to measure the throughput and latency a running server sustains under concurrent players."""
+
+    help = (
+        'Play games against running servers with many concurrent clients, each keeping its connection, '
+        'and report the requests per second and latency percentiles of creating games, creating moves and getting games.'
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            '--url', nargs='+', default=['http://localhost:8000'],
+            help='Servers to benchmark one after the other, e.g. the ASGI and WSGI servers of the same machine.'
+        )
+        parser.add_argument('--clients', type=int, default=50, help='Players sending requests at the same time.')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds each server is benchmarked for.')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds before a request is counted as failed.')
+        parser.add_argument('--seed', type=int, default=None, help='Seed for the guesses.')
+
+    def handle(self, *args, **options) -> None:
+        if options['clients'] < 1 or options['duration'] <= 0 or options['timeout'] <= 0:
+            raise CommandError('Clients, duration and timeout must be positive.')
+        self.stdout.write('{:<32} {:<14} {:>9} {:>8} {:>9} {:>9} {:>9} {:>7}'.format(
+            'server', 'endpoint', 'requests', 'rps', 'p50 ms', 'p99 ms', 'max ms', 'errors'
+        ))
+        for url in options['url']:
+            clients, seconds = self.run(url, options)
+            self.report(url, clients, seconds)
+
+    def run(self, url: str, options: Dict) -> Tuple[List[Client], float]:
+        """Register the clients, then let them all play until the duration is up, return them with the seconds they played for."""
+        clients = [Client(url, options['timeout']) for _ in range(options['clients'])]
+        for client in clients:
+            client.register()
+            # only the games are measured, on new connections as servers close idle ones
+            client.latencies.clear()
+            client.connection.close()
+        seed = random.Random(options['seed'])
+        barrier = threading.Barrier(len(clients) + 1)
+        deadline: List[float] = []
+
+        def play(client: Client, rng: random.Random) -> None:
+            barrier.wait()
+            try:
+                client.play(deadline[0], rng)
+            finally:
+                client.connection.close()
+
+        threads = [threading.Thread(target=play, args=(client, random.Random(seed.random()))) for client in clients]
+        for thread in threads:
+            thread.start()
+        start = time.perf_counter()
+        deadline.append(start + options['duration'])
+        barrier.wait()
+        for thread in threads:
+            thread.join()
+        return clients, time.perf_counter() - start
+
+    def report(self, url: str, clients: List[Client], seconds: float) -> None:
+        """Write each endpoint's requests, throughput, latency percentiles and errors, then the totals over every endpoint."""
+        endpoints = ['create game', 'create move', 'game details']
+        rows = [(endpoint, [latency for client in clients for latency in client.latencies.get(endpoint, [])],
+                 sum(client.errors.get(endpoint, 0) for client in clients)) for endpoint in endpoints]
+        rows.append(('total', [latency for _, latencies, _ in rows for latency in latencies], sum(errors for _, _, errors in rows)))
+        for endpoint, latencies, errors in rows:
+            milliseconds = np.array(latencies) * 1000 if latencies else np.zeros(1)
+            self.stdout.write('{:<32} {:<14} {:>9} {:>8.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>7}'.format(
+                url, endpoint, len(latencies), len(latencies) / seconds,
+                np.percentile(milliseconds, 50), np.percentile(milliseconds, 99), milliseconds.max(), errors
+            ))
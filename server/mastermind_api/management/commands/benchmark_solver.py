@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from mastermind_api import solver
+from mastermind_api.models import Game
+import numpy as np
+import time
+
+
+
+class Command(BaseCommand):
+    """Command to measure how many guesses and how much time the solver takes to win games of each variant."""
+
+    help = 'Play games against random codes with the solver and report the average guesses and wall time per game for each variant.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            '--variants', nargs='+', default=['4x6'],
+            help='Variants to play as HOLESxCOLORS, for example 4x6 5x8.'
+        )
+        parser.add_argument('--games', type=int, default=20, help='Games played per variant.')
+        parser.add_argument('--moves', type=int, default=Game.MAX_NUMBER_OF_MOVES, help='Moves allowed per game.')
+        parser.add_argument('--strategy', choices=solver.STRATEGIES, default=solver.MINIMAX)
+        parser.add_argument('--budget', type=float, default=settings.SOLVER_MOVE_BUDGET, help='Seconds each move may spend searching.')
+        parser.add_argument('--seed', type=int, default=None, help='Seed for the random codes and the solver\'s sampling.')
+
+    def handle(self, *args, **options) -> None:
+        if options['games'] < 1 or options['moves'] < 1:
+            raise CommandError('At least one game and one move per game are required.')
+        variants = []
+        for variant in options['variants']:
+            try:
+                number_of_holes, number_of_colors = (int(value) for value in variant.lower().split('x'))
+            except ValueError:
+                raise CommandError('Variant must be given as HOLESxCOLORS, got ' + variant)
+            if number_of_colors ** number_of_holes > Game.MAX_CANDIDATES:
+                raise CommandError('The solver only plays variants with at most {} possible codes, got {}'.format(Game.MAX_CANDIDATES, variant))
+            variants.append((number_of_holes, number_of_colors))
+        rng = np.random.default_rng(options['seed'])
+        pool = solver.get_pool()
+        self.stdout.write('{:>8} {:>6} {:>6} {:>9} {:>7} {:>10}'.format('variant', 'games', 'won', 'guesses', 'worst', 'seconds'))
+        for number_of_holes, number_of_colors in variants:
+            secrets = rng.integers(number_of_colors ** number_of_holes, size=options['games'])
+            guesses = []
+            won = 0
+            start = time.perf_counter()
+            for secret in secrets:
+                moves = solver.play(
+                    int(secret), number_of_holes, number_of_colors, options['moves'],
+                    options['strategy'], options['budget'], pool, rng
+                )
+                guesses.append(len(moves))
+                won += moves[-1][1] == number_of_holes
+            seconds = (time.perf_counter() - start) / len(secrets)
+            self.stdout.write('{:>8} {:>6} {:>6} {:>9.3f} {:>7} {:>10.3f}'.format(
+                '{}x{}'.format(number_of_holes, number_of_colors), len(secrets), won, np.mean(guesses), max(guesses), seconds
+            ))
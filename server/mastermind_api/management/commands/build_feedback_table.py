@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from mastermind_api import feedback_table
+from mastermind_api.models import Game
+import numpy as np
+import os
+
+
+
+class Command(BaseCommand):
+    """Command to precompute the feedback of every (secret, guess) pair for a game configuration."""
+
+    help = 'Build the memory-mapped feedback table used to score moves with a lookup.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--holes', type=int, default=Game.NUMBER_OF_HOLES)
+        parser.add_argument('--colors', type=int, default=len(Game.CODE_COLOR_CHOICES))
+        parser.add_argument('--force', action='store_true', help='Rebuild the table even if it already exists.')
+
+    def handle(self, *args, **options) -> None:
+        path = feedback_table.table_path(options['holes'], options['colors'])
+        if os.path.exists(path) and not options['force']:
+            self.stdout.write('Feedback table already exists at ' + path)
+            return
+        if feedback_table.table_bytes(options['holes'], options['colors']) > settings.FEEDBACK_TABLE_MAX_BYTES:
+            raise CommandError('The {}x{} feedback table would take {} bytes, more than FEEDBACK_TABLE_MAX_BYTES ({}).'.format(
+                options['holes'], options['colors'], feedback_table.table_bytes(options['holes'], options['colors']), settings.FEEDBACK_TABLE_MAX_BYTES
+            ))
+        table = feedback_table.build_table(options['holes'], options['colors'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first so running workers never map a partially written table
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'wb') as file:
+            np.save(file, table)
+        os.replace(temporary_path, path)
+        self.stdout.write(self.style.SUCCESS('Wrote {}x{} feedback table to {}'.format(table.shape[0], table.shape[1], path)))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from mastermind_api import opening_book, solver
+from mastermind_api.models import Game
+import os
+
+
+
+class Command(BaseCommand):
+    """Command to precompute the solver's guesses for the first moves of a game configuration."""
+
+    help = 'Build the opening book of the best guess for each feedback path of the first moves, used by hints and games the server plays.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--holes', type=int, default=Game.NUMBER_OF_HOLES)
+        parser.add_argument('--colors', type=int, default=len(Game.CODE_COLOR_CHOICES))
+        parser.add_argument('--depth', type=int, default=3, help='Number of moves the book covers.')
+        parser.add_argument('--strategy', choices=solver.STRATEGIES, default=solver.MINIMAX)
+        parser.add_argument('--force', action='store_true', help='Rebuild the book even if it already exists.')
+
+    def handle(self, *args, **options) -> None:
+        if options['colors'] ** options['holes'] > Game.MAX_CANDIDATES:
+            raise CommandError('Opening books are only built for configurations with at most {} possible codes.'.format(Game.MAX_CANDIDATES))
+        if options['depth'] < 1:
+            raise CommandError('The book must cover at least one move.')
+        path = opening_book.book_path(options['holes'], options['colors'], options['strategy'])
+        if os.path.exists(path) and not options['force']:
+            self.stdout.write('Opening book already exists at ' + path)
+            return
+        book = solver.build_opening_book(options['holes'], options['colors'], options['depth'], options['strategy'], solver.get_pool())
+        opening_book.save_book(book, path)
+        self.stdout.write(self.style.SUCCESS('Wrote opening book of {} guesses to {}'.format(len(book.keys), path)))
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router, transaction
+from mastermind_api import sharding
+from mastermind_api.models import Game, Move
+from typing import Dict, List, Optional, Tuple
+
+
+
+class Command(BaseCommand):
+    """Command to convert finished games between storing their moves as Move rows and inline on the game's row."""
+
+    help = 'Convert the moves of finished games to Move rows or to an array on their game, a batch of games at a time.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--to', required=True, choices=(Game.MOVE_STORAGE_INLINE, Game.MOVE_STORAGE_ROWS), help='The storage to convert the games to.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Games converted per transaction.')
+
+    def handle(self, *args, **options) -> None:
+        if options['batch_size'] < 1:
+            raise CommandError('Batch size must be positive.')
+        # games in progress are left alone, so no move can be played on a game while it's converted,
+            # they're stored according to GAME_MOVE_STORAGE when they were created
+        for shard in sharding.shards():
+            converted = moves = 0
+            last_id = 0
+            while last_id is not None:
+                batch_games, batch_moves, last_id = self.convert_batch(shard, options['to'], last_id, options['batch_size'])
+                converted += batch_games
+                moves += batch_moves
+                if batch_games and options['verbosity'] > 1:
+                    self.stderr.write('{} games converted on {}'.format(converted, shard or 'the default database'))
+            self.stdout.write(self.style.SUCCESS('Converted {} games with {} moves to {} on {}'.format(
+                converted, moves, options['to'], shard or 'the default database'
+            )))
+
+    def convert_batch(self, shard: Optional[str], to: str, last_id: int, batch_size: int) -> Tuple[int, int, Optional[int]]:
+        """Convert the next batch of finished games after last_id on a shard, return the numbers of games and moves converted and the last id, None when done."""
+        with transaction.atomic(using=shard or router.db_for_write(Game)):
+            games = Game.objects.using(shard).select_for_update().exclude(status=Game.STATUS_IN_PROGRESS).filter(
+                pk__gt=last_id, inline_moves__isnull=(to == Game.MOVE_STORAGE_INLINE)
+            ).order_by('id')
+            games = list(games[:batch_size])
+            if not games:
+                return 0, 0, None
+            game_ids = [game.pk for game in games]
+            if to == Game.MOVE_STORAGE_INLINE:
+                rows: Dict[int, List[int]] = dict((game.pk, []) for game in games)
+                holes = dict((game.pk, game.number_of_holes) for game in games)
+                moves = Move.objects.using(shard).filter(game_id__in=game_ids).order_by('id')
+                count = 0
+                for game_id, packed_code, blacks, whites in moves.values_list('game_id', 'packed_code', 'blacks', 'whites'):
+                    rows[game_id].append(Game.encode_move(packed_code, blacks, whites, holes[game_id]))
+                    count += 1
+                for game in games:
+                    game.inline_moves = rows[game.pk]
+                Game.objects.using(shard).bulk_update(games, ['inline_moves'])
+                Move.objects.using(shard).filter(game_id__in=game_ids).delete()
+            else:
+                moves = [move for game in games for move in game.get_moves()]
+                count = len(moves)
+                Move.objects.using(shard).bulk_create(moves)
+                for game in games:
+                    game.inline_moves = None
+                Game.objects.using(shard).bulk_update(games, ['inline_moves'])
+        return len(games), count, game_ids[-1]
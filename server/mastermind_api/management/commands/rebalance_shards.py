@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from mastermind_api import sharding
+from mastermind_api.models import Game, PlayerStats
+from typing import Dict, List
+
+
+
+class Command(BaseCommand):
+    """Command to move users' games, moves and stats to the shard they're placed on, e.g. after adding a shard."""
+
+    help = 'Move every user whose rows are on another shard than their placement to it, a batch of users at a time.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--batch-size', type=int, default=100, help='Users moved per transaction.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many users would move between each pair of shards.')
+
+    def handle(self, *args, **options) -> None:
+        if not sharding.is_sharded():
+            raise CommandError('Games are only rebalanced across several shards, see the SHARD_DATABASES setting.')
+        if options['batch_size'] < 1:
+            raise CommandError('Batch size must be positive.')
+        for source in settings.SHARD_DATABASES:
+            # the users with rows on the source, grouped by the shard they belong on
+            user_ids = set(Game.objects.using(source).order_by().values_list('codebreaker_id', flat=True).distinct())
+            user_ids.update(PlayerStats.objects.using(source).values_list('user_id', flat=True))
+            targets: Dict[str, List[int]] = {}
+            for user_id in sorted(user_ids):
+                target = sharding.placement(user_id)
+                if target != source:
+                    targets.setdefault(target, []).append(user_id)
+            for target, users in targets.items():
+                if options['dry_run']:
+                    self.stdout.write('Would move {} users from {} to {}'.format(len(users), source, target))
+                    continue
+                games = moves = 0
+                for start in range(0, len(users), options['batch_size']):
+                    batch_games, batch_moves = sharding.move_users(users[start:start + options['batch_size']], source, target)
+                    games += batch_games
+                    moves += batch_moves
+                    if options['verbosity'] > 1:
+                        self.stderr.write('{}/{} users moved from {} to {}'.format(min(start + options['batch_size'], len(users)), len(users), source, target))
+                self.stdout.write(self.style.SUCCESS('Moved {} users with {} games and {} moves from {} to {}'.format(
+                    len(users), games, moves, source, target
+                )))
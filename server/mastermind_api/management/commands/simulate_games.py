@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand, CommandError
+from mastermind_api import simulation
+from mastermind_api.models import Game
+from multiprocessing import Pool
+from typing import Dict
+import numpy as np
+import os
+import time
+
+
+
+class Command(BaseCommand):
+    """Command to play many games in memory with each guessing strategy and compare them, without HTTP or the database."""
+
+    help = 'Simulate games against random codes across a process pool and report the moves needed to win and the throughput per strategy.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--games', type=int, default=10000, help='Games played per strategy.')
+        parser.add_argument(
+            '--strategies', nargs='+', choices=sorted(simulation.STRATEGIES), default=['first', 'random'],
+            help='Guessing strategies to compare.'
+        )
+        parser.add_argument('--holes', type=int, default=Game.NUMBER_OF_HOLES)
+        parser.add_argument('--colors', type=int, default=len(Game.CODE_COLOR_CHOICES))
+        parser.add_argument('--moves', type=int, default=Game.NUMBER_OF_MOVES, help='Moves allowed per game.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Processes playing games.')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Games played per task sent to a worker.')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options) -> None:
+        if options['colors'] ** options['holes'] > Game.MAX_CANDIDATES:
+            raise CommandError('Games can only be simulated for configurations with at most {} possible codes.'.format(Game.MAX_CANDIDATES))
+        if options['games'] < 1 or options['moves'] < 1 or options['workers'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('Games, moves, workers and chunk size must be positive.')
+        # split each strategy's games into chunks with their own seeds
+        seeds = iter(np.random.SeedSequence(options['seed']).generate_state(
+            len(options['strategies']) * (options['games'] // options['chunk_size'] + 1), dtype=np.uint32
+        ))
+        tasks = []
+        for name in options['strategies']:
+            for start in range(0, options['games'], options['chunk_size']):
+                games = min(options['chunk_size'], options['games'] - start)
+                tasks.append((name, games, options['holes'], options['colors'], options['moves'], int(next(seeds))))
+        # strategy name to how many games were won in each number of moves, index 0 holding the games lost
+        counts: Dict[str, np.ndarray] = {name: np.zeros(options['moves'] + 1, dtype=np.int64) for name in options['strategies']}
+        # the strategies play their chunks side by side, so each one's throughput is measured over the whole run
+        start = time.perf_counter()
+        with Pool(options['workers']) as pool:
+            for done, (name, chunk_counts) in enumerate(pool.imap_unordered(simulation.simulate_chunk, tasks), 1):
+                counts[name] += chunk_counts
+                if options['verbosity'] > 1:
+                    self.stderr.write('{}/{} chunks played'.format(done, len(tasks)))
+        seconds = time.perf_counter() - start
+        self.report(counts, seconds, options)
+
+    def report(self, counts: Dict[str, np.ndarray], seconds: float, options: Dict) -> None:
+        """Write the distribution of moves to win and the summary of each strategy."""
+        games = sum(int(strategy_counts.sum()) for strategy_counts in counts.values())
+        self.stdout.write('{}x{} with {} moves, {} games in {:.2f} seconds, {:.0f} games per second across {} workers'.format(
+            options['holes'], options['colors'], options['moves'], games, seconds, games / seconds, options['workers']
+        ))
+        self.stdout.write('')
+        self.stdout.write('{:>6} '.format('moves') + ' '.join('{:>14}'.format(name) for name in counts))
+        for moves in list(range(1, options['moves'] + 1)) + [0]:
+            self.stdout.write('{:>6} '.format(moves or 'lost') + ' '.join('{:>14}'.format(int(strategy_counts[moves])) for strategy_counts in counts.values()))
+        self.stdout.write('')
+        self.stdout.write('{:>14} {:>10} {:>8} {:>10} {:>6}'.format('strategy', 'games', 'won %', 'average', 'worst'))
+        moves_to_win = np.arange(options['moves'] + 1)
+        for name, strategy_counts in counts.items():
+            won = int(strategy_counts[1:].sum())
+            average = (strategy_counts * moves_to_win).sum() / won if won else float('nan')
+            worst = int(np.flatnonzero(strategy_counts[1:])[-1]) + 1 if won else 0
+            self.stdout.write('{:>14} {:>10} {:>8.2f} {:>10.3f} {:>6}'.format(
+                name, int(strategy_counts.sum()), 100 * won / strategy_counts.sum(), average, worst
+            ))
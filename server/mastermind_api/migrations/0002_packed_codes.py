@@ -0,0 +1,50 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:33
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mastermind_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='packed_code',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='move',
+            name='packed_code',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='move',
+            name='blacks',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='move',
+            name='whites',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        # the json columns are made nullable so they can be re-added empty when reversing 0004_remove_json_codes
+        migrations.AlterField(
+            model_name='game',
+            name='code',
+            field=django.contrib.postgres.fields.jsonb.JSONField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='move',
+            name='code',
+            field=django.contrib.postgres.fields.jsonb.JSONField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='move',
+            name='result',
+            field=django.contrib.postgres.fields.jsonb.JSONField(null=True),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:33
+
+from django.db import migrations
+
+
+# the color choices and number of holes at the time of this migration,
+    # copied here because historical models don't have the model's class attributes
+CODE_COLOR_CHOICES = ['red', 'orange', 'yellow', 'green', 'blue', 'purple']
+NUMBER_OF_HOLES = 4
+BATCH_SIZE = 2000
+
+
+def pack_code(code: list) -> int:
+    """Return a code of color names packed into a base len(CODE_COLOR_CHOICES) integer."""
+    packed_code = 0
+    for color in code:
+        packed_code = packed_code * len(CODE_COLOR_CHOICES) + CODE_COLOR_CHOICES.index(color)
+    return packed_code
+
+
+def unpack_code(packed_code: int) -> list:
+    """Return the code of color names packed into a base len(CODE_COLOR_CHOICES) integer."""
+    code = []
+    for _ in range(NUMBER_OF_HOLES):
+        packed_code, index = divmod(packed_code, len(CODE_COLOR_CHOICES))
+        code.insert(0, CODE_COLOR_CHOICES[index])
+    return code
+
+
+def update_in_batches(model, queryset, update_row, fields: list) -> None:
+    """Apply update_row to every row of the queryset and save the fields in batches."""
+    batch = []
+    for row in queryset.iterator(chunk_size=BATCH_SIZE):
+        update_row(row)
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            model.objects.using(queryset.db).bulk_update(batch, fields)
+            batch = []
+    if batch:
+        model.objects.using(queryset.db).bulk_update(batch, fields)
+
+
+def pack_json_codes(apps, schema_editor) -> None:
+    """Fill the packed columns from the json color name arrays."""
+    Game = apps.get_model('mastermind_api', 'Game')
+    Move = apps.get_model('mastermind_api', 'Move')
+    database = schema_editor.connection.alias
+
+    def pack_game(game) -> None:
+        game.packed_code = pack_code(game.code)
+
+    def pack_move(move) -> None:
+        move.packed_code = pack_code(move.code)
+        move.blacks = move.result.count('black')
+        move.whites = move.result.count('white')
+
+    update_in_batches(Game, Game.objects.using(database).filter(packed_code__isnull=True).only('id', 'code'), pack_game, ['packed_code'])
+    update_in_batches(Move, Move.objects.using(database).filter(packed_code__isnull=True).only('id', 'code', 'result'), pack_move, ['packed_code', 'blacks', 'whites'])
+
+
+def unpack_json_codes(apps, schema_editor) -> None:
+    """Fill the json color name arrays from the packed columns."""
+    Game = apps.get_model('mastermind_api', 'Game')
+    Move = apps.get_model('mastermind_api', 'Move')
+    database = schema_editor.connection.alias
+
+    def unpack_game(game) -> None:
+        game.code = unpack_code(game.packed_code)
+
+    def unpack_move(move) -> None:
+        move.code = unpack_code(move.packed_code)
+        move.result = ['black'] * move.blacks + ['white'] * move.whites
+
+    update_in_batches(Game, Game.objects.using(database).filter(code__isnull=True).only('id', 'packed_code'), unpack_game, ['code'])
+    update_in_batches(Move, Move.objects.using(database).filter(code__isnull=True).only('id', 'packed_code', 'blacks', 'whites'), unpack_move, ['code', 'result'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mastermind_api', '0002_packed_codes'),
+    ]
+
+    operations = [
+        migrations.RunPython(pack_json_codes, unpack_json_codes),
+    ]
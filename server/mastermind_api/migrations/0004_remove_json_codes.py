@@ -0,0 +1,45 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mastermind_api', '0003_pack_json_codes'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='game',
+            name='code',
+        ),
+        migrations.RemoveField(
+            model_name='move',
+            name='code',
+        ),
+        migrations.RemoveField(
+            model_name='move',
+            name='result',
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='packed_code',
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='move',
+            name='packed_code',
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='move',
+            name='blacks',
+            field=models.PositiveSmallIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='move',
+            name='whites',
+            field=models.PositiveSmallIntegerField(),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mastermind_api', '0004_remove_json_codes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='moves_played',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'in_progress'), (1, 'won'), (2, 'lost')], default=0),
+        ),
+    ]
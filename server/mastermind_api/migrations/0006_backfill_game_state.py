@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:36
+
+from django.db import migrations
+from django.db.models import Count, Exists, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+# the number of holes and statuses at the time of this migration,
+    # copied here because historical models don't have the model's class attributes
+NUMBER_OF_HOLES = 4
+STATUS_IN_PROGRESS = 0
+STATUS_WON = 1
+STATUS_LOST = 2
+
+
+def backfill_game_state(apps, schema_editor) -> None:
+    """Fill the moves played and status of existing games from their moves in a few set based updates."""
+    Game = apps.get_model('mastermind_api', 'Game')
+    Move = apps.get_model('mastermind_api', 'Move')
+    database = schema_editor.connection.alias
+    moves_count = Move.objects.filter(game=OuterRef('pk')).order_by().values('game').annotate(count=Count('*')).values('count')
+    Game.objects.using(database).update(moves_played=Coalesce(Subquery(moves_count), 0))
+    winning_move = Move.objects.filter(game=OuterRef('pk'), blacks=NUMBER_OF_HOLES)
+    Game.objects.using(database).filter(Exists(winning_move)).update(status=STATUS_WON)
+    Game.objects.using(database).filter(status=STATUS_IN_PROGRESS, moves_played__gte=F('number_of_moves')).update(status=STATUS_LOST)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mastermind_api', '0005_game_state'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_game_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mastermind_api', '0006_backfill_game_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='number_of_colors',
+            field=models.PositiveSmallIntegerField(default=6),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='number_of_holes',
+            field=models.PositiveSmallIntegerField(default=4),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='packed_code',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='move',
+            name='packed_code',
+            field=models.BigIntegerField(),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mastermind_api', '0007_game_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='candidates',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='candidates_moves',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
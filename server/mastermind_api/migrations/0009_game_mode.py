@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mastermind_api', '0008_game_candidates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='mode',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'codebreaker'), (1, 'codemaker')], default=0),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mastermind_api', '0009_game_mode'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['codebreaker', '-id'], name='game_codebreaker_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['codebreaker', 'status', '-id'], name='game_codebreaker_status_idx'),
+        ),
+        # the composite indexes lead with the codebreaker, so its own index is only dropped once they exist
+        migrations.AlterField(
+            model_name='game',
+            name='codebreaker',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
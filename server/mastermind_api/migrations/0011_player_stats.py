@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:15
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mastermind_api', '0010_game_codebreaker_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('games_played', models.PositiveIntegerField(default=0)),
+                ('games_won', models.PositiveIntegerField(default=0)),
+                ('total_moves_to_win', models.PositiveIntegerField(default=0)),
+                ('moves_to_win_histogram', django.contrib.postgres.fields.ArrayField(base_field=models.PositiveIntegerField(), default=list, size=50)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-games_won', 'total_moves_to_win', 'user'], name='playerstats_leaderboard_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+# the constants at the time of this migration,
+    # copied here because historical models don't have the model's class attributes
+MAX_NUMBER_OF_MOVES = 50
+MODE_CODEBREAKER = 0
+STATUS_IN_PROGRESS = 0
+STATUS_WON = 1
+
+
+def backfill_player_stats(apps, schema_editor) -> None:
+    """Create every user's stats from their finished games, counted by the database per (user, status, moves played)."""
+    Game = apps.get_model('mastermind_api', 'Game')
+    PlayerStats = apps.get_model('mastermind_api', 'PlayerStats')
+    database = schema_editor.connection.alias
+    finished = Game.objects.using(database).filter(mode=MODE_CODEBREAKER).exclude(status=STATUS_IN_PROGRESS).order_by()
+    stats = {}
+    for row in finished.values('codebreaker_id', 'status', 'moves_played').annotate(count=Count('*')).iterator():
+        user_stats = stats.setdefault(row['codebreaker_id'], PlayerStats(
+            user_id=row['codebreaker_id'], moves_to_win_histogram=[0] * MAX_NUMBER_OF_MOVES
+        ))
+        user_stats.games_played += row['count']
+        if row['status'] == STATUS_WON:
+            user_stats.games_won += row['count']
+            user_stats.total_moves_to_win += row['moves_played'] * row['count']
+            user_stats.moves_to_win_histogram[row['moves_played'] - 1] += row['count']
+    PlayerStats.objects.using(database).bulk_create(stats.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mastermind_api', '0011_player_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_player_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:41
+
+import django.contrib.postgres.fields
+import mastermind_api.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mastermind_api', '0013_sharding'),
+    ]
+
+    operations = [
+        # added without a default so existing games, whose moves are rows, are left null whatever GAME_MOVE_STORAGE is
+        migrations.AddField(
+            model_name='game',
+            name='inline_moves',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), editable=False, null=True, size=None),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='inline_moves',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), default=mastermind_api.models.default_inline_moves, editable=False, null=True, size=None),
+        ),
+    ]
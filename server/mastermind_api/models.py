@@ -1,8 +1,18 @@
 from django.conf import settings
-from django.db import models
-from django.contrib.postgres.fields import JSONField
+from django.contrib.postgres.fields import ArrayField
+from django.core.exceptions import ValidationError
+from django.db import connections, models, router
+from mastermind_api import candidates as candidate_codes, feedback_table, scoring
 from random import randint
-from typing import List
+from typing import Dict, List, Optional, Tuple
+import json
+import numpy as np
+
+
+
+def default_inline_moves() -> Optional[List]:
+    """Return the inline moves of a new game, an empty list when games store their moves inline, see GAME_MOVE_STORAGE."""
+    return [] if settings.GAME_MOVE_STORAGE == Game.MOVE_STORAGE_INLINE else None
 
 
 
@@ -11,37 +21,240 @@ class Game(models.Model):
 
     NUMBER_OF_MOVES = 12
     NUMBER_OF_HOLES = 4
-    CODE_COLOR_CHOICES = ['red', 'orange', 'yellow', 'green', 'blue', 'purple']
+    # a game uses the first number_of_colors colors
+    COLOR_CHOICES = [
+        'red', 'orange', 'yellow', 'green', 'blue', 'purple', 'pink', 'brown', 'cyan', 'magenta',
+        'lime', 'teal', 'navy', 'maroon', 'olive', 'gray', 'gold', 'silver', 'indigo', 'violet'
+    ]
+    CODE_COLOR_CHOICES = COLOR_CHOICES[:6]
+    MAX_NUMBER_OF_MOVES = 50
+    MAX_NUMBER_OF_HOLES = 12
+    MIN_NUMBER_OF_COLORS = 2
+    # the most possible codes a game can have to keep track of its remaining candidate codes
+    MAX_CANDIDATES = 1 << 20
+    STATUS_IN_PROGRESS = 0
+    STATUS_WON = 1
+    STATUS_LOST = 2
+    STATUS_CHOICES = ((STATUS_IN_PROGRESS, 'in_progress'), (STATUS_WON, 'won'), (STATUS_LOST, 'lost'))
+    # in codemaker games the user makes the code and the server plays the moves
+    MODE_CODEBREAKER = 0
+    MODE_CODEMAKER = 1
+    MODE_CHOICES = ((MODE_CODEBREAKER, 'codebreaker'), (MODE_CODEMAKER, 'codemaker'))
+    # a game's moves are either Move rows or packed into an array on its own row
+    MOVE_STORAGE_ROWS = 'rows'
+    MOVE_STORAGE_INLINE = 'inline'
 
     number_of_moves = models.PositiveSmallIntegerField()
-    codebreaker = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    code =  JSONField()
+    number_of_holes = models.PositiveSmallIntegerField(default=NUMBER_OF_HOLES)
+    number_of_colors = models.PositiveSmallIntegerField(default=len(CODE_COLOR_CHOICES))
+    # indexed by the composite indexes leading with it, see Meta,
+        # and without a foreign key constraint as the game may be on another shard than its user, see mastermind_api.sharding
+    codebreaker = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False, db_constraint=False)
+    mode = models.PositiveSmallIntegerField(choices=MODE_CHOICES, default=MODE_CODEBREAKER)
+    # the code packed into a base number_of_colors integer, see pack_code
+    packed_code = models.BigIntegerField()
+    # denormalized game state kept up to date by record_move,
+        # so validating a move reads the game row instead of counting its moves
+    moves_played = models.PositiveSmallIntegerField(default=0)
+    status = models.PositiveSmallIntegerField(choices=STATUS_CHOICES, default=STATUS_IN_PROGRESS)
+    # bitset of the codes still consistent with the first candidates_moves moves, one bit per packed code,
+        # only kept once a hint has been asked for, see update_candidates
+    candidates = models.BinaryField(null=True, editable=False)
+    candidates_moves = models.PositiveSmallIntegerField(default=0)
+    # the moves of a game storing them inline in the order they were played, one integer each, see encode_move,
+        # null for a game storing them as Move rows
+    inline_moves = ArrayField(models.BigIntegerField(), null=True, default=default_inline_moves, editable=False)
+
+    class Meta:
+        # a codebreaker's games newest first, with or without a status filter, for keyset pagination
+        indexes = [
+            models.Index(fields=['codebreaker', '-id'], name='game_codebreaker_id_idx'),
+            models.Index(fields=['codebreaker', 'status', '-id'], name='game_codebreaker_status_idx'),
+        ]
+
+    @property
+    def code(self) -> List:
+        """The game's code as a list of color names."""
+        return self.unpack_code(self.packed_code)
+
+    @code.setter
+    def code(self, code: List) -> None:
+        self.packed_code = self.pack_code(code)
+
+    @property
+    def color_choices(self) -> List:
+        """The colors a code of this game can be made of."""
+        return Game.COLOR_CHOICES[:self.number_of_colors]
+
+    def pack_code(self, code: List) -> int:
+        """Return a code of color names packed into a base number_of_colors integer."""
+        indices = scoring.color_indices(code, self.color_choices)
+        return int(scoring.pack_codes(indices, self.number_of_colors)[0])
+
+    def unpack_code(self, packed_code: int) -> List:
+        """Return the code of color names packed into a base number_of_colors integer."""
+        indices = scoring.unpack_codes(packed_code, self.number_of_holes, self.number_of_colors)
+        return [Game.COLOR_CHOICES[index] for index in indices]
 
     @staticmethod
-    def generate_random_code() -> List:
-        """Generate a random code with a random color from CODE_COLOR_CHOICES for each hole in NUMBER_OF_HOLES."""
+    def generate_random_code(number_of_holes: int = NUMBER_OF_HOLES, color_choices: List = CODE_COLOR_CHOICES) -> List:
+        """Generate a random code with a random color from color_choices for each hole in number_of_holes."""
         code = []
         i = 0
-        while i < Game.NUMBER_OF_HOLES:
+        while i < number_of_holes:
             # get random color from the games color choices and append it to the code
-            code.append(Game.CODE_COLOR_CHOICES[randint(0, len(Game.CODE_COLOR_CHOICES)-1)])
+            code.append(color_choices[randint(0, len(color_choices)-1)])
             i += 1
         return code
 
+    @staticmethod
+    def encode_move(packed_code: int, blacks: int, whites: int, number_of_holes: int) -> int:
+        """Return a move packed into one integer, its blacks and whites being its two lowest base number_of_holes + 1 digits."""
+        return (packed_code * (number_of_holes + 1) + blacks) * (number_of_holes + 1) + whites
+
+    @staticmethod
+    def decode_move(value: int, number_of_holes: int) -> Tuple[int, int, int]:
+        """Return the (packed code, blacks, whites) of a move packed into one integer, see encode_move."""
+        value, whites = divmod(value, number_of_holes + 1)
+        packed_code, blacks = divmod(value, number_of_holes + 1)
+        return packed_code, blacks, whites
+
+    def get_moves(self, since: int = 0) -> List['Move']:
+        """Return the game's moves in the order they were played, skipping the first since moves.
+
+        Inline moves are read from the game's row, so they're unsaved Move objects without ids,
+            Move rows are read by a query unless they were prefetched in order with the game, see GameBulkDetails.
+        """
+        if self.inline_moves is not None:
+            return [
+                Move(game=self, packed_code=packed_code, blacks=blacks, whites=whites)
+                for packed_code, blacks, whites in (Game.decode_move(value, self.number_of_holes) for value in self.inline_moves[since:])
+            ]
+        if 'moves' in getattr(self, '_prefetched_objects_cache', {}):
+            return list(self.moves.all()[since:])
+        return list(self.moves.order_by('id')[since:])
+
+    def get_number_of_codes(self) -> int:
+        """Return the number of possible codes of the game's configuration."""
+        return self.number_of_colors ** self.number_of_holes
+
+    def update_candidates(self, new_moves: List = ()) -> np.ndarray:
+        """Narrow the game's candidate codes by the moves played since they were last narrowed, return their packed codes.
+
+        The game's row must be locked and its moves played and candidates fresh,
+            new_moves are the game's latest moves if they're already in memory.
+        Narrowing by a move takes time proportional to the number of remaining candidates,
+            only the bits of the candidates it rules out are cleared from the stored bitset.
+        """
+        if self.candidates is None:
+            codes = candidate_codes.all_candidates(self.number_of_holes, self.number_of_colors)
+            self.candidates_moves = 0
+        else:
+            codes = candidate_codes.from_bytes(bytes(self.candidates), self.number_of_holes, self.number_of_colors)
+        previous = codes
+        missing = self.moves_played - self.candidates_moves
+        if self.candidates is not None and missing == 0:
+            return codes
+        if missing <= len(new_moves):
+            moves = list(new_moves)[len(new_moves) - missing:]
+        else:
+            moves = self.get_moves(self.candidates_moves)
+        for move in moves:
+            guess = scoring.unpack_codes(move.packed_code, self.number_of_holes, self.number_of_colors)
+            codes = candidate_codes.narrow(codes, guess, move.blacks, move.whites, self.number_of_holes, self.number_of_colors)
+        if self.candidates is None:
+            self.candidates = candidate_codes.to_bytes(codes, self.number_of_holes, self.number_of_colors)
+        else:
+            self.candidates = candidate_codes.clear_bits(bytes(self.candidates), np.setdiff1d(previous, codes, assume_unique=True))
+        self.candidates_moves = self.moves_played
+        Game.objects.filter(pk=self.pk).update(candidates=self.candidates, candidates_moves=self.candidates_moves)
+        return codes
+
     def get_moves_count(self) -> int:
         """Return the number of moves already played in a game."""
-        return Move.objects.filter(game_id=self.id).count()
+        return self.moves_played
 
     def get_game_won(self) -> bool:
         """Return true if the game has been won and false if the game hasn't been won yet."""
-        count_winning_move = Move.objects.filter(game_id=self.id, result=["black", "black", "black", "black"]).count()
-        if count_winning_move > 0:
-            return True
-        return False
+        return self.status == self.STATUS_WON
 
     def get_remaining_moves(self) -> int:
         """Return the number of remaining moves available in a game."""
-        return self.NUMBER_OF_MOVES - self.get_moves_count()
+        return self.number_of_moves - self.moves_played
+
+    def get_etag(self, since: int = 0) -> str:
+        """Return an entity tag for the game's details after the first since moves, which only change when a move is played."""
+        if since:
+            return '"{}-{}-{}"'.format(self.id, self.moves_played, since)
+        return '"{}-{}"'.format(self.id, self.moves_played)
+
+    def record_move(self, won: bool, move: 'Move', channel: Optional[str] = None) -> bool:
+        """Claim one of the game's remaining moves and update the game's status, return false if the game is already over.
+
+        The claim is a single update conditional on the game's moves played, so it row locks the game only until the surrounding
+            transaction ends, and a claim made on a state that changed since it was read, because of a concurrent claim or
+            a stale cached game, fails and is made again on the game's current state.
+        The move is written by the same statement: appended to a game storing its moves inline,
+            or else inserted as a Move row, which then gets its id, by a query inserting it only if the update claimed a move.
+        Given a NOTIFY channel, the same statement also notifies the move's event on it, see Notifier.get_channel.
+        """
+        while self.status == self.STATUS_IN_PROGRESS and self.moves_played < self.number_of_moves:
+            if won:
+                status = self.STATUS_WON
+            elif self.moves_played + 1 >= self.number_of_moves:
+                # this move uses up the last remaining move
+                status = self.STATUS_LOST
+            else:
+                status = self.STATUS_IN_PROGRESS
+            if self.claim(status, move, channel):
+                # mirror the update on this instance without reading the row back
+                self.moves_played += 1
+                self.status = status
+                if self.inline_moves is not None:
+                    self.inline_moves.append(Game.encode_move(move.packed_code, move.blacks, move.whites, self.number_of_holes))
+                return True
+            # the game changed since it was read, read its current state
+            self.refresh_from_db(fields=['moves_played', 'status', 'inline_moves'])
+        return False
+
+    def claim(self, status: int, move: 'Move', channel: Optional[str] = None) -> bool:
+        """Make a move's claim on the game's moves played and write the move if it succeeds, in one query, see record_move."""
+        claim = 'UPDATE {game} SET moves_played = moves_played + 1, status = %s{append} WHERE id = %s AND status = %s AND moves_played = %s RETURNING id'
+        params = [status]
+        if self.inline_moves is not None:
+            claim = claim.format(game=Game._meta.db_table, append=', inline_moves = array_append(inline_moves, %s::bigint)')
+            params.append(Game.encode_move(move.packed_code, move.blacks, move.whites, self.number_of_holes))
+        else:
+            claim = claim.format(game=Game._meta.db_table, append='')
+        params += [self.pk, self.STATUS_IN_PROGRESS, self.moves_played]
+        if self.inline_moves is not None:
+            query = 'WITH claimed AS ({}) SELECT NULL{{notify}} FROM claimed'.format(claim)
+            notify = ', pg_notify(%s, %s)'
+        else:
+            query = (
+                'WITH claimed AS ({}), inserted AS ('
+                'INSERT INTO {move} (game_id, packed_code, blacks, whites) SELECT id, %s, %s, %s FROM claimed RETURNING id'
+                ') SELECT id{{notify}} FROM inserted'
+            ).format(claim, move=Move._meta.db_table)
+            params += [move.packed_code, move.blacks, move.whites]
+            # the event's move id is only known once the row is inserted
+            notify = ", pg_notify(%s, jsonb_set(%s::jsonb, '{move,id}', to_jsonb(id))::text)"
+        if channel is None:
+            query = query.format(notify='')
+        else:
+            query = query.format(notify=notify)
+            params += [channel, json.dumps(move.get_event(self.moves_played + 1))]
+        using = router.db_for_write(Game, instance=self)
+        with connections[using].cursor() as cursor:
+            cursor.execute(query, params)
+            row = cursor.fetchone()
+        if row is None:
+            return False
+        if self.inline_moves is None:
+            move.id = row[0]
+            move._state.adding = False
+            move._state.db = using
+        return True
 
 
 
@@ -49,32 +262,131 @@ class Move(models.Model):
     """A move object."""
 
     game = models.ForeignKey(Game, related_name='moves', on_delete=models.CASCADE)
-    code = JSONField()
-    result = JSONField()
+    # the code packed the same way as the game's code, see Game.pack_code
+    packed_code = models.BigIntegerField()
+    blacks = models.PositiveSmallIntegerField()
+    whites = models.PositiveSmallIntegerField()
+
+    @property
+    def code(self) -> List:
+        """The move's code as a list of color names."""
+        return self.game.unpack_code(self.packed_code)
+
+    @code.setter
+    def code(self, code: List) -> None:
+        self.packed_code = self.game.pack_code(code)
+
+    @property
+    def result(self) -> List:
+        """The move's result as a list of one black per black and one white per white."""
+        return scoring.result_from_counts(self.blacks, self.whites)
+
+    @result.setter
+    def result(self, result: List) -> None:
+        self.blacks = result.count("black")
+        self.whites = result.count("white")
+
+    def get_event(self, moves_played: int) -> Dict:
+        """Return the event of the move for the game's subscribers, moves_played being the number of the move in its game."""
+        game = self.game
+        if self.blacks == game.number_of_holes:
+            status = Game.STATUS_WON
+        elif moves_played >= game.number_of_moves:
+            status = Game.STATUS_LOST
+        else:
+            status = Game.STATUS_IN_PROGRESS
+        return {
+            'game': game.id,
+            'moves_played': moves_played,
+            'status': dict(Game.STATUS_CHOICES)[status],
+            'move': {'id': self.id, 'game': game.id, 'code': self.code, 'result': self.result}
+        }
 
     @staticmethod
-    def get_result(game_code: List, move_code: List):
+    def get_result(game_code: List, move_code: List, color_choices: List = Game.CODE_COLOR_CHOICES) -> List:
         """Return the result of a move: one black per correct hole and color, one white per incorrect hole and correct color."""
-        result = []
-        # create copies so original codes aren't modified
-        new_game_code = game_code.copy()
-        new_move_code = move_code.copy()
-        # add black to results for each correct hole and correct color
-        # delete any correct hole and color combinations,
-            # so they aren't counted with incorrect hole and correct color combinations
-        i = 0
-        while i < len(new_game_code) and i < len(new_move_code):
-            if new_game_code[i] == new_move_code[i]:
-                result.append("black")
-                del new_game_code[i]
-                del new_move_code[i]
-            else:
-                i += 1
-        # add white to results for each incorrect hole and correct color
-        # remove the first instance of that color from the game code,
-            # so it can only be counted once
-        for color in new_move_code:
-            if color in new_game_code:
-                result.append("white")
-                new_game_code.remove(color)
-        return result
+        return Move.get_results(game_code, [move_code], color_choices)[0]
+
+    @staticmethod
+    def get_results(game_code: List, move_codes: List, color_choices: List = Game.CODE_COLOR_CHOICES) -> List:
+        """Return the result of each move's code against the game's code, scored together in one pass.
+
+        Scoring takes time linear in the number of holes plus the number of colors for each move,
+            raises a ValidationError if a move's code doesn't have as many colors as the game's code.
+        """
+        if any(len(move_code) != len(game_code) for move_code in move_codes):
+            raise ValidationError("Code must be " + str(len(game_code)) + " colors.")
+        # index the colors by the game's color choices so a precomputed feedback table can be used,
+            # falling back to indexing the colors of all codes so arbitrary color names can be scored
+        colors = set(game_code).union(*move_codes)
+        if not colors.issubset(color_choices):
+            color_choices = sorted(colors)
+        secret = scoring.color_indices(game_code, color_choices)
+        guesses = scoring.color_indices(move_codes, color_choices)
+        counts = feedback_table.score(secret, guesses, len(secret), len(color_choices))
+        return [scoring.result_from_counts(blacks, whites) for blacks, whites in zip(*counts)]
+
+
+
+class PlayerStats(models.Model):
+    """A user's totals over the games they finished as the codebreaker, kept up to date as each game ends."""
+
+    # on the user's shard, see mastermind_api.sharding
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, primary_key=True, related_name='stats', on_delete=models.CASCADE, db_constraint=False)
+    games_played = models.PositiveIntegerField(default=0)
+    games_won = models.PositiveIntegerField(default=0)
+    # the moves of every won game added up, for the average moves to win
+    total_moves_to_win = models.PositiveIntegerField(default=0)
+    # the games won in each number of moves, index 0 holding the games won in one move
+    moves_to_win_histogram = ArrayField(models.PositiveIntegerField(), size=Game.MAX_NUMBER_OF_MOVES, default=list)
+
+    class Meta:
+        # the leaderboard ranks the most games won first, then the fewest moves spent winning them
+        indexes = [models.Index(fields=['-games_won', 'total_moves_to_win', 'user'], name='playerstats_leaderboard_idx')]
+
+    def get_average_moves_to_win(self) -> float:
+        """Return the average number of moves of the user's won games, or None if they haven't won a game."""
+        return self.total_moves_to_win / self.games_won if self.games_won else None
+
+    def get_win_rate(self) -> float:
+        """Return the fraction of the user's finished games they won, or None if they haven't finished a game."""
+        return self.games_won / self.games_played if self.games_played else None
+
+    @staticmethod
+    def record_game(game: Game) -> None:
+        """Add a game which just ended to its codebreaker's stats, unless the server played it.
+
+        The stats row is created or incremented by a single upsert, so concurrent games of the same user don't lose counts
+            and the row is only locked until the surrounding transaction ends.
+        """
+        if game.mode != Game.MODE_CODEBREAKER or game.status == Game.STATUS_IN_PROGRESS:
+            return
+        won = game.status == Game.STATUS_WON
+        histogram = [0] * Game.MAX_NUMBER_OF_MOVES
+        if won:
+            histogram[game.moves_played - 1] = 1
+        table = PlayerStats._meta.db_table
+        # on the database the game's move is being written to
+        with connections[router.db_for_write(PlayerStats)].cursor() as cursor:
+            # postgres arrays are indexed from 1, so element moves_played counts the games won in moves_played moves
+            cursor.execute(
+                'INSERT INTO ' + table + ' (user_id, games_played, games_won, total_moves_to_win, moves_to_win_histogram)'
+                ' VALUES (%s, 1, %s, %s, %s)'
+                ' ON CONFLICT (user_id) DO UPDATE SET'
+                ' games_played = ' + table + '.games_played + 1,'
+                ' games_won = ' + table + '.games_won + EXCLUDED.games_won,'
+                ' total_moves_to_win = ' + table + '.total_moves_to_win + EXCLUDED.total_moves_to_win,'
+                ' moves_to_win_histogram[%s] = COALESCE(' + table + '.moves_to_win_histogram[%s], 0) + %s',
+                [
+                    game.codebreaker_id, int(won), game.moves_played if won else 0, histogram,
+                    game.moves_played, game.moves_played, int(won)
+                ]
+            )
+
+
+
+class UserShard(models.Model):
+    """The shard holding a user's games, moves and stats, on the default database, see mastermind_api.sharding."""
+
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, primary_key=True, related_name='shard', on_delete=models.CASCADE)
+    shard = models.CharField(max_length=100)
@@ -0,0 +1,84 @@
+from django.conf import settings
+from typing import Dict, Optional, Sequence, Tuple
+import numpy as np
+import os
+
+
+
+class OpeningBook:
+    """The best guess for every feedback path of the first depth moves of a game configuration.
+
+    A path is keyed by its feedback bytes as digits of a base (number_of_holes + 1) ^ 2 + 1 integer,
+        the empty path being 0, see extend_key.
+    """
+
+    def __init__(self, keys: np.ndarray, guesses: np.ndarray, number_of_holes: int, depth: int) -> None:
+        # sorted path keys and the packed code of the guess to play after each path
+        self.keys = keys
+        self.guesses = guesses
+        self.number_of_holes = number_of_holes
+        self.depth = depth
+
+    def get_guess(self, key: int) -> Optional[int]:
+        """Return the packed code of the guess to play after a path, or None if the book doesn't have it."""
+        index = np.searchsorted(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            return int(self.guesses[index])
+        return None
+
+    def next_guess(self, moves: Sequence[Tuple[int, int, int]]) -> Optional[int]:
+        """Return the packed code of the guess to play after moves of (packed code, blacks, whites), or None if they leave the book."""
+        if len(moves) >= self.depth:
+            return None
+        key = 0
+        for packed_code, blacks, whites in moves:
+            # the book only follows games which played its own guesses
+            if self.get_guess(key) != packed_code:
+                return None
+            key = extend_key(key, blacks, whites, self.number_of_holes)
+        return self.get_guess(key)
+
+
+# books already loaded by this process, keyed by (number_of_holes, number_of_colors, strategy),
+    # only books found on disk are kept so a book built after the process started is picked up by its next lookup
+_books: Dict[Tuple[int, int, str], OpeningBook] = {}
+
+
+def extend_key(key: int, blacks: int, whites: int, number_of_holes: int) -> int:
+    """Return the key of a path followed by one more move's feedback."""
+    feedback = blacks * (number_of_holes + 1) + whites
+    return key * ((number_of_holes + 1) ** 2 + 1) + feedback + 1
+
+
+def book_path(number_of_holes: int, number_of_colors: int, strategy: str) -> str:
+    """Return the path of the opening book file for a game configuration and guess selection strategy."""
+    return os.path.join(settings.OPENING_BOOK_DIR, 'opening_{}x{}_{}.npz'.format(number_of_holes, number_of_colors, strategy))
+
+
+def save_book(book: OpeningBook, path: str) -> None:
+    """Write an opening book to a file, replacing it in one step so running workers never load a partially written book."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as file:
+        np.savez(file, keys=book.keys, guesses=book.guesses, shape=np.array([book.number_of_holes, book.depth]))
+    os.replace(temporary_path, path)
+
+
+def get_book(number_of_holes: int, number_of_colors: int, strategy: str) -> Optional[OpeningBook]:
+    """Return the opening book for a game configuration and strategy, or None if it hasn't been built."""
+    key = (number_of_holes, number_of_colors, strategy)
+    if key not in _books:
+        path = book_path(number_of_holes, number_of_colors, strategy)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            _books[key] = OpeningBook(data['keys'], data['guesses'], int(data['shape'][0]), int(data['shape'][1]))
+    return _books[key]
+
+
+def next_guess(moves: Sequence[Tuple[int, int, int]], number_of_holes: int, number_of_colors: int, strategy: str) -> Optional[int]:
+    """Return the book's guess after moves of (packed code, blacks, whites), or None if there's no book or the moves leave it."""
+    book = get_book(number_of_holes, number_of_colors, strategy)
+    if book is None:
+        return None
+    return book.next_guess(moves)
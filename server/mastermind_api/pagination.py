@@ -0,0 +1,15 @@
+from rest_framework.pagination import CursorPagination
+
+
+
+class GameCursorPagination(CursorPagination):
+    """Keyset pagination of a codebreaker's games, newest first.
+
+    Each page continues from the last id of the previous one instead of an offset,
+        so it's served by the (codebreaker, status, id) indexes in the same time however many games come before it.
+    """
+
+    ordering = '-id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
@@ -10,4 +10,5 @@ class IsCodebreaker(permissions.BasePermission):
 
     def has_object_permission(self, request: Dict, view: APIView, obj: Game) -> bool:
         """Return true if the user making the request is the codebreaker of the game."""
-        return obj.codebreaker == request.user
+        # compare ids so the codebreaker doesn't have to be loaded from the database
+        return obj.codebreaker_id == request.user.id
@@ -0,0 +1,54 @@
+import numpy as np
+from typing import Dict, List, Sequence, Tuple
+
+
+
+def score(secrets: np.ndarray, guesses: np.ndarray, number_of_colors: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the number of blacks and whites for each (secret, guess) pair of color index arrays.
+
+    secrets and guesses are arrays of shape (pairs, holes) holding color indices in range(number_of_colors),
+    a single code of shape (holes,) is broadcast against the other array.
+    """
+    secrets = np.atleast_2d(np.asarray(secrets, dtype=np.intp))
+    guesses = np.atleast_2d(np.asarray(guesses, dtype=np.intp))
+    secrets, guesses = np.broadcast_arrays(secrets, guesses)
+    pairs = secrets.shape[0]
+    # one black for each hole where the secret and guess share a color
+    blacks = np.count_nonzero(secrets == guesses, axis=1)
+    # build a color count histogram for every secret and every guess in one bincount each,
+        # offsetting each row's color indices so the rows land in their own bins
+    offsets = np.arange(pairs, dtype=np.intp)[:, np.newaxis] * number_of_colors
+    size = pairs * number_of_colors
+    secret_counts = np.bincount((secrets + offsets).ravel(), minlength=size).reshape(pairs, number_of_colors)
+    guess_counts = np.bincount((guesses + offsets).ravel(), minlength=size).reshape(pairs, number_of_colors)
+    # the colors shared regardless of position are the per color minimum of both histograms,
+        # the whites are the shared colors which aren't already counted as blacks
+    whites = np.minimum(secret_counts, guess_counts).sum(axis=1) - blacks
+    return blacks, whites
+
+
+def color_indices(codes: Sequence, color_choices: Sequence[str]) -> np.ndarray:
+    """Return an array of color indices for a code or a list of codes made of color names."""
+    index: Dict[str, int] = {color: i for i, color in enumerate(color_choices)}
+    if len(codes) and not isinstance(codes[0], str):
+        return np.array([[index[color] for color in code] for code in codes], dtype=np.intp)
+    return np.array([index[color] for color in codes], dtype=np.intp)
+
+
+def result_from_counts(blacks: int, whites: int) -> List[str]:
+    """Return the result of a move as a list of one black per black and one white per white."""
+    return ["black"] * int(blacks) + ["white"] * int(whites)
+
+
+def pack_codes(codes: np.ndarray, number_of_colors: int) -> np.ndarray:
+    """Return the base number_of_colors integer of each code of color indices, the first hole being the most significant digit."""
+    codes = np.atleast_2d(np.asarray(codes, dtype=np.int64))
+    weights = number_of_colors ** np.arange(codes.shape[1] - 1, -1, -1, dtype=np.int64)
+    return codes @ weights
+
+
+def unpack_codes(values: np.ndarray, number_of_holes: int, number_of_colors: int) -> np.ndarray:
+    """Return the codes of color indices packed into each base number_of_colors integer."""
+    values = np.asarray(values, dtype=np.int64)
+    weights = number_of_colors ** np.arange(number_of_holes - 1, -1, -1, dtype=np.int64)
+    return (values[..., np.newaxis] // weights) % number_of_colors
@@ -1,83 +1,290 @@
-from mastermind_api.models import Game, Move
+from mastermind_api.models import Game, Move, PlayerStats
+from mastermind_api import events, game_cache, sharding, solver
 from rest_framework import serializers
+from mastermind.metrics import SerializerTimingMixin, TimedListSerializer
+from rest_framework.settings import api_settings
+from django.conf import settings
 from users.models import User
-from typing import List
+from typing import Dict, List
 
 
 
-class GameCreateSerializer(serializers.ModelSerializer):
+class GameCreateSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     """Serializer to handle game creation."""
 
-    number_of_moves = serializers.IntegerField(required=False, default='default_number_of_moves')
+    number_of_moves = serializers.IntegerField(required=False, default=Game.NUMBER_OF_MOVES, min_value=1, max_value=Game.MAX_NUMBER_OF_MOVES)
+    number_of_holes = serializers.IntegerField(required=False, default=Game.NUMBER_OF_HOLES, min_value=1, max_value=Game.MAX_NUMBER_OF_HOLES)
+    number_of_colors = serializers.IntegerField(
+        required=False,
+        default=len(Game.CODE_COLOR_CHOICES),
+        min_value=Game.MIN_NUMBER_OF_COLORS,
+        max_value=len(Game.COLOR_CHOICES)
+    )
     codebreaker = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), required=True)
-    code = serializers.JSONField(required=False, default='default_code', write_only=True)
+    code = serializers.JSONField(required=False, write_only=True)
+
+    def validate(self, data: Dict) -> Dict:
+        # this ignores any code given by the user and creates a random code for the game's configuration
+        data['code'] = Game.generate_random_code(data['number_of_holes'], Game.COLOR_CHOICES[:data['number_of_colors']])
+        return data
+
+    class Meta:
+        model = Game
+        fields = ('id', 'number_of_moves', 'number_of_holes', 'number_of_colors', 'codebreaker', 'code')
+
 
-    def default_number_of_moves(self) -> int:
-        return Game.NUMBER_OF_MOVES
 
-    def default_code(self) -> List:
-        return Game.generate_random_code()
+class GameSolveSerializer(GameCreateSerializer):
+    """Serializer to handle creating a game with a code made by the user, which the server plays."""
 
-    def validate_number_of_moves(self, value: int) -> int:
-        return self.default_number_of_moves()
+    code = serializers.JSONField(required=True, write_only=True)
+    strategy = serializers.ChoiceField(choices=solver.STRATEGIES, required=False, default=solver.MINIMAX, write_only=True)
 
-    def validate_code(self, value: List) -> List:
-        return self.default_code()
+    default_error_messages = {
+        'too_many_codes': 'The server only plays games with at most {max_codes} possible codes.'
+    }
+
+    def validate(self, data: Dict) -> Dict:
+        game = Game(number_of_holes=data['number_of_holes'], number_of_colors=data['number_of_colors'])
+        validate_move_code(data['code'], game)
+        # the solver keeps every remaining candidate code in memory
+        if game.get_number_of_codes() > Game.MAX_CANDIDATES:
+            raise serializers.ValidationError(self.error_messages['too_many_codes'].format(max_codes=Game.MAX_CANDIDATES))
+        return data
+
+    def create(self, validated_data: Dict) -> Game:
+        """Play the game against the user's code until it's won or out of moves, then create the game with its moves."""
+        strategy = validated_data.pop('strategy')
+        game = Game(mode=Game.MODE_CODEMAKER, **validated_data)
+        # play the moves before the transaction starts so no connection is held while the solver searches,
+            # for at most SOLVER_GAME_BUDGET seconds so the request's worker is held for a bounded time
+        played = solver.play(
+            game.packed_code, game.number_of_holes, game.number_of_colors, game.number_of_moves,
+            strategy, settings.SOLVER_MOVE_BUDGET, solver.get_pool(), game_budget=settings.SOLVER_GAME_BUDGET
+        )
+        game.moves_played = len(played)
+        game.status = Game.STATUS_WON if played[-1][1] == game.number_of_holes else Game.STATUS_LOST
+        with sharding.atomic():
+            if game.inline_moves is not None:
+                game.inline_moves = [Game.encode_move(packed_code, blacks, whites, game.number_of_holes) for packed_code, blacks, whites in played]
+            game.save()
+            if game.inline_moves is None:
+                Move.objects.bulk_create([
+                    Move(game=game, packed_code=packed_code, blacks=blacks, whites=whites) for packed_code, blacks, whites in played
+                ])
+        return game
 
     class Meta:
         model = Game
-        fields = ('id', 'number_of_moves', 'codebreaker', 'code')
+        fields = ('id', 'number_of_moves', 'number_of_holes', 'number_of_colors', 'codebreaker', 'code', 'strategy')
+
+
+
+class CachedGameField(serializers.PrimaryKeyRelatedField):
+    """Field to handle a game's id, reading the game from the game state cache rather than its database, see game_cache."""
 
+    def to_internal_value(self, data) -> Game:
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            game = game_cache.get_game(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if game is None:
+            self.fail('does_not_exist', pk_value=data)
+        return game
 
 
-class MoveCreateSerializer(serializers.ModelSerializer):
+
+def validate_move_code(code: List, game: Game) -> None:
+    """Raise a validation error unless the code is a valid guess for the game."""
+    # check that the provided code is a list,
+        # that it has the correct number of color guesses to fill each hole,
+        # and that the color guesses are valid color choices
+    if not isinstance(code, list):
+        raise serializers.ValidationError("Code must be a json array.")
+    if len(code) != game.number_of_holes:
+        raise serializers.ValidationError("Code must be " + str(game.number_of_holes) + " colors.")
+    for color in code:
+        if color not in game.color_choices:
+            raise serializers.ValidationError("Color must be one of " + str(game.color_choices))
+
+
+
+class MoveCreateSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     """Serializer to handle move creation."""
 
-    game = serializers.PrimaryKeyRelatedField(queryset=Game.objects.all(), required=True)
+    game = CachedGameField(queryset=Game.objects.all(), required=True)
     code = serializers.JSONField(required=True)
     result = serializers.JSONField(required=False)
 
+    default_error_messages = {
+        'game_won': 'Game already won.',
+        'no_remaining_moves': 'No remaining moves left.'
+    }
+
     def validate(self, data: List) -> List:
-        # check that the provided code is a list,
-            # that it has the correct number of color guesses to fill each hole,
-            # and that the color guesses are valid color choices
-        if not isinstance(data['code'], list):
-            raise serializers.ValidationError("Code must be a json array.")
-        if len(data['code']) != Game.NUMBER_OF_HOLES:
-            raise serializers.ValidationError("Code must be " + str(Game.NUMBER_OF_HOLES) + " colors.")
-        for color in data['code']:
-            if color not in Game.CODE_COLOR_CHOICES:
-                raise serializers.ValidationError("Color must be one of " + str(Game.CODE_COLOR_CHOICES))
+        validate_move_code(data['code'], data['game'])
         # Check that the game has not already been won,
             # and that the game has remaining moves
         if data['game'].get_game_won() == True:
-            raise serializers.ValidationError("Game already won.")
+            raise serializers.ValidationError(self.error_messages['game_won'])
         if data['game'].get_remaining_moves() <= 0:
-            raise serializers.ValidationError("No remaining moves left.")
+            raise serializers.ValidationError(self.error_messages['no_remaining_moves'])
         # calculate the result of the move
-        data['result'] = Move.get_result(data['game'].code, data['code'])
+        data['result'] = Move.get_result(data['game'].code, data['code'], data['game'].color_choices)
         return data
 
+    def create(self, validated_data: Dict) -> Move:
+        """Create a new move object after claiming one of its game's remaining moves in the same transaction.
+
+        The claim writes the move too, appended to a game storing its moves inline or inserted as a Move row,
+            and notifies the move's event when events are sent through Postgres, so a move which doesn't end its game is one query.
+        The game is usually read from the game state cache, which is written through once the move is committed.
+        """
+        game = validated_data['game']
+        move = Move(**validated_data)
+        channel = events.get_notifier().get_channel()
+        with sharding.atomic():
+            # the game may have been won or run out of moves since it was validated,
+                # so the claim re-checks the game's state while holding its row lock
+            if not game.record_move(move.blacks == game.number_of_holes, move, channel):
+                # the game was over, which the cached game may not have known yet
+                game_cache.evict(game.pk)
+                error = 'game_won' if game.get_game_won() else 'no_remaining_moves'
+                raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [self.error_messages[error]]})
+            # count the game in its codebreaker's stats if this move ended it
+            PlayerStats.record_game(game)
+            # push the move to the game's subscribers once it's committed, unless the claim notified it
+            if channel is None:
+                events.publish_moves(game, [move])
+            # narrow the game's candidate codes if a hint has been asked for,
+                # reading its state again now that its row is locked by the claim
+            if game_cache.has_candidates(game):
+                game.refresh_from_db(fields=['moves_played', 'candidates', 'candidates_moves', 'inline_moves'])
+                game.update_candidates([move])
+            game_cache.store(game)
+        return move
+
     class Meta:
         model = Move
         fields = ('id', 'game', 'code', 'result')
 
 
 
-class MoveDetailsSerializer(serializers.ModelSerializer):
+class MoveBatchCreateSerializer(SerializerTimingMixin, serializers.Serializer):
+    """Serializer to handle creating an ordered list of moves for a given game at once."""
+
+    game = CachedGameField(queryset=Game.objects.all(), required=True)
+    codes = serializers.ListField(child=serializers.JSONField(), min_length=1)
+
+    default_error_messages = MoveCreateSerializer.default_error_messages
+
+    def validate(self, data: Dict) -> Dict:
+        for code in data['codes']:
+            validate_move_code(code, data['game'])
+        # Check that the game has not already been won,
+            # and that the game has remaining moves
+        if data['game'].get_game_won() == True:
+            raise serializers.ValidationError(self.error_messages['game_won'])
+        if data['game'].get_remaining_moves() <= 0:
+            raise serializers.ValidationError(self.error_messages['no_remaining_moves'])
+        # calculate the results of all moves in one pass
+        data['results'] = Move.get_results(data['game'].code, data['codes'], data['game'].color_choices)
+        return data
+
+    def create(self, validated_data: Dict) -> List:
+        """Create the moves in order until the game is won or runs out of moves, return the created move objects."""
+        with sharding.atomic():
+            # lock the game row for the rest of the transaction,
+                # its state may have changed since it was validated
+            game = Game.objects.select_for_update().get(pk=validated_data['game'].pk)
+            if game.get_game_won():
+                raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [self.error_messages['game_won']]})
+            if game.get_remaining_moves() <= 0:
+                raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [self.error_messages['no_remaining_moves']]})
+            moves = []
+            for code, result in zip(validated_data['codes'], validated_data['results']):
+                moves.append(Move(game=game, code=code, result=result))
+                if result.count("black") == game.number_of_holes:
+                    game.status = Game.STATUS_WON
+                    break
+                if len(moves) == game.get_remaining_moves():
+                    game.status = Game.STATUS_LOST
+                    break
+            game.moves_played += len(moves)
+            if game.inline_moves is None:
+                Move.objects.bulk_create(moves)
+                game.save(update_fields=['moves_played', 'status'])
+            else:
+                game.inline_moves.extend(Game.encode_move(move.packed_code, move.blacks, move.whites, game.number_of_holes) for move in moves)
+                game.save(update_fields=['moves_played', 'status', 'inline_moves'])
+            PlayerStats.record_game(game)
+            events.publish_moves(game, moves)
+            # narrow the game's candidate codes if a hint has been asked for
+            if game.candidates is not None:
+                game.update_candidates(moves)
+        return moves
+
+
+
+class MoveDetailsSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     """Serializer to handle getting a move."""
 
     class Meta:
         model = Move
         fields = ('id', 'game', 'code', 'result')
+        list_serializer_class = TimedListSerializer
+
 
 
+class GameListSerializer(SerializerTimingMixin, serializers.ModelSerializer):
+    """Serializer to handle listing games without their move history."""
 
-class GameDetailsSerializer(serializers.ModelSerializer):
+    status = serializers.CharField(source='get_status_display', read_only=True)
+    mode = serializers.CharField(source='get_mode_display', read_only=True)
+
+    class Meta:
+        model = Game
+        fields = ('id', 'number_of_moves', 'number_of_holes', 'number_of_colors', 'codebreaker', 'mode', 'moves_played', 'status')
+        list_serializer_class = TimedListSerializer
+
+
+
+class GameDetailsSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     """Serializer to handle getting a game with move history."""
 
-    moves = MoveDetailsSerializer(many=True, read_only=True)
+    moves = serializers.SerializerMethodField()
+    status = serializers.CharField(source='get_status_display', read_only=True)
+    mode = serializers.CharField(source='get_mode_display', read_only=True)
+
+    def get_moves(self, game: Game) -> List:
+        """Return the game's moves in the order they were played, skipping the first context['since'] moves."""
+        since = self.context.get('since', 0)
+        # the client already has every move
+        if since >= game.moves_played:
+            return []
+        return MoveDetailsSerializer(game.get_moves(since), many=True).data
 
     class Meta:
         model = Game
-        fields = ('id', 'number_of_moves', 'codebreaker', 'moves')
+        fields = ('id', 'number_of_moves', 'number_of_holes', 'number_of_colors', 'codebreaker', 'mode', 'moves_played', 'status', 'moves')
+
+
+
+class PlayerStatsSerializer(SerializerTimingMixin, serializers.ModelSerializer):
+    """Serializer to handle getting a user's stats."""
+
+    username = serializers.CharField(source='user.username', read_only=True)
+    win_rate = serializers.FloatField(source='get_win_rate', read_only=True)
+    average_moves_to_win = serializers.FloatField(source='get_average_moves_to_win', read_only=True)
+    moves_to_win_histogram = serializers.SerializerMethodField()
+
+    def get_moves_to_win_histogram(self, stats: PlayerStats) -> Dict:
+        """Return the number of games won in each number of moves, for the numbers of moves the user has won in."""
+        return dict((str(moves), count) for moves, count in enumerate(stats.moves_to_win_histogram, 1) if count)
+
+    class Meta:
+        model = PlayerStats
+        fields = ('user', 'username', 'games_played', 'games_won', 'win_rate', 'average_moves_to_win', 'moves_to_win_histogram')
+        list_serializer_class = TimedListSerializer
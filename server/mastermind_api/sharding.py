@@ -0,0 +1,195 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.db.models import Count, Model
+from mastermind_api.models import Game, Move, PlayerStats, UserShard
+from typing import Iterator, List, Optional, Tuple, Type
+import zlib
+
+
+
+# the models whose rows live on their codebreaker's shard, the others live on the default database
+SHARDED_MODELS = ('mastermind_api.game', 'mastermind_api.move', 'mastermind_api.playerstats')
+
+# the shard of the user whose request is being handled, see use_shard
+_current_shard: ContextVar[Optional[str]] = ContextVar('current_shard', default=None)
+
+
+def is_sharded() -> bool:
+    """Return whether games are spread across several databases, see the SHARD_DATABASES setting."""
+    return len(settings.SHARD_DATABASES) > 1
+
+
+def shards() -> List[Optional[str]]:
+    """Return the databases to query for every user's rows, None letting the routers choose when there's a single shard."""
+    return list(settings.SHARD_DATABASES) if is_sharded() else [None]
+
+
+def placement(user_id: int) -> str:
+    """Return the shard a user belongs on, by rendezvous hashing so adding a shard only moves the users it gets."""
+    return max(settings.SHARD_DATABASES, key=lambda shard: zlib.crc32('{}:{}'.format(shard, user_id).encode()))
+
+
+def get_shard(user_id: int, assign: bool = True) -> str:
+    """Return the shard holding a user's rows, recording a shard for users who aren't in the directory yet unless assign is false.
+
+    Users with rows on the first shard from before it was sharded stay there until rebalanced, other users go to their placement.
+    """
+    if not is_sharded():
+        return settings.SHARD_DATABASES[0]
+    key = 'user-shard:{}'.format(user_id)
+    shard = cache.get(key)
+    if shard is not None:
+        return shard
+    shard = UserShard.objects.filter(user_id=user_id).values_list('shard', flat=True).first()
+    if shard is None:
+        legacy = settings.SHARD_DATABASES[0]
+        if Game.objects.using(legacy).filter(codebreaker_id=user_id).exists() or PlayerStats.objects.using(legacy).filter(user_id=user_id).exists():
+            shard = legacy
+        else:
+            shard = placement(user_id)
+        if not assign:
+            return shard
+        # a concurrent request may have recorded the user first
+        shard = UserShard.objects.get_or_create(user_id=user_id, defaults={'shard': shard})[0].shard
+    cache.set(key, shard, settings.SHARD_DIRECTORY_TTL)
+    return shard
+
+
+def set_shard(shard: str) -> None:
+    """Route the sharded models to a shard for the rest of the current context, see use_shard."""
+    _current_shard.set(shard)
+
+
+@contextmanager
+def use_shard(shard: str) -> Iterator[None]:
+    """Route the sharded models to a shard inside the block."""
+    token = _current_shard.set(shard)
+    try:
+        yield
+    finally:
+        _current_shard.reset(token)
+
+
+def atomic() -> transaction.Atomic:
+    """Return a transaction on the database games are written to, the current shard when sharded."""
+    return transaction.atomic(using=router.db_for_write(Game))
+
+
+def select_user(queryset):
+    """Join the stats' users, which is only possible when they're on the same database as the stats."""
+    if is_sharded():
+        return queryset
+    return queryset.select_related('user')
+
+
+def load_users(stats: List[PlayerStats]) -> None:
+    """Fetch the users of stats which weren't joined to them in one query, see select_user."""
+    missing = [row for row in stats if not PlayerStats.user.field.is_cached(row)]
+    if missing:
+        users = PlayerStats.user.field.related_model.objects.in_bulk([row.user_id for row in missing])
+        for row in missing:
+            row.user = users[row.user_id]
+
+
+def interleave_ids(using: str) -> None:
+    """Set a shard's game and move id sequences to only generate ids congruent to its index + 1 modulo MAX_SHARDS.
+
+    The ids of every shard are then unique, so rows keep their ids when users move between shards.
+        Sequences start above the default database's ids, which may predate sharding, so it must be migrated first.
+    """
+    index = settings.SHARD_DATABASES.index(using)
+    if index >= settings.MAX_SHARDS:
+        raise ImproperlyConfigured('Ids can only be interleaved across MAX_SHARDS ({}) shards.'.format(settings.MAX_SHARDS))
+    for model in (Game, Move):
+        table = model._meta.db_table
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM ' + table)
+            floor = cursor.fetchone()[0]
+        with connections[using].cursor() as cursor:
+            cursor.execute('SELECT pg_get_serial_sequence(%s, %s), COALESCE(MAX(id), 0) FROM ' + table, [table, 'id'])
+            sequence, largest = cursor.fetchone()
+            largest = max(largest, floor)
+            # the next id above every existing one in the shard's residue class
+            start = largest + 1 + (index - largest) % settings.MAX_SHARDS
+            cursor.execute('ALTER SEQUENCE ' + sequence + ' INCREMENT BY %s', [settings.MAX_SHARDS])
+            cursor.execute('SELECT setval(%s, %s, false)', [sequence, start])
+
+
+def rebuild_stats(user_ids: List[int], using: str) -> None:
+    """Replace users' stats on a shard with their totals over the finished games they played as the codebreaker there."""
+    PlayerStats.objects.using(using).filter(user_id__in=user_ids).delete()
+    finished = Game.objects.using(using).filter(codebreaker_id__in=user_ids, mode=Game.MODE_CODEBREAKER).exclude(
+        status=Game.STATUS_IN_PROGRESS
+    ).order_by()
+    stats = {}
+    for row in finished.values('codebreaker_id', 'status', 'moves_played').annotate(count=Count('*')):
+        user_stats = stats.setdefault(row['codebreaker_id'], PlayerStats(
+            user_id=row['codebreaker_id'], moves_to_win_histogram=[0] * Game.MAX_NUMBER_OF_MOVES
+        ))
+        user_stats.games_played += row['count']
+        if row['status'] == Game.STATUS_WON:
+            user_stats.games_won += row['count']
+            user_stats.total_moves_to_win += row['moves_played'] * row['count']
+            user_stats.moves_to_win_histogram[row['moves_played'] - 1] += row['count']
+    PlayerStats.objects.using(using).bulk_create(stats.values())
+
+
+def move_users(user_ids: List[int], source: str, target: str) -> Tuple[int, int]:
+    """Move users' games, moves and stats from one shard to another and point the directory at it, return the numbers of games and moves moved.
+
+    The users' games and stats are locked on the source while they're copied, so moves played meanwhile wait and then fail,
+        games created on the source through a stale directory entry meanwhile stay there until the next rebalance.
+    """
+    with transaction.atomic(using=source):
+        games = list(Game.objects.using(source).select_for_update().filter(codebreaker_id__in=user_ids).order_by('id'))
+        list(PlayerStats.objects.using(source).select_for_update().filter(user_id__in=user_ids).values_list('pk'))
+        game_ids = [game.pk for game in games]
+        moves = list(Move.objects.using(source).filter(game_id__in=game_ids).order_by('id'))
+        # rows already copied by an interrupted rebalance are skipped
+        with transaction.atomic(using=target):
+            Game.objects.using(target).bulk_create(games, ignore_conflicts=True)
+            Move.objects.using(target).bulk_create(moves, ignore_conflicts=True)
+            rebuild_stats(user_ids, target)
+        UserShard.objects.filter(user_id__in=user_ids).update(shard=target)
+        UserShard.objects.bulk_create(
+            [UserShard(user_id=user_id, shard=target) for user_id in user_ids], ignore_conflicts=True
+        )
+        Move.objects.using(source).filter(game_id__in=game_ids).delete()
+        Game.objects.using(source).filter(pk__in=game_ids).delete()
+        PlayerStats.objects.using(source).filter(user_id__in=user_ids).delete()
+    cache.delete_many(['user-shard:{}'.format(user_id) for user_id in user_ids])
+    return len(games), len(moves)
+
+
+
+class ShardRouter:
+    """Database router sending the rows of SHARDED_MODELS to the shard of the current context, see use_shard.
+
+    The other models are left to the next router, except the shard directory which is always on the default database.
+    """
+
+    def db_for_read(self, model: Type[Model], **hints) -> Optional[str]:
+        if model is UserShard:
+            return DEFAULT_DB_ALIAS
+        if not is_sharded() or model._meta.label_lower not in SHARDED_MODELS:
+            return None
+        # rows related to a sharded row are on its shard, while rows related to a user aren't on the user's database
+        instance = hints.get('instance')
+        if instance is not None and instance._meta.label_lower in SHARDED_MODELS and instance._state.db in settings.SHARD_DATABASES:
+            return instance._state.db
+        shard = _current_shard.get()
+        if shard is None:
+            raise RuntimeError('No shard selected for ' + model._meta.label + ', see mastermind_api.sharding.use_shard.')
+        return shard
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1: Model, obj2: Model, **hints) -> Optional[bool]:
+        # users are on the default database while their games are on their shard
+        if is_sharded():
+            return True
+        return None
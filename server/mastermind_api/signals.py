@@ -0,0 +1,26 @@
+from django.conf import settings
+from mastermind_api import game_cache, sharding
+from mastermind_api.models import Game, PlayerStats
+from users.models import User
+
+
+
+def interleave_shard_ids(sender: type, using: str, **kwargs) -> None:
+    """Interleave the ids of a shard once it's migrated, see sharding.interleave_ids."""
+    if sharding.is_sharded() and using in settings.SHARD_DATABASES:
+        sharding.interleave_ids(using)
+
+
+def delete_user_rows(sender: type, instance: User, using: str, **kwargs) -> None:
+    """Delete a user's games, moves and stats from the other shards, the deletion only cascades on the user's database."""
+    if not sharding.is_sharded():
+        return
+    for shard in settings.SHARD_DATABASES:
+        if shard != using:
+            Game.objects.using(shard).filter(codebreaker_id=instance.pk).delete()
+            PlayerStats.objects.using(shard).filter(user_id=instance.pk).delete()
+
+
+def store_game_state(sender: type, instance: Game, **kwargs) -> None:
+    """Write a saved game through to the game state cache, see game_cache.store."""
+    game_cache.store(instance)
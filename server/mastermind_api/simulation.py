@@ -0,0 +1,85 @@
+from mastermind_api import candidates as candidate_codes, feedback_table, opening_book, scoring, solver
+from mastermind_api.models import Game
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+import random
+
+
+
+# a strategy returns the packed code of the next guess
+    # given the remaining candidates' packed codes, the (packed code, blacks, whites) of the moves so far,
+    # the number of holes and colors, and a random generator
+Strategy = Callable[[np.ndarray, List[Tuple[int, int, int]], int, int, np.random.Generator], int]
+
+# strategies by name, see register
+STRATEGIES: Dict[str, Strategy] = {}
+
+
+def register(name: str) -> Callable[[Strategy], Strategy]:
+    """Decorator registering a guessing strategy under a name."""
+    def decorator(strategy: Strategy) -> Strategy:
+        STRATEGIES[name] = strategy
+        return strategy
+    return decorator
+
+
+@register('first')
+def first_candidate(remaining: np.ndarray, moves: List, number_of_holes: int, number_of_colors: int, rng: np.random.Generator) -> int:
+    """Guess the first code which could still be the code."""
+    return int(remaining[0])
+
+
+@register('random')
+def random_candidate(remaining: np.ndarray, moves: List, number_of_holes: int, number_of_colors: int, rng: np.random.Generator) -> int:
+    """Guess a random code which could still be the code."""
+    return int(remaining[rng.integers(len(remaining))])
+
+
+def search(strategy: str) -> Strategy:
+    """Return a strategy following the opening book then searching every guess with one of the solver's strategies."""
+    def guess(remaining: np.ndarray, moves: List, number_of_holes: int, number_of_colors: int, rng: np.random.Generator) -> int:
+        book_guess = opening_book.next_guess(moves, number_of_holes, number_of_colors, strategy)
+        if book_guess is not None:
+            return book_guess
+        return solver.choose_guess(remaining, number_of_holes, number_of_colors, strategy, rng=rng)
+    return guess
+
+
+for name in solver.STRATEGIES:
+    register(name)(search(name))
+
+
+def simulate_game(
+    secret: np.ndarray, strategy: Strategy, number_of_holes: int, number_of_colors: int, number_of_moves: int, rng: np.random.Generator
+) -> int:
+    """Play a game against a secret code of color indices, return the number of moves it took to win or 0 if it was lost."""
+    remaining = candidate_codes.all_candidates(number_of_holes, number_of_colors)
+    moves = []
+    while len(moves) < number_of_moves:
+        guess = strategy(remaining, moves, number_of_holes, number_of_colors, rng)
+        guess_code = scoring.unpack_codes(np.int64(guess), number_of_holes, number_of_colors)
+        blacks, whites = feedback_table.score(secret, guess_code, number_of_holes, number_of_colors)
+        moves.append((guess, int(blacks[0]), int(whites[0])))
+        if blacks[0] == number_of_holes:
+            return len(moves)
+        remaining = candidate_codes.narrow(remaining, guess_code, int(blacks[0]), int(whites[0]), number_of_holes, number_of_colors)
+    return 0
+
+
+def simulate_chunk(task: Tuple[str, int, int, int, int, int]) -> Tuple[str, np.ndarray]:
+    """Play a chunk of games against random codes, return the strategy's name and how many games were won in each number of moves.
+
+    The task is (strategy name, number of games, number of holes, number of colors, number of moves, seed),
+        index 0 of the counts holds the games lost.
+    """
+    name, games, number_of_holes, number_of_colors, number_of_moves, seed = task
+    # forked worker processes start with the same random state, so every chunk is seeded
+    random.seed(seed)
+    rng = np.random.default_rng(seed)
+    strategy = STRATEGIES[name]
+    color_choices = Game.COLOR_CHOICES[:number_of_colors]
+    counts = np.zeros(number_of_moves + 1, dtype=np.int64)
+    for _ in range(games):
+        secret = scoring.color_indices(Game.generate_random_code(number_of_holes, color_choices), color_choices)
+        counts[simulate_game(secret, strategy, number_of_holes, number_of_colors, number_of_moves, rng)] += 1
+    return name, counts
@@ -0,0 +1,231 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from django.conf import settings
+from mastermind_api import candidates as candidate_codes, feedback_table, opening_book, scoring
+from typing import List, Optional, Set, Tuple
+import multiprocessing
+import numpy as np
+import time
+
+
+
+MINIMAX = 'minimax'
+EXPECTED_SIZE = 'expected_size'
+STRATEGIES = (MINIMAX, EXPECTED_SIZE)
+# the most candidates a guess is searched for when suggesting a guess,
+    # with more candidates the first candidate is suggested
+SUGGESTION_CANDIDATES_LIMIT = 1296
+# the most (guess, secret) pairs scored at once, bounding the size of the scoring histograms
+PAIRS_PER_CHUNK = 1 << 16
+# the most guesses searched and candidates they're scored against when choosing a guess,
+    # configurations with more possible codes search a sample of the candidates
+SEARCH_GUESSES_LIMIT = 4096
+SEARCH_CANDIDATES_LIMIT = 4096
+
+# the process pool guesses are searched with, created on first use, see get_pool
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def feedback_matrix(guesses: np.ndarray, secrets: np.ndarray, number_of_holes: int, number_of_colors: int) -> np.ndarray:
+    """Return the feedback byte of every guess (rows) against every secret (columns), both given as packed codes."""
+    table = feedback_table.get_table(number_of_holes, number_of_colors)
+    if table is not None:
+        return np.asarray(table[np.ix_(secrets, guesses)]).T
+    secret_codes = scoring.unpack_codes(secrets, number_of_holes, number_of_colors)
+    guess_codes = scoring.unpack_codes(guesses, number_of_holes, number_of_colors)
+    matrix = np.empty((len(guesses), len(secrets)), dtype=np.uint8)
+    rows_per_chunk = max(1, PAIRS_PER_CHUNK // max(1, len(secrets)))
+    for start in range(0, len(guesses), rows_per_chunk):
+        rows = guess_codes[start:start + rows_per_chunk]
+        blacks, whites = scoring.score(np.tile(secret_codes, (len(rows), 1)), np.repeat(rows, len(secrets), axis=0), number_of_colors)
+        matrix[start:start + len(rows)] = feedback_table.encode_feedback(blacks, whites, number_of_holes).reshape(len(rows), len(secrets))
+    return matrix
+
+
+def partition_counts(guesses: np.ndarray, candidates: np.ndarray, number_of_holes: int, number_of_colors: int) -> np.ndarray:
+    """Return the number of candidates giving each feedback byte (columns) for every guess (rows)."""
+    feedback = feedback_matrix(guesses, candidates, number_of_holes, number_of_colors).astype(np.intp)
+    # count the candidates giving each feedback for every guess in one bincount,
+        # offsetting each guess's feedback so the guesses land in their own bins
+    bins = (number_of_holes + 1) ** 2
+    offsets = np.arange(len(guesses), dtype=np.intp)[:, np.newaxis] * bins
+    return np.bincount((feedback + offsets).ravel(), minlength=len(guesses) * bins).reshape(len(guesses), bins)
+
+
+def partition_scores(guesses: np.ndarray, candidates: np.ndarray, number_of_holes: int, number_of_colors: int, strategy: str = MINIMAX) -> np.ndarray:
+    """Return the score of each guess, lower being better.
+
+    minimax scores a guess by the number of candidates left by its least informative feedback (Knuth),
+    expected_size by the expected number of candidates left times the number of candidates.
+    """
+    counts = partition_counts(guesses, candidates, number_of_holes, number_of_colors)
+    if strategy == MINIMAX:
+        return counts.max(axis=1)
+    return (counts.astype(np.int64) ** 2).sum(axis=1)
+
+
+def best_guess(guesses: np.ndarray, candidates: np.ndarray, number_of_holes: int, number_of_colors: int, strategy: str = MINIMAX) -> Tuple[int, bool, int]:
+    """Return the best guess's (score, whether it can't be the code, packed code), comparable across groups of guesses.
+
+    Guesses with the same score are ranked by whether they could be the code, then by their packed code.
+    """
+    scores = partition_scores(guesses, candidates, number_of_holes, number_of_colors, strategy)
+    inconsistent = ~np.isin(guesses, candidates)
+    index = np.lexsort((guesses, inconsistent, scores))[0]
+    return (int(scores[index]), bool(inconsistent[index]), int(guesses[index]))
+
+
+def search_chunk(
+    guesses: np.ndarray, candidates: np.ndarray, number_of_holes: int, number_of_colors: int, strategy: str = MINIMAX, deadline: Optional[float] = None
+) -> Optional[Tuple[int, bool, int]]:
+    """Return the best guess of a chunk of guesses like best_guess, or None if the deadline passed before any was searched.
+
+    The chunk is searched a part at a time, stopping at the deadline, a time.time() timestamp as it's checked in the pool's processes,
+        so a chunk still running when its search gives up doesn't hold its process for long.
+    """
+    rows_per_part = max(1, PAIRS_PER_CHUNK // len(candidates))
+    best = None
+    for start in range(0, len(guesses), rows_per_part):
+        if deadline is not None and time.time() >= deadline:
+            break
+        result = best_guess(guesses[start:start + rows_per_part], candidates, number_of_holes, number_of_colors, strategy)
+        best = result if best is None else min(best, result)
+    return best
+
+
+def minimax_guess(candidates: np.ndarray, guesses: np.ndarray, number_of_holes: int, number_of_colors: int) -> int:
+    """Return the guess minimizing the number of candidates left in the worst case, preferring guesses which could be the code."""
+    return best_guess(guesses, candidates, number_of_holes, number_of_colors, MINIMAX)[2]
+
+
+def suggest_guess(candidates: np.ndarray, number_of_holes: int, number_of_colors: int) -> int:
+    """Return a suggested next guess's packed code for the remaining candidates' packed codes."""
+    if len(candidates) <= 2 or len(candidates) > SUGGESTION_CANDIDATES_LIMIT:
+        return int(candidates[0])
+    return minimax_guess(candidates, candidates, number_of_holes, number_of_colors)
+
+
+def get_pool() -> Optional[ProcessPoolExecutor]:
+    """Return this process's solver process pool, or None if guesses are searched in process.
+
+    The pool's processes are spawned rather than forked, as the web process already runs threads
+        (the events listener, the database threads of async views) whose locks a fork could copy while held.
+    """
+    global _pool
+    if _pool is None and settings.SOLVER_WORKERS > 1:
+        _pool = ProcessPoolExecutor(max_workers=settings.SOLVER_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def choose_guess(
+    candidates: np.ndarray, number_of_holes: int, number_of_colors: int, strategy: str = MINIMAX,
+    budget: Optional[float] = None, pool: Optional[ProcessPoolExecutor] = None, rng: Optional[np.random.Generator] = None
+) -> int:
+    """Return the next guess's packed code for the remaining candidates' packed codes.
+
+    The guesses are searched in chunks, in parallel when given a process pool, with at most a chunk per process
+        submitted at a time so the pool isn't left with the queued chunks of a search which gave up.
+    Once the budget in seconds runs out the best guess searched so far is used, or the first candidate if none has been searched yet.
+    """
+    if len(candidates) <= 2:
+        return int(candidates[0])
+    rng = rng if rng is not None else np.random.default_rng()
+    # search every possible code for small configurations, otherwise only guesses which could be the code,
+        # sampling the guesses and the candidates they're scored against so a move's search stays bounded
+    number_of_codes = number_of_colors ** number_of_holes
+    if number_of_codes <= SEARCH_GUESSES_LIMIT:
+        guesses = np.arange(number_of_codes, dtype=np.int64)
+    elif len(candidates) <= SEARCH_GUESSES_LIMIT:
+        guesses = candidates
+    else:
+        guesses = np.sort(rng.choice(candidates, SEARCH_GUESSES_LIMIT, replace=False))
+    scored_candidates = candidates
+    if len(candidates) > SEARCH_CANDIDATES_LIMIT:
+        scored_candidates = np.sort(rng.choice(candidates, SEARCH_CANDIDATES_LIMIT, replace=False))
+    rows_per_chunk = max(1, PAIRS_PER_CHUNK * 16 // len(scored_candidates))
+    chunks = [guesses[start:start + rows_per_chunk] for start in range(0, len(guesses), rows_per_chunk)]
+    deadline = None if budget is None else time.time() + budget
+    results = []
+    if pool is None:
+        for chunk in chunks:
+            result = search_chunk(chunk, scored_candidates, number_of_holes, number_of_colors, strategy, deadline)
+            if result is None:
+                break
+            results.append(result)
+    else:
+        chunks.reverse()
+        running: Set[Future] = set()
+        while chunks or running:
+            # keep every process of the pool busy until the deadline, chunks still running then stop at it by themselves
+            while chunks and len(running) < pool._max_workers and (deadline is None or time.time() < deadline):
+                running.add(pool.submit(search_chunk, chunks.pop(), scored_candidates, number_of_holes, number_of_colors, strategy, deadline))
+            done, running = wait(running, timeout=None if deadline is None else max(0, deadline - time.time()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            results.extend(result for result in (future.result() for future in done) if result is not None)
+    if not results:
+        return int(candidates[0])
+    return min(results)[2]
+
+
+def build_opening_book(
+    number_of_holes: int, number_of_colors: int, depth: int, strategy: str = MINIMAX,
+    pool: Optional[ProcessPoolExecutor] = None, rng: Optional[np.random.Generator] = None
+) -> opening_book.OpeningBook:
+    """Return the opening book of the guesses chosen by the solver for every feedback path shorter than depth.
+
+    Paths leaving two or fewer candidates aren't kept, the solver plays the first candidate for them without a search.
+    """
+    entries: List[Tuple[int, int]] = []
+    # the paths still to search, as (key, remaining candidates, number of moves)
+    paths = [(0, candidate_codes.all_candidates(number_of_holes, number_of_colors), 0)]
+    while paths:
+        key, remaining, moves = paths.pop()
+        if len(remaining) <= 2:
+            continue
+        guess = choose_guess(remaining, number_of_holes, number_of_colors, strategy, pool=pool, rng=rng)
+        entries.append((key, guess))
+        if moves + 1 >= depth:
+            continue
+        # group the remaining candidates by the feedback they would give the guess
+        feedback = feedback_matrix(np.array([guess]), remaining, number_of_holes, number_of_colors)[0]
+        for value in np.unique(feedback):
+            black, white = divmod(int(value), number_of_holes + 1)
+            if black == number_of_holes:
+                continue
+            paths.append((opening_book.extend_key(key, black, white, number_of_holes), remaining[feedback == value], moves + 1))
+    entries.sort()
+    keys = np.array([key for key, _ in entries], dtype=np.int64)
+    guesses = np.array([guess for _, guess in entries], dtype=np.int64)
+    return opening_book.OpeningBook(keys, guesses, number_of_holes, depth)
+
+
+def play(
+    secret: int, number_of_holes: int, number_of_colors: int, number_of_moves: int, strategy: str = MINIMAX,
+    budget: Optional[float] = None, pool: Optional[ProcessPoolExecutor] = None, rng: Optional[np.random.Generator] = None,
+    game_budget: Optional[float] = None
+) -> List[Tuple[int, int, int]]:
+    """Play a game against a secret packed code, return the (guess, blacks, whites) of each move until it's won or out of moves.
+
+    The configuration's opening book is followed for as long as it has a guess, before searching for one.
+    Each move searches for up to budget seconds, and the whole game for up to game_budget seconds,
+        once it runs out the remaining moves play the first candidate left without a search.
+    """
+    secret_code = scoring.unpack_codes(np.int64(secret), number_of_holes, number_of_colors)
+    remaining = candidate_codes.all_candidates(number_of_holes, number_of_colors)
+    game_deadline = None if game_budget is None else time.monotonic() + game_budget
+    moves = []
+    while len(moves) < number_of_moves:
+        move_budget = budget
+        if game_deadline is not None:
+            left = max(0, game_deadline - time.monotonic())
+            move_budget = left if budget is None else min(budget, left)
+        guess = opening_book.next_guess(moves, number_of_holes, number_of_colors, strategy)
+        if guess is None:
+            guess = choose_guess(remaining, number_of_holes, number_of_colors, strategy, move_budget, pool, rng)
+        guess_code = scoring.unpack_codes(np.int64(guess), number_of_holes, number_of_colors)
+        blacks, whites = feedback_table.score(secret_code, guess_code, number_of_holes, number_of_colors)
+        moves.append((guess, int(blacks[0]), int(whites[0])))
+        if blacks[0] == number_of_holes:
+            break
+        remaining = candidate_codes.narrow(remaining, guess_code, int(blacks[0]), int(whites[0]), number_of_holes, number_of_colors)
+    return moves
@@ -1,10 +1,37 @@
-from .models import Game, Move
+from .models import Game, Move, PlayerStats, UserShard
 from users.models import User
 from rest_framework.test import APITestCase
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.authtoken.models import Token
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, APITransactionTestCase
+from django.db import connection, transaction
+from django.core.cache import cache
+from mastermind.routers import ReplicaRouter
+from mastermind import db_threads
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from django.test import AsyncRequestFactory, SimpleTestCase
+from django.test import override_settings
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIHandler
+from mastermind_api.management.commands import benchmark_load
+from mastermind_api import candidates, events, export, game_cache, sharding, views, feedback_table, opening_book, scoring, simulation, solver
+from unittest import mock
+import csv
+import json
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+import tempfile
+import itertools
+import numpy as np
+from typing import Dict, List
+from asgiref.sync import sync_to_async
+import asyncio
 
 
 
@@ -52,9 +79,9 @@ class GamesTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
     def test_game_create_success_not_override(self) -> None:
-        """Test that a game is able to be successfully created and not override defaults."""
+        """Test that a game is able to be successfully created with a given number of moves and not override the codebreaker and code."""
 
-        # user can create a game and not override given number_of_moves, codebreaker, and code
+        # user can create a game with a given number_of_moves and not override given codebreaker, and code
         data = {
             'number_of_moves': 20,
             'codebreaker': 2,
@@ -75,12 +102,47 @@ class GamesTest(APITestCase):
         response = self.client.post(self.game_create_url, data, format='json')
         self.assertEqual(Game.objects.count(), 2)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-        self.assertEqual(response.data['number_of_moves'], 12)
+        self.assertEqual(response.data['number_of_moves'], 20)
         self.assertEqual(response.data['codebreaker'], self.testuser1game.id)
         self.assertTrue('id' in response.data)
         self.assertTrue('color_choices' in response.data)
         self.assertFalse('code' in response.data)
 
+    def test_game_create_success_variant(self) -> None:
+        """Test that a game is able to be successfully created with its own number of holes and colors."""
+
+        data = {'number_of_moves': 30, 'number_of_holes': 12, 'number_of_colors': 20}
+        login_data = {
+            'username': self.testuser1game.username,
+            'password': self.password
+        }
+        login_response = self.client.post(self.user_login_url, login_data, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + login_response.data['token'])
+        response = self.client.post(self.game_create_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['number_of_moves'], 30)
+        self.assertEqual(response.data['number_of_holes'], 12)
+        self.assertEqual(response.data['number_of_colors'], 20)
+        self.assertEqual(response.data['color_choices'], Game.COLOR_CHOICES)
+        game = Game.objects.get(pk=response.data['id'])
+        self.assertEqual(len(game.code), 12)
+        self.assertTrue(set(game.code).issubset(Game.COLOR_CHOICES))
+        self.assertEqual(game.pack_code(game.code), game.packed_code)
+
+    def test_game_create_fail_variant_invalid(self) -> None:
+        """Test that a game cannot be created with too many holes or colors, or too few colors."""
+
+        login_data = {
+            'username': self.testuser1game.username,
+            'password': self.password
+        }
+        login_response = self.client.post(self.user_login_url, login_data, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + login_response.data['token'])
+        for data in [{'number_of_holes': 13}, {'number_of_colors': 21}, {'number_of_colors': 1}, {'number_of_moves': 0}]:
+            response = self.client.post(self.game_create_url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Game.objects.count(), 1)
+
     def test_game_details_success(self) -> None:
         """Test that a user is able to get a game that is theirs."""
 
@@ -100,6 +162,71 @@ class GamesTest(APITestCase):
         self.assertTrue('moves' in response.data)
         self.assertFalse('code' in response.data)
 
+    def test_game_details_success_not_modified(self) -> None:
+        """Test that getting a game takes a fixed number of queries and is not sent again while unchanged."""
+
+        Move.objects.create(game=self.game1, code=["blue", "blue", "blue", "purple"], result=[])
+        Move.objects.create(game=self.game1, code=["red", "blue", "blue", "purple"], result=["black"])
+        self.game1.moves_played = 2
+        self.game1.save()
+        login_data = {
+            'username': self.testuser1game.username,
+            'password': self.password
+        }
+        login_response = self.client.post(self.user_login_url, login_data, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + login_response.data['token'])
+        # auth token, game and moves
+        with self.assertNumQueries(3):
+            response = self.client.get(self.game_details_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['moves']), 2)
+        etag = response['ETag']
+
+        # game without the moves, the auth token is cached since the previous request
+        with self.assertNumQueries(1):
+            response = self.client.get(self.game_details_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        # a new move changes the game's etag
+        self.game1.moves_played = 3
+        self.game1.save()
+        response = self.client.get(self.game_details_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_game_details_success_since(self) -> None:
+        """Test that a user is able to get only the moves played after the moves they already have."""
+
+        codes = [["blue", "blue", "blue", "purple"], ["red", "blue", "blue", "purple"], ["red", "orange", "blue", "purple"]]
+        for code in codes:
+            Move.objects.create(game=self.game1, code=code, result=Move.get_result(self.game1.code, code))
+        self.game1.moves_played = 3
+        self.game1.save()
+        login_data = {
+            'username': self.testuser1game.username,
+            'password': self.password
+        }
+        login_response = self.client.post(self.user_login_url, login_data, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + login_response.data['token'])
+        response = self.client.get(self.game_details_url, {'since': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['moves_played'], 3)
+        self.assertEqual(response.data['status'], 'in_progress')
+        self.assertEqual([move['code'] for move in response.data['moves']], codes[1:])
+        self.assertEqual(response.data['moves'][1]['result'], ["black", "black"])
+
+        # game without the moves when the client has all of them, the auth token is cached
+        with self.assertNumQueries(1):
+            response = self.client.get(self.game_details_url, {'since': 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['moves'], [])
+
+        for since in [-1, '²']:
+            response = self.client.get(self.game_details_url, {'since': since})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_game_details_fail_not_owner(self) -> None:
         """Test that a user is not able to get a game that is not theirs."""
 
@@ -120,6 +247,87 @@ class GamesTest(APITestCase):
         self.assertEqual(Game.objects.count(), 1)
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_game_bulk_details_success(self) -> None:
+        """Test that a user gets several of their games with their moves in a fixed number of queries."""
+
+        games = [self.game1] + [
+            Game.objects.create(number_of_moves=12, codebreaker=self.testuser1game, code=["red", "red", "red", "red"]) for _ in range(3)
+        ]
+        for index, game in enumerate(games):
+            for _ in range(index):
+                Move.objects.create(game=game, code=["red", "orange", "red", "orange"], result=["black", "black"])
+            Game.objects.filter(pk=game.pk).update(moves_played=index)
+        other = Game.objects.create(number_of_moves=12, codebreaker=self.testuser2game, code=["red", "red", "red", "red"])
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.testuser1game).key)
+        url = reverse('game-bulk-details')
+        ids = [games[2].id, other.id, games[0].id, games[3].id, 999999, games[1].id]
+        # cache the token, then the games and their moves are two queries however many are asked for
+        self.client.get(url, {'ids': str(games[0].id)})
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'ids': ','.join(str(game_id) for game_id in ids)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([game['id'] for game in response.data['games']], [games[2].id, games[0].id, games[3].id, games[1].id])
+        self.assertEqual(response.data['missing'], [other.id, 999999])
+        for game in response.data['games']:
+            self.assertEqual(len(game['moves']), game['moves_played'])
+            self.assertTrue('color_choices' in game)
+            self.assertFalse('code' in game)
+        self.assertEqual(response.data['games'][0]['moves'][0]['code'], ["red", "orange", "red", "orange"])
+        self.assertEqual(response.data['games'][0]['moves'][0]['result'], ["black", "black"])
+
+    def test_game_bulk_details_fail(self) -> None:
+        """Test that the ids must be a short list of numbers and the user must be logged in."""
+
+        url = reverse('game-bulk-details')
+        response = self.client.get(url, {'ids': '1'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.testuser1game).key)
+        for ids in ['', '1,a', '²', ','.join(str(game_id) for game_id in range(101))]:
+            response = self.client.get(url, {'ids': ids})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_game_list_success(self) -> None:
+        """Test that a user lists their own games newest first, a page at a time."""
+
+        games = [self.game1] + [
+            Game.objects.create(number_of_moves=12, codebreaker=self.testuser1game, code=["red", "red", "red", "red"]) for _ in range(4)
+        ]
+        Game.objects.create(number_of_moves=12, codebreaker=self.testuser2game, code=["red", "red", "red", "red"])
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.testuser1game).key)
+        # cache the token so each page is a single keyset query
+        self.client.get(self.game_create_url)
+        listed = []
+        url = self.game_create_url + '?page_size=2'
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 2)
+            listed += [game['id'] for game in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(listed, [game.id for game in reversed(games)])
+        self.assertFalse('moves' in response.data['results'][0])
+        self.assertFalse('code' in response.data['results'][0])
+
+    def test_game_list_status(self) -> None:
+        """Test that the listed games can be filtered by status."""
+
+        won = Game.objects.create(number_of_moves=12, codebreaker=self.testuser1game, code=["red", "red", "red", "red"], status=Game.STATUS_WON)
+        lost = Game.objects.create(number_of_moves=12, codebreaker=self.testuser1game, code=["red", "red", "red", "red"], status=Game.STATUS_LOST)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.testuser1game).key)
+        for query, expected in [('won', [won]), ('in_progress', [self.game1]), ('won,lost', [lost, won])]:
+            response = self.client.get(self.game_create_url, {'status': query})
+            self.assertEqual([game['id'] for game in response.data['results']], [game.id for game in expected])
+            self.assertTrue(all(game['status'] in query for game in response.data['results']))
+        response = self.client.get(self.game_create_url, {'status': 'finished'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_game_list_fail_not_logged_in(self) -> None:
+        """Test that games cannot be listed when not logged in."""
+
+        response = self.client.get(self.game_create_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
 
 
 class MovesTest(APITestCase):
@@ -228,6 +436,91 @@ class MovesTest(APITestCase):
         self.assertEqual(Move.objects.count(), 7)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_move_create_success_packed(self) -> None:
+        """Test that moves are stored packed and returned as color names."""
+
+        data = {"game": self.game1.id, "code": ["green", "red", "orange", "green"]}
+        login_data = {
+            'username': self.testuser1game.username,
+            'password': self.password
+        }
+        login_response = self.client.post(self.user_login_url, login_data, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + login_response.data['token'])
+        response = self.client.post(self.move_create_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['code'], data['code'])
+        self.assertEqual(response.data['result'], ["black", "white", "white"])
+        move = Move.objects.get()
+        self.assertEqual(move.packed_code, 3 * 216 + 0 * 36 + 1 * 6 + 3)
+        self.assertEqual((move.blacks, move.whites), (1, 2))
+        game = Game.objects.get()
+        self.assertEqual(game.packed_code, 0 * 216 + 1 * 36 + 2 * 6 + 3)
+        self.assertEqual(game.unpack_code(game.packed_code), ["red", "orange", "yellow", "green"])
+
+    def test_move_create_game_state(self) -> None:
+        """Test that the game's moves played and status are kept up to date without counting moves."""
+
+        login_data = {
+            'username': self.testuser1game.username,
+            'password': self.password
+        }
+        login_response = self.client.post(self.user_login_url, login_data, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + login_response.data['token'])
+        data = {"game": self.game1.id, "code": ["blue", "blue", "blue", "purple"]}
+        self.client.post(self.move_create_url, data, format='json')
+        self.game1.refresh_from_db()
+        self.assertEqual(self.game1.moves_played, 1)
+        self.assertEqual(self.game1.status, Game.STATUS_IN_PROGRESS)
+        # game, then the game update inserting and notifying the move and stats upsert of the winning move in a savepoint,
+            # none of them counting the game's moves, the auth token is cached since the previous request
+        with self.assertNumQueries(5):
+            data = {"game": self.game1.id, "code": ["red", "orange", "yellow", "green"]}
+            response = self.client.post(self.move_create_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.game1.refresh_from_db()
+        self.assertEqual(self.game1.moves_played, 2)
+        self.assertEqual(self.game1.status, Game.STATUS_WON)
+
+        game2 = Game.objects.create(number_of_moves=2, codebreaker=self.testuser1game, code=["red", "orange", "yellow", "green"])
+        data = {"game": game2.id, "code": ["blue", "blue", "blue", "purple"]}
+        self.client.post(self.move_create_url, data, format='json')
+        self.client.post(self.move_create_url, data, format='json')
+        game2.refresh_from_db()
+        self.assertEqual(game2.moves_played, 2)
+        self.assertEqual(game2.status, Game.STATUS_LOST)
+        response = self.client.post(self.move_create_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_move_create_success_variant(self) -> None:
+        """Test that moves are validated and scored with their game's own number of holes and colors."""
+
+        game = Game.objects.create(
+            number_of_moves=20, number_of_holes=6, number_of_colors=8, codebreaker=self.testuser1game,
+            code=["pink", "brown", "red", "red", "orange", "pink"]
+        )
+        login_data = {
+            'username': self.testuser1game.username,
+            'password': self.password
+        }
+        login_response = self.client.post(self.user_login_url, login_data, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + login_response.data['token'])
+        data = {"game": game.id, "code": ["red", "brown", "pink", "red", "purple", "pink"]}
+        response = self.client.post(self.move_create_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['code'], data['code'])
+        self.assertEqual(response.data['result'], ["black", "black", "black", "white", "white"])
+
+        # the move must have the game's number of holes and only use the game's colors
+        for code in [["red", "brown", "pink", "red"], ["red", "brown", "pink", "red", "purple", "cyan"]]:
+            response = self.client.post(self.move_create_url, {"game": game.id, "code": code}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        data = {"game": game.id, "code": ["pink", "brown", "red", "red", "orange", "pink"]}
+        response = self.client.post(self.move_create_url, data, format='json')
+        self.assertEqual(response.data['result'], ["black"] * 6)
+        game.refresh_from_db()
+        self.assertEqual(game.status, Game.STATUS_WON)
+
     def test_move_create_success_lost(self) -> None:
         """Test that moves are able to be successfully created with expected results."""
 
@@ -429,3 +722,1315 @@ class MovesTest(APITestCase):
         self.assertEqual(Game.objects.count(), 1)
         self.assertEqual(Move.objects.count(), 0)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+    def test_move_batch_create_success_won(self) -> None:
+        """Test that a batch of moves is created in order and stops at the winning move."""
+
+        data = {
+            "game": self.game1.id,
+            "codes": [
+                ["blue", "blue", "blue", "purple"],
+                ["red", "orange", "green", "yellow"],
+                ["red", "orange", "yellow", "green"],
+                ["red", "red", "red", "red"]
+            ]
+        }
+        login_data = {
+            'username': self.testuser1game.username,
+            'password': self.password
+        }
+        login_response = self.client.post(self.user_login_url, login_data, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + login_response.data['token'])
+        response = self.client.post(reverse('move-batch-create'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Move.objects.count(), 3)
+        self.assertEqual(response.data['game'], self.game1.id)
+        self.assertEqual(response.data['moves_played'], 3)
+        self.assertEqual(response.data['status'], 'won')
+        self.assertEqual([move['code'] for move in response.data['moves']], data['codes'][:3])
+        self.assertEqual([move['result'] for move in response.data['moves']], [[], ["black", "black", "white", "white"], ["black", "black", "black", "black"]])
+        self.assertEqual(list(Move.objects.order_by('id').values_list('id', flat=True)), [move['id'] for move in response.data['moves']])
+
+        # user cannot create more moves once the game is won
+        response = self.client.post(reverse('move-batch-create'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Move.objects.count(), 3)
+
+    def test_move_batch_create_success_lost(self) -> None:
+        """Test that a batch of moves stops when the game runs out of moves."""
+
+        data = {"game": self.game1.id, "codes": [["blue", "blue", "blue", "purple"]] * (Game.NUMBER_OF_MOVES + 3)}
+        login_data = {
+            'username': self.testuser1game.username,
+            'password': self.password
+        }
+        login_response = self.client.post(self.user_login_url, login_data, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + login_response.data['token'])
+        response = self.client.post(reverse('move-batch-create'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Move.objects.count(), Game.NUMBER_OF_MOVES)
+        self.assertEqual(len(response.data['moves']), Game.NUMBER_OF_MOVES)
+        self.assertEqual(response.data['status'], 'lost')
+        self.game1.refresh_from_db()
+        self.assertEqual(self.game1.moves_played, Game.NUMBER_OF_MOVES)
+
+    def test_move_batch_create_fail(self) -> None:
+        """Test that a batch of moves isn't created for an invalid code or a game that isn't the user's."""
+
+        data = {"game": self.game1.id, "codes": [["blue", "blue", "blue", "purple"], ["blue", "blue", "blue", "pink"]]}
+        login_data = {
+            'username': self.testuser1game.username,
+            'password': self.password
+        }
+        login_response = self.client.post(self.user_login_url, login_data, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + login_response.data['token'])
+        response = self.client.post(reverse('move-batch-create'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Move.objects.count(), 0)
+
+        login_data['username'] = self.testuser2game.username
+        login_response = self.client.post(self.user_login_url, login_data, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + login_response.data['token'])
+        data = {"game": self.game1.id, "codes": [["blue", "blue", "blue", "purple"]]}
+        response = self.client.post(reverse('move-batch-create'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(Move.objects.count(), 0)
+
+
+
+class StatsTest(APITestCase):
+    """Class to test user stats and the leaderboard."""
+
+    def setUp(self) -> None:
+        """Initial set up for testing stats."""
+        self.testuser1game = User.objects.create_user('testuser1game', 'testuser1game@test.com', 'password1234')
+        self.testuser2game = User.objects.create_user('testuser2game', 'testuser2game@test.com', 'password1234')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.testuser1game).key)
+
+    @override_settings(SOLVER_WORKERS=0)
+    def test_player_stats(self) -> None:
+        """Test that games are counted in their codebreaker's stats as they end."""
+
+        code = ["red", "orange", "yellow", "green"]
+        won = Game.objects.create(number_of_moves=12, codebreaker=self.testuser1game, code=code)
+        for move_code in [["blue", "blue", "blue", "blue"], code]:
+            self.client.post(reverse('move-create'), {"game": won.id, "code": move_code}, format='json')
+        lost = Game.objects.create(number_of_moves=1, codebreaker=self.testuser1game, code=code)
+        self.client.post(reverse('move-create'), {"game": lost.id, "code": ["blue", "blue", "blue", "blue"]}, format='json')
+        batch = Game.objects.create(number_of_moves=12, codebreaker=self.testuser1game, code=code)
+        self.client.post(reverse('move-batch-create'), {"game": batch.id, "codes": [code]}, format='json')
+        Game.objects.create(number_of_moves=12, codebreaker=self.testuser1game, code=code)
+        # games the server plays aren't counted
+        self.client.post(reverse('game-solve'), {"code": code}, format='json')
+
+        url = reverse('player-stats', kwargs={'pk': self.testuser1game.id})
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['username'], 'testuser1game')
+        self.assertEqual(response.data['games_played'], 3)
+        self.assertEqual(response.data['games_won'], 2)
+        self.assertAlmostEqual(response.data['win_rate'], 2 / 3)
+        self.assertEqual(response.data['average_moves_to_win'], 1.5)
+        self.assertEqual(response.data['moves_to_win_histogram'], {'1': 1, '2': 1})
+
+        response = self.client.get(reverse('player-stats', kwargs={'pk': self.testuser2game.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['games_played'], 0)
+        self.assertIsNone(response.data['win_rate'])
+        self.assertEqual(response.data['moves_to_win_histogram'], {})
+        response = self.client.get(reverse('player-stats', kwargs={'pk': 999999}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_leaderboard(self) -> None:
+        """Test that the leaderboard ranks the most games won first, then the fewest moves to win them."""
+
+        testuser3game = User.objects.create_user('testuser3game', 'testuser3game@test.com', 'password1234')
+        testuser4game = User.objects.create_user('testuser4game', 'testuser4game@test.com', 'password1234')
+        PlayerStats.objects.create(user=self.testuser1game, games_played=5, games_won=2, total_moves_to_win=10)
+        PlayerStats.objects.create(user=self.testuser2game, games_played=3, games_won=3, total_moves_to_win=15)
+        PlayerStats.objects.create(user=testuser3game, games_played=2, games_won=2, total_moves_to_win=8)
+        PlayerStats.objects.create(user=testuser4game, games_played=4, games_won=0, total_moves_to_win=0)
+        url = reverse('leaderboard')
+        # cache the token, then the leaderboard is a single query
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual([row['username'] for row in response.data['leaderboard']], ['testuser2game', 'testuser3game', 'testuser1game'])
+        response = self.client.get(url, {'limit': 2})
+        self.assertEqual(len(response.data['leaderboard']), 2)
+        for limit in [0, '²']:
+            response = self.client.get(url, {'limit': limit})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+
+class HintTest(APITestCase):
+    """Class to test game hints."""
+
+    def setUp(self) -> None:
+        """Initial set up for testing game hints."""
+        self.testuser1game = User.objects.create_user('testuser1game', 'testuser1game@test.com', 'password1234')
+        self.testuser2game = User.objects.create_user('testuser2game', 'testuser2game@test.com', 'password1234')
+        self.game1 = Game.objects.create(number_of_moves=12, codebreaker=self.testuser1game, code=["red", "orange", "yellow", "green"])
+        self.game_hint_url = reverse('game-hint', kwargs={'pk': self.game1.id})
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.testuser1game).key)
+
+    def count_consistent_codes(self, game: Game) -> int:
+        """Count the codes consistent with the game's moves the slow way to compare against."""
+        moves = list(game.moves.all())
+        return sum(
+            1 for code in itertools.product(game.color_choices, repeat=game.number_of_holes)
+            if all(Move.get_result(list(code), move.code, game.color_choices) == move.result for move in moves)
+        )
+
+    def test_game_hint_success(self) -> None:
+        """Test that a hint counts the remaining codes and its candidates are narrowed by each new move."""
+
+        response = self.client.get(self.game_hint_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['remaining_codes'], 1296)
+
+        for code in [["blue", "blue", "orange", "red"], ["green", "red", "orange", "orange"]]:
+            self.client.post(reverse('move-create'), {"game": self.game1.id, "code": code}, format='json')
+            # the move narrows the candidates without waiting for the next hint
+            self.game1.refresh_from_db()
+            self.assertEqual(self.game1.candidates_moves, self.game1.moves_played)
+        response = self.client.get(self.game_hint_url, {'suggest': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['remaining_codes'], self.count_consistent_codes(self.game1))
+        suggestion = response.data['suggestion']
+        self.assertEqual(len(suggestion), 4)
+
+        # a suggested move keeps narrowing the candidates until the code is found
+        while self.game1.status == Game.STATUS_IN_PROGRESS:
+            self.client.post(reverse('move-create'), {"game": self.game1.id, "code": suggestion}, format='json')
+            self.game1.refresh_from_db()
+            suggestion = self.client.get(self.game_hint_url, {'suggest': 1}).data['suggestion']
+        self.assertEqual(self.game1.status, Game.STATUS_WON)
+        self.assertLessEqual(self.game1.moves_played, 8)
+        self.assertEqual(self.client.get(self.game_hint_url).data['remaining_codes'], 1)
+
+    def test_game_hint_suggest_boolean(self) -> None:
+        """Test that a suggestion is only made when suggest is true, and that suggest must be a boolean."""
+
+        for value in ['0', 'false', 'False', 'off']:
+            response = self.client.get(self.game_hint_url, {'suggest': value})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('suggestion', response.data)
+        for value in ['1', 'true', 'yes']:
+            self.assertIn('suggestion', self.client.get(self.game_hint_url, {'suggest': value}).data)
+        response = self.client.get(self.game_hint_url, {'suggest': 'maybe'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_candidate_bitset(self) -> None:
+        """Test that clearing the bits of ruled out codes leaves the bitset of the remaining codes."""
+
+        codes = candidates.all_candidates(3, 5)
+        data = candidates.to_bytes(codes, 3, 5)
+        self.assertEqual(list(candidates.from_bytes(data, 3, 5)), list(codes))
+        remaining = codes[(codes % 3 == 0) | (codes > 120)]
+        data = candidates.clear_bits(data, np.setdiff1d(codes, remaining))
+        self.assertEqual(data, candidates.to_bytes(remaining, 3, 5))
+        self.assertEqual(list(candidates.from_bytes(data, 3, 5)), list(remaining))
+        self.assertEqual(len(candidates.from_bytes(candidates.clear_bits(data, remaining), 3, 5)), 0)
+
+    def test_game_hint_catches_up(self) -> None:
+        """Test that a hint narrows the candidates by moves which were recorded without narrowing them."""
+
+        self.client.get(self.game_hint_url)
+        Move.objects.create(game=self.game1, code=["red", "red", "yellow", "yellow"], result=["black", "black"])
+        Game.objects.filter(pk=self.game1.id).update(moves_played=1)
+        response = self.client.get(self.game_hint_url)
+        self.assertEqual(response.data['remaining_codes'], self.count_consistent_codes(self.game1))
+
+    def test_game_hint_fail(self) -> None:
+        """Test that a hint isn't given for a game that isn't the user's or has too many possible codes."""
+
+        game = Game.objects.create(number_of_moves=12, number_of_holes=12, number_of_colors=20, codebreaker=self.testuser1game, code=["red"] * 12)
+        response = self.client.get(reverse('game-hint', kwargs={'pk': game.id}))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.testuser2game).key)
+        response = self.client.get(self.game_hint_url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.game1.refresh_from_db()
+        self.assertIsNone(self.game1.candidates)
+        response = self.client.get(reverse('game-hint', kwargs={'pk': 999999}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+
+@override_settings(SOLVER_WORKERS=0)
+class SolverTest(APITestCase):
+    """Class to test games played by the server."""
+
+    def setUp(self) -> None:
+        """Initial set up for testing games played by the server."""
+        self.testuser1game = User.objects.create_user('testuser1game', 'testuser1game@test.com', 'password1234')
+        self.game_solve_url = reverse('game-solve')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.testuser1game).key)
+
+    def test_game_solve_success(self) -> None:
+        """Test that the server wins a game against the user's code within Knuth's five guesses."""
+
+        for strategy in solver.STRATEGIES:
+            response = self.client.post(self.game_solve_url, {"code": ["purple", "red", "red", "blue"], "strategy": strategy}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(response.data['mode'], 'codemaker')
+            self.assertEqual(response.data['status'], 'won')
+            self.assertLessEqual(response.data['moves_played'], 5)
+            self.assertEqual(len(response.data['moves']), response.data['moves_played'])
+            self.assertEqual(response.data['moves'][-1]['code'], ["purple", "red", "red", "blue"])
+            self.assertFalse('code' in response.data)
+        game = Game.objects.get(pk=response.data['id'])
+        self.assertEqual(game.codebreaker, self.testuser1game)
+        # the user can't play moves in the game the server has played
+        response = self.client.post(reverse('move-create'), {"game": game.id, "code": ["red", "red", "red", "red"]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_game_solve_fail(self) -> None:
+        """Test that the server only plays valid codes of games with few enough possible codes."""
+
+        for data in [
+            {},
+            {"code": ["red", "red", "red"]},
+            {"code": ["red", "red", "red", "cyan"]},
+            {"code": ["red", "red", "red", "red"], "strategy": "guess"},
+            {"code": ["red"] * 8, "number_of_holes": 8, "number_of_colors": 8}
+        ]:
+            response = self.client.post(self.game_solve_url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.credentials()
+        response = self.client.post(self.game_solve_url, {"code": ["red", "red", "red", "red"]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(Game.objects.count(), 0)
+
+    def test_choose_guess(self) -> None:
+        """Test that the guess search finds Knuth's opening in parallel, and falls back to the first candidate without a budget left."""
+
+        codes = candidates.all_candidates(4, 6)
+        # red red orange orange
+        self.assertEqual(solver.choose_guess(codes, 4, 6), 7)
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            self.assertEqual(solver.choose_guess(codes, 4, 6, pool=pool), 7)
+        self.assertEqual(solver.choose_guess(codes, 4, 6, budget=0), 0)
+        moves = solver.play(1295, 4, 6, 12, budget=0)
+        self.assertEqual(moves[0], (0, 0, 0))
+        self.assertEqual(moves[-1], (1295, 4, 0))
+
+    def test_game_budget(self) -> None:
+        """Test that once a game's budget runs out its moves play the first code still possible, still winning the game."""
+
+        moves = solver.play(1295, 4, 6, 12, budget=2, game_budget=0)
+        self.assertEqual(moves[0], (0, 0, 0))
+        self.assertEqual(moves[-1], (1295, 4, 0))
+        with override_settings(SOLVER_GAME_BUDGET=0):
+            response = self.client.post(self.game_solve_url, {"code": ["purple", "red", "red", "blue"]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['status'], 'won')
+        self.assertEqual(response.data['moves'][0]['code'], ["red", "red", "red", "red"])
+        self.assertEqual(response.data['moves'][-1]['code'], ["purple", "red", "red", "blue"])
+
+    def test_choose_guess_stops_at_deadline(self) -> None:
+        """Test that a search giving up leaves no work behind on the pool, whose processes are spawned."""
+
+        self.assertIsNone(solver.search_chunk(np.arange(1296), np.arange(1296), 4, 6, deadline=time.time()))
+        with override_settings(SOLVER_WORKERS=2), mock.patch.object(solver, '_pool', None):
+            pool = solver.get_pool()
+            self.addCleanup(pool.shutdown)
+            self.assertEqual(pool._mp_context.get_start_method(), 'spawn')
+            # start the processes, so the search below isn't spent spawning them
+            pool.submit(int, 0).result()
+            codes = candidates.all_candidates(6, 9)
+            guess = solver.choose_guess(codes, 6, 9, budget=0.2, pool=pool, rng=np.random.default_rng(0))
+            self.assertIn(guess, codes)
+            # the chunks still running when the search gave up stop at its deadline rather than holding the processes
+            start = time.monotonic()
+            pool.submit(int, 0).result()
+            pool.submit(int, 0).result()
+            self.assertLess(time.monotonic() - start, 1)
+
+
+
+class ExportTest(APITestCase):
+    """Class to test streaming exports of games and moves."""
+
+    def setUp(self) -> None:
+        """Initial set up for testing exports."""
+        self.admin = User.objects.create_user('admin', 'admin@test.com', 'password1234', is_staff=True)
+        self.testuser1game = User.objects.create_user('testuser1game', 'testuser1game@test.com', 'password1234')
+        self.games = [
+            Game.objects.create(number_of_moves=12, codebreaker=user, code=["red", "orange", "yellow", "green"])
+            for user in [self.testuser1game, self.admin, self.testuser1game]
+        ]
+        self.moves = [
+            Move.objects.create(game=game, code=["red", "red", "blue", "blue"], result=["black"]) for game in self.games
+        ]
+        self.export_url = reverse('export')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.admin).key)
+
+    def get_lines(self, data: Dict) -> List:
+        """Return the lines of a streamed export."""
+        # fetch a couple of rows at a time from the cursor
+        with mock.patch.object(export, 'CHUNK_SIZE', 2):
+            response = self.client.get(self.export_url, data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_export_games(self) -> None:
+        """Test that games are streamed as NDJSON, narrowed by id range and user."""
+
+        rows = [json.loads(line) for line in self.get_lines({})]
+        self.assertEqual([row['id'] for row in rows], [game.id for game in self.games])
+        self.assertEqual(rows[0]['code'], ["red", "orange", "yellow", "green"])
+        self.assertEqual(rows[0]['status'], 'in_progress')
+        self.assertEqual(rows[0]['codebreaker'], self.testuser1game.id)
+        rows = [json.loads(line) for line in self.get_lines({'min_id': self.games[1].id, 'user': self.testuser1game.id})]
+        self.assertEqual([row['id'] for row in rows], [self.games[2].id])
+        rows = [json.loads(line) for line in self.get_lines({'max_id': self.games[1].id})]
+        self.assertEqual([row['id'] for row in rows], [self.games[0].id, self.games[1].id])
+
+    def test_export_moves_csv(self) -> None:
+        """Test that moves are streamed as CSV with a header."""
+
+        rows = list(csv.DictReader(self.get_lines({'table': 'moves', 'output': 'csv', 'user': self.testuser1game.id})))
+        self.assertEqual([int(row['id']) for row in rows], [self.moves[0].id, self.moves[2].id])
+        self.assertEqual(rows[0]['code'], 'red red blue blue')
+        self.assertEqual(rows[0]['game'], str(self.games[0].id))
+        self.assertEqual((rows[0]['blacks'], rows[0]['whites']), ('1', '0'))
+
+    def test_export_fail(self) -> None:
+        """Test that only admin users can export and the parameters are checked."""
+
+        for data in [{'table': 'users'}, {'output': 'xml'}, {'min_id': '-1'}, {'max_id': '²'}, {'user': 'admin'}]:
+            response = self.client.get(self.export_url, data)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.testuser1game).key)
+        response = self.client.get(self.export_url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+
+@override_settings(GAME_MOVE_STORAGE=Game.MOVE_STORAGE_INLINE, SOLVER_WORKERS=0)
+class InlineMovesTest(APITestCase):
+    """Class to test games storing their moves inline on their own row."""
+
+    def setUp(self) -> None:
+        """Initial set up for testing inline moves."""
+        self.testuser1game = User.objects.create_user('testuser1game', 'testuser1game@test.com', 'password1234', is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.testuser1game).key)
+        response = self.client.post(reverse('game-create'), {}, format='json')
+        self.game = Game.objects.get(pk=response.data['id'])
+        self.game.code = ["red", "orange", "yellow", "green"]
+        self.game.save()
+        self.game_details_url = reverse('game-details', kwargs={'pk': self.game.id})
+
+    def test_encode_move(self) -> None:
+        """Test that a move is packed into one integer and back."""
+
+        for holes, move in [(4, (1295, 4, 0)), (4, (0, 0, 0)), (12, (20 ** 12 - 1, 11, 1))]:
+            self.assertEqual(Game.decode_move(Game.encode_move(*move, holes), holes), move)
+
+    def test_inline_moves(self) -> None:
+        """Test that moves are appended to the game's row by the claim and read back with the same API shape."""
+
+        self.assertEqual(self.game.inline_moves, [])
+        # game, then the game update appending and notifying the move in a savepoint
+        with self.assertNumQueries(4):
+            response = self.client.post(reverse('move-create'), {"game": self.game.id, "code": ["red", "red", "blue", "blue"]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {'id': None, 'game': self.game.id, 'code': ["red", "red", "blue", "blue"], 'result': ["black"]})
+        response = self.client.post(reverse('move-batch-create'), {
+            "game": self.game.id, "codes": [["orange", "red", "blue", "blue"], ["red", "orange", "yellow", "green"], ["red"] * 4]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['status'], 'won')
+        self.assertEqual(len(response.data['moves']), 2)
+        self.assertEqual(Move.objects.count(), 0)
+
+        # the game's row holds its moves
+        with self.assertNumQueries(1):
+            response = self.client.get(self.game_details_url)
+        self.assertEqual(response.data['moves_played'], 3)
+        self.assertEqual([move['result'] for move in response.data['moves']], [["black"], ["white", "white"], ["black"] * 4])
+        self.assertEqual(response.data['moves'][1]['code'], ["orange", "red", "blue", "blue"])
+        response = self.client.get(self.game_details_url, {'since': 2})
+        self.assertEqual([move['code'] for move in response.data['moves']], [["red", "orange", "yellow", "green"]])
+        stats = PlayerStats.objects.get(user=self.testuser1game)
+        self.assertEqual((stats.games_won, stats.total_moves_to_win), (1, 3))
+
+    def test_inline_hint_and_export(self) -> None:
+        """Test that hints and exports read inline moves."""
+
+        self.client.post(reverse('move-create'), {"game": self.game.id, "code": ["blue", "blue", "orange", "red"]}, format='json')
+        response = self.client.get(reverse('game-hint', kwargs={'pk': self.game.id}), {'suggest': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        result = Move.get_result(self.game.code, ["blue", "blue", "orange", "red"], self.game.color_choices)
+        remaining = sum(1 for code in itertools.product(self.game.color_choices, repeat=4) if Move.get_result(list(code), ["blue", "blue", "orange", "red"], self.game.color_choices) == result)
+        self.assertEqual(response.data['remaining_codes'], remaining)
+        self.client.post(reverse('move-create'), {"game": self.game.id, "code": response.data['suggestion']}, format='json')
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.candidates_moves, 2)
+        lines = b''.join(self.client.get(reverse('export'), {'table': 'moves'}).streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([(row['id'], row['game']) for row in rows], [(None, self.game.id)] * 2)
+        self.assertEqual(rows[0]['code'], ["blue", "blue", "orange", "red"])
+
+    def test_inline_solve(self) -> None:
+        """Test that a game played by the server stores its moves inline."""
+
+        response = self.client.post(reverse('game-solve'), {"code": ["purple", "red", "red", "blue"]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        game = Game.objects.get(pk=response.data['id'])
+        self.assertEqual(len(game.inline_moves), response.data['moves_played'])
+        self.assertEqual(self.client.get(reverse('game-details', kwargs={'pk': game.id})).data['moves'], response.data['moves'])
+        self.assertEqual(Move.objects.count(), 0)
+
+    def test_convert_move_storage(self) -> None:
+        """Test that finished games are converted to Move rows and back, leaving games in progress alone."""
+
+        self.client.post(reverse('move-batch-create'), {"game": self.game.id, "codes": [["red", "red", "blue", "blue"], ["red", "orange", "yellow", "green"]]}, format='json')
+        response = self.client.post(reverse('game-create'), {}, format='json')
+        playing = Game.objects.get(pk=response.data['id'])
+        self.client.post(reverse('move-create'), {"game": playing.id, "code": ["red", "red", "blue", "blue"]}, format='json')
+        moves = self.client.get(self.game_details_url).data['moves']
+
+        call_command('convert_move_storage', '--to', 'rows', '--batch-size', '1', stdout=StringIO())
+        self.game.refresh_from_db()
+        playing.refresh_from_db()
+        self.assertIsNone(self.game.inline_moves)
+        self.assertEqual(len(playing.inline_moves), 1)
+        self.assertEqual(Move.objects.filter(game=self.game).count(), 2)
+        rows = self.client.get(self.game_details_url).data['moves']
+        self.assertEqual([(move['code'], move['result']) for move in rows], [(move['code'], move['result']) for move in moves])
+        self.assertIsNotNone(rows[0]['id'])
+
+        call_command('convert_move_storage', '--to', 'inline', stdout=StringIO())
+        self.game.refresh_from_db()
+        self.assertEqual(len(self.game.inline_moves), 2)
+        self.assertEqual(Move.objects.count(), 0)
+        self.assertEqual(self.client.get(self.game_details_url).data['moves'], moves)
+
+
+
+class GameStateCacheTest(APITestCase):
+    """Class to test the cache of games' states written through by moves."""
+
+    def setUp(self) -> None:
+        """Initial set up for testing the game state cache."""
+        game_cache.get_cache().clear()
+        self.testuser1game = User.objects.create_user('testuser1game', 'testuser1game@test.com', 'password1234')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.testuser1game).key)
+        # the game's state is cached once its creation commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.game = Game.objects.create(number_of_moves=3, codebreaker=self.testuser1game, code=["red", "orange", "yellow", "green"])
+
+    def post_move(self, code: List) -> Dict:
+        """Post a move for the game, running the callbacks of its commit."""
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('move-create'), {"game": self.game.id, "code": code}, format='json')
+
+    def test_move_writes_through(self) -> None:
+        """Test that a move doesn't read its game, and that the cached state follows the moves until the game is over."""
+
+        self.client.get(reverse('game-create'))
+        # the game update inserting and notifying the move in a savepoint, the auth token is cached
+        with self.assertNumQueries(3):
+            response = self.post_move(["red", "red", "red", "red"])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['id'], Move.objects.get(game=self.game).id)
+        self.assertEqual(game_cache.get_game(self.game.id).moves_played, 1)
+        self.assertEqual(self.post_move(["red", "orange", "yellow", "green"]).status_code, status.HTTP_201_CREATED)
+        # the game is over, so it's evicted and the next move reads it
+        self.assertIsNone(game_cache.get_cache().get(game_cache.cache_key(self.game.id)))
+        response = self.post_move(["red", "orange", "yellow", "green"])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['non_field_errors'], ['Game already won.'])
+
+    def test_stale_game(self) -> None:
+        """Test that a move is played on the game's current state when the cached one is stale."""
+
+        # moves played by another process which doesn't share the cache
+        Game.objects.filter(pk=self.game.id).update(moves_played=2)
+        response = self.post_move(["red", "red", "red", "red"])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.game.refresh_from_db()
+        self.assertEqual((self.game.moves_played, self.game.status), (3, Game.STATUS_LOST))
+        # the game was lost meanwhile
+        Game.objects.filter(pk=self.game.id).update(moves_played=0, status=Game.STATUS_IN_PROGRESS)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('move-batch-create'), {"game": self.game.id, "codes": [["red"] * 4, ["blue"] * 4, ["green"] * 4]}, format='json')
+        self.game.refresh_from_db()
+        self.assertEqual((self.game.moves_played, self.game.status), (3, Game.STATUS_LOST))
+        self.assertIsNone(game_cache.get_cache().get(game_cache.cache_key(self.game.id)))
+
+    def test_hint_cached(self) -> None:
+        """Test that moves narrow the candidates of a cached game once a hint has been asked for."""
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('game-hint', kwargs={'pk': self.game.id}))
+        self.assertTrue(game_cache.get_game(self.game.id).has_candidates)
+        self.post_move(["red", "red", "red", "red"])
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.candidates_moves, 1)
+
+
+
+class MetricsTest(APITestCase):
+    """Class to test the request metrics."""
+
+    def test_metrics(self) -> None:
+        """Test that requests are recorded per URL name and exposed in the Prometheus text format."""
+
+        testuser = User.objects.create_user('testuser1game', 'testuser1game@test.com', 'password1234')
+        token = Token.objects.create(user=testuser)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        self.client.post(reverse('game-create'), None, format='json')
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        metrics = response.content.decode()
+        self.assertIn('mastermind_requests_total{method="POST",status="201",view="game-create"}', metrics)
+        for name in ['request_latency_seconds', 'db_queries', 'db_time_seconds', 'serializer_time_seconds', 'response_size_bytes']:
+            self.assertIn('mastermind_' + name + '_count{', metrics)
+        self.assertRegex(metrics, r'mastermind_db_queries_count\{view="game-create"\} [1-9]')
+        self.assertNotRegex(metrics, r'mastermind_serializer_time_seconds_sum\{view="game-create"\} 0\.0\n')
+
+    def test_metrics_allowed_networks(self) -> None:
+        """Test that only clients from the allowed networks can read the metrics."""
+
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.7')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        with override_settings(METRICS_ALLOWED_NETWORKS=['127.0.0.1', '203.0.113.0/24']):
+            response = self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.7')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            response = self.client.get(reverse('metrics'), REMOTE_ADDR='::1')
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+
+class MovesConcurrencyTest(APITransactionTestCase):
+    """Class to stress test move creation with many simultaneous requests for the same game."""
+
+    NUMBER_OF_CLIENTS = 16
+    MOVES_PER_CLIENT = 4
+
+    def setUp(self) -> None:
+        """Initial set up for stress testing move creation."""
+        self.testuser1game = User.objects.create_user('testuser1game', 'testuser1game@test.com', 'password1234')
+        self.token = Token.objects.create(user=self.testuser1game)
+        self.game1 = Game.objects.create(number_of_moves=12, codebreaker=self.testuser1game, code=["red", "orange", "yellow", "green"])
+        self.move_create_url = reverse('move-create')
+
+    def post_moves(self, barrier: threading.Barrier, codes: list) -> list:
+        """Post each code as a move from a new client once every client is ready, return the response status codes."""
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        try:
+            barrier.wait()
+            return [client.post(self.move_create_url, {"game": self.game1.id, "code": code}, format='json').status_code for code in codes]
+        finally:
+            # each thread has its own database connection
+            connection.close()
+
+    def run_clients(self, codes: list) -> list:
+        """Run every client at the same time, return all response status codes."""
+        barrier = threading.Barrier(self.NUMBER_OF_CLIENTS)
+        with ThreadPoolExecutor(max_workers=self.NUMBER_OF_CLIENTS) as executor:
+            futures = [executor.submit(self.post_moves, barrier, codes) for _ in range(self.NUMBER_OF_CLIENTS)]
+            return [status_code for future in futures for status_code in future.result()]
+
+    def test_move_create_concurrent_moves_limit(self) -> None:
+        """Test that concurrent moves can't play more than the game's number of moves."""
+
+        start = time.monotonic()
+        status_codes = self.run_clients([["blue", "blue", "blue", "purple"]] * self.MOVES_PER_CLIENT)
+        elapsed = time.monotonic() - start
+        self.assertEqual(status_codes.count(status.HTTP_201_CREATED), 12)
+        self.assertEqual(status_codes.count(status.HTTP_400_BAD_REQUEST), self.NUMBER_OF_CLIENTS * self.MOVES_PER_CLIENT - 12)
+        self.assertEqual(Move.objects.count(), 12)
+        self.game1.refresh_from_db()
+        self.assertEqual(self.game1.moves_played, 12)
+        self.assertEqual(self.game1.status, Game.STATUS_LOST)
+        # the requests only contend on the game row for the length of a short transaction
+        self.assertLess(elapsed, 30)
+
+    def test_move_create_concurrent_winning_moves(self) -> None:
+        """Test that no moves can be played after a concurrent winning move."""
+
+        status_codes = self.run_clients([["red", "orange", "yellow", "green"]] * self.MOVES_PER_CLIENT)
+        self.assertEqual(status_codes.count(status.HTTP_201_CREATED), 1)
+        self.assertEqual(Move.objects.count(), 1)
+        self.game1.refresh_from_db()
+        self.assertEqual(self.game1.moves_played, 1)
+        self.assertEqual(self.game1.status, Game.STATUS_WON)
+
+
+
+class EventsTest(APITransactionTestCase):
+    """Class to test streaming a game's moves as server-sent events, notified through the database."""
+
+    def setUp(self) -> None:
+        """Initial set up for testing game events."""
+        self.testuser1game = User.objects.create_user('testuser1game', 'testuser1game@test.com', 'password1234')
+        self.testuser2game = User.objects.create_user('testuser2game', 'testuser2game@test.com', 'password1234')
+        self.token = Token.objects.create(user=self.testuser1game)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.game1 = Game.objects.create(number_of_moves=12, codebreaker=self.testuser1game, code=["red", "orange", "yellow", "green"])
+        self.game_events_url = reverse('game-events', kwargs={'pk': self.game1.id})
+        # a notifier of the test's own, whose listener is stopped so the test database can be dropped
+        self.notifier = events.PostgresNotifier()
+        patcher = mock.patch.object(events, '_notifier', self.notifier)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.notifier.stop)
+
+    def post_move(self, code: list) -> int:
+        """Post a move to the game from another thread, return the response status code."""
+        try:
+            return self.client.post(reverse('move-create'), {"game": self.game1.id, "code": code}, format='json').status_code
+        finally:
+            connection.close()
+
+    @staticmethod
+    def parse_event(message: str) -> Dict:
+        """Return the id, event and data of a server-sent event."""
+        fields = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+        return {'id': int(fields['id']), 'event': fields['event'], 'data': json.loads(fields['data'])}
+
+    @mock.patch.object(events.PostgresNotifier, 'POLL_INTERVAL', 0.1)
+    async def test_game_events(self) -> None:
+        """Test that played moves are caught up on, then new moves are pushed until the game ends."""
+
+        await sync_to_async(self.post_move, thread_sensitive=False)(["blue", "blue", "blue", "blue"])
+        response = await self.async_client.get(self.game_events_url, headers={'Authorization': 'Token ' + self.token.key})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertTrue(self.notifier._listening['default'].is_set())
+        stream = aiter(response.streaming_content)
+
+        event = self.parse_event((await asyncio.wait_for(anext(stream), 10)).decode())
+        self.assertEqual(event['id'], 1)
+        self.assertEqual(event['event'], 'move')
+        self.assertEqual(event['data']['move']['code'], ["blue", "blue", "blue", "blue"])
+        self.assertEqual(event['data']['status'], 'in_progress')
+
+        status_code = await sync_to_async(self.post_move, thread_sensitive=False)(["red", "orange", "green", "yellow"])
+        self.assertEqual(status_code, status.HTTP_201_CREATED)
+        event = self.parse_event((await asyncio.wait_for(anext(stream), 10)).decode())
+        self.assertEqual(event['id'], 2)
+        self.assertEqual(event['data']['move']['result'], ["black", "black", "white", "white"])
+
+        await sync_to_async(self.post_move, thread_sensitive=False)(["red", "orange", "yellow", "green"])
+        event = self.parse_event((await asyncio.wait_for(anext(stream), 10)).decode())
+        self.assertEqual(event['id'], 3)
+        self.assertEqual(event['data']['status'], 'won')
+        # the stream ends with the game
+        with self.assertRaises(StopAsyncIteration):
+            await asyncio.wait_for(anext(stream), 10)
+        self.assertEqual(events.broker.count(), 0)
+
+        # reconnecting after the last event id only gets the moves after it
+        response = await self.async_client.get(self.game_events_url, headers={'Authorization': 'Token ' + self.token.key, 'Last-Event-ID': '2'})
+        messages = [message.decode() async for message in response.streaming_content]
+        self.assertEqual([self.parse_event(message)['id'] for message in messages], [3])
+
+    async def test_game_events_fail(self) -> None:
+        """Test that a game's events are only streamed to its codebreaker."""
+
+        response = await self.async_client.get(self.game_events_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = await self.async_client.get(self.game_events_url, {'token': 'invalid'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        other_token = await sync_to_async(Token.objects.create)(user=self.testuser2game)
+        response = await self.async_client.get(self.game_events_url, {'token': other_token.key})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = await self.async_client.get(reverse('game-events', kwargs={'pk': 999999}), {'token': self.token.key})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        for since in ['a', '²']:
+            response = await self.async_client.get(self.game_events_url, {'token': self.token.key, 'since': since})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(events.broker.count(), 0)
+
+    def test_game_events_wsgi(self) -> None:
+        """Test that a game's events aren't streamed under WSGI, which would never send the stream of a game in progress."""
+
+        response = self.client.get(self.game_events_url, {'token': self.token.key})
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+        self.assertEqual(events.broker.count(), 0)
+
+
+
+class AsyncViewsTest(APITransactionTestCase):
+    """Class to test the async versions of the game and move views, which run in the pool of database threads."""
+
+    def setUp(self) -> None:
+        """Initial set up for testing the async views."""
+        self.testuser1game = User.objects.create_user('testuser1game', 'testuser1game@test.com', 'password1234')
+        self.token = Token.objects.create(user=self.testuser1game)
+        # a pool of the test's own, smaller than the number of requests sent at once
+        patcher = mock.patch.object(db_threads, '_executor', db_threads.ThreadPoolExecutor(max_workers=2))
+        executor = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(executor.shutdown)
+
+    async def request(self, view: type, method: str, path: str, data: Dict = None, **kwargs):
+        """Return the response of an async view to a request from the user."""
+        factory = AsyncRequestFactory()
+        request = getattr(factory, method)(path, data, content_type='application/json', headers={'Authorization': 'Token ' + self.token.key})
+        return await view.as_view()(request, **kwargs)
+
+    async def test_async_views(self) -> None:
+        """Test that games are created, played and read through the async views, with concurrent requests."""
+
+        response = await self.request(views.AsyncGameListCreate, 'post', '/api/games/', {"number_of_moves": 12})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        game_id = json.loads(response.content)['id']
+        await Game.objects.filter(pk=game_id).aupdate(packed_code=Game.pack_code(Game(), ["red", "orange", "yellow", "green"]))
+        responses = await asyncio.gather(*[
+            self.request(views.AsyncMoveCreate, 'post', '/api/moves/', {"game": game_id, "code": ["blue", "blue", "blue", "blue"]})
+            for _ in range(6)
+        ])
+        self.assertEqual([response.status_code for response in responses], [status.HTTP_201_CREATED] * 6)
+        response = await self.request(views.AsyncGameDetails, 'get', '/api/games/{}/'.format(game_id), pk=game_id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = json.loads(response.content)
+        self.assertEqual(data['moves_played'], 6)
+        self.assertEqual(len(data['moves']), 6)
+        response = await self.request(views.AsyncGameListCreate, 'get', '/api/games/')
+        self.assertEqual([game['id'] for game in json.loads(response.content)['results']], [game_id])
+
+    async def test_async_views_fail(self) -> None:
+        """Test that the async views answer errors like their sync versions."""
+
+        response = await self.request(views.AsyncGameDetails, 'get', '/api/games/1/', {'since': 'a'}, pk=1)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = await self.request(views.AsyncMoveCreate, 'post', '/api/moves/', {"game": 999999, "code": ["red"] * 4})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = await self.request(views.AsyncMoveCreate, 'get', '/api/moves/')
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    async def test_export_streams(self) -> None:
+        """Test that the ASGI handler sends an export's first rows before the later ones are fetched."""
+
+        admin = await sync_to_async(User.objects.create_user)('admin', 'admin@test.com', 'password1234', is_staff=True)
+        token = await Token.objects.acreate(user=admin)
+        games = [await Game.objects.acreate(number_of_moves=12, codebreaker=admin, code=["red"] * 4) for _ in range(6)]
+        fetched = []
+
+        def game_rows(**filters):
+            for row in export.game_rows(**filters):
+                fetched.append(row['id'])
+                yield row
+
+        request = asyncio.Event()
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': reverse('export'), 'query_string': b'table=games', 'client': ('127.0.0.1', 50000),
+            'headers': [(b'host', b'testserver'), (b'authorization', ('Token ' + token.key).encode())]
+        }
+
+        async def receive() -> Dict:
+            # the request has no body, then the client stays connected
+            if request.is_set():
+                await asyncio.Future()
+            request.set()
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        # the body sent in each message, with the number of rows fetched by then
+        parts = []
+
+        async def send(message: Dict) -> None:
+            if message['type'] == 'http.response.body':
+                parts.append((message.get('body', b''), len(fetched)))
+
+        with mock.patch.object(export, 'CHUNK_SIZE', 2), mock.patch.dict(views.Export.TABLES, {'games': (game_rows, export.GAME_FIELDS)}):
+            await ASGIHandler()(scope, receive, send)
+        rows = [json.loads(line) for line in b''.join(body for body, _ in parts).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [game.id for game in games])
+        self.assertEqual(parts[0], (b''.join(json.dumps(row).encode() + b'\n' for row in rows[:2]), 2))
+
+
+
+class BrokerTest(SimpleTestCase):
+    """Class to test fanning events out to subscribers."""
+
+    def test_publish(self) -> None:
+        """Test that events published from another thread reach only the game's subscribers."""
+
+        async def run() -> None:
+            broker = events.Broker()
+            subscription = broker.subscribe(1)
+            other = broker.subscribe(2)
+            self.assertEqual(broker.count(), 2)
+            thread = threading.Thread(target=broker.publish, args=(1, {'moves_played': 1}))
+            thread.start()
+            thread.join()
+            self.assertEqual(await asyncio.wait_for(subscription.queue.get(), 1), {'moves_played': 1})
+            self.assertTrue(other.queue.empty())
+            broker.unsubscribe(subscription)
+            broker.unsubscribe(other)
+            self.assertEqual(broker.count(), 0)
+            # games without subscribers are skipped
+            broker.publish(1, {'moves_played': 2})
+
+        asyncio.run(run())
+
+    @override_settings(EVENTS_QUEUE_SIZE=2)
+    def test_close(self) -> None:
+        """Test that subscribers falling behind, or whose events may have gaps, are closed."""
+
+        async def run() -> None:
+            broker = events.Broker()
+            subscription = broker.subscribe(1)
+            for moves_played in range(1, 4):
+                broker.publish(1, {'moves_played': moves_played})
+            await asyncio.sleep(0)
+            self.assertTrue(subscription.closed)
+            self.assertEqual([subscription.queue.get_nowait() for _ in range(3)], [{'moves_played': 1}, {'moves_played': 2}, None])
+            other = broker.subscribe(2)
+            broker.close_all()
+            await asyncio.sleep(0)
+            self.assertTrue(other.closed)
+            self.assertIsNone(other.queue.get_nowait())
+
+        asyncio.run(run())
+
+
+
+class LocalNotifierTest(APITestCase):
+    """Class to test delivering events to the subscribers of the same process."""
+
+    def test_publish(self) -> None:
+        """Test that published events reach the game's subscribers only once their transaction commits."""
+
+        async def subscribe() -> tuple:
+            return events.broker.subscribe(1), events.broker.subscribe(2)
+
+        # the subscriptions are read on an event loop, while the database is used from this thread as in a sync view
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        subscription, other = loop.run_until_complete(subscribe())
+        self.addCleanup(events.broker.unsubscribe, subscription)
+        self.addCleanup(events.broker.unsubscribe, other)
+        with self.captureOnCommitCallbacks() as callbacks:
+            events.LocalNotifier().publish([{'game': 1, 'moves_played': 1}], 'default')
+        loop.run_until_complete(asyncio.sleep(0))
+        self.assertTrue(subscription.queue.empty())
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(loop.run_until_complete(asyncio.wait_for(subscription.queue.get(), 1)), {'game': 1, 'moves_played': 1})
+        self.assertTrue(other.queue.empty())
+
+
+
+@override_settings(REPLICA_DATABASES=['replica_1'])
+class ReplicaTest(APITransactionTestCase):
+    """Class to test reading from a replica, with a second database standing in for a replica behind the primary."""
+
+    databases = {'default', 'replica_1'}
+
+    def setUp(self) -> None:
+        """Initial set up for testing replica reads, copying a user and a game to the replica."""
+        cache.clear()
+        self.testuser1game = User.objects.create_user('testuser1game', 'testuser1game@test.com', 'password1234')
+        self.token = Token.objects.create(user=self.testuser1game)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.game1 = Game.objects.create(number_of_moves=12, codebreaker=self.testuser1game, code=["red", "orange", "yellow", "green"])
+        self.testuser1game.save(using='replica_1')
+        self.game1.save(using='replica_1')
+        self.game_details_url = reverse('game-details', kwargs={'pk': self.game1.id})
+
+    def test_read_your_writes(self) -> None:
+        """Test that reads go to the replica, except for a client which just wrote."""
+
+        response = self.client.get(self.game_details_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['moves_played'], 0)
+        response = self.client.post(reverse('move-create'), {"game": self.game1.id, "code": ["blue", "blue", "blue", "blue"]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # pinned to the primary, the move is seen even though the replica doesn't have it
+        response = self.client.get(self.game_details_url)
+        self.assertEqual(response.data['moves_played'], 1)
+        self.assertEqual(len(response.data['moves']), 1)
+        # hints lock the game in a transaction, so they read from the primary
+        response = self.client.get(reverse('game-hint', kwargs={'pk': self.game1.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # once the pin expires reads go back to the replica
+        cache.clear()
+        response = self.client.get(self.game_details_url)
+        self.assertEqual(response.data['moves_played'], 0)
+        # a client's writes only pin that client, a new user's token is read from the primary
+        other_client = APIClient()
+        other_token = Token.objects.create(user=User.objects.create_user('testuser2game', 'testuser2game@test.com', 'password1234'))
+        other_client.credentials(HTTP_AUTHORIZATION='Token ' + other_token.key)
+        response = other_client.post(reverse('game-create'), None, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = other_client.get(reverse('game-create'))
+        self.assertEqual(len(response.data['results']), 1)
+        response = self.client.get(self.game_details_url)
+        self.assertEqual(response.data['moves_played'], 0)
+
+        with override_settings(REPLICA_DATABASES=[]):
+            cache.clear()
+            response = self.client.get(self.game_details_url)
+            self.assertEqual(response.data['moves_played'], 1)
+
+    def test_router(self) -> None:
+        """Test that writes, reads in a transaction and auth tokens go to the primary."""
+
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Game), 'replica_1')
+        self.assertEqual(router.db_for_read(Token), 'default')
+        self.assertEqual(router.db_for_write(Game), 'default')
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Game), 'default')
+        self.assertEqual(Game.objects.filter(pk=self.game1.id).db, 'replica_1')
+        with override_settings(REPLICA_DATABASES=[]):
+            self.assertEqual(router.db_for_read(Game), 'default')
+
+
+
+@override_settings(SHARD_DATABASES=['default', 'shard_1', 'shard_2'])
+class ShardingTest(APITransactionTestCase):
+    """Class to test spreading users' games, moves and stats across shards."""
+
+    databases = {'default', 'shard_1', 'shard_2'}
+
+    def setUp(self) -> None:
+        """Initial set up for testing sharding, interleaving the shards' ids."""
+        cache.clear()
+        for shard in settings.SHARD_DATABASES:
+            sharding.interleave_ids(shard)
+        self.code = ["red", "orange", "yellow", "green"]
+
+    def create_user(self, shard: str) -> User:
+        """Create a user placed on a shard, with a token for the test client."""
+        while True:
+            number = User.objects.count() + 1
+            user = User.objects.create_user('testuser{}shard'.format(number), 'testuser{}shard@test.com'.format(number), 'password1234')
+            if sharding.placement(user.id) == shard:
+                Token.objects.create(user=user)
+                return user
+            user.delete()
+
+    def login(self, user: User) -> None:
+        """Authenticate the test client as a user."""
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.get(user=user).key)
+
+    def create_game(self, user: User, moves: List) -> Game:
+        """Create a game through the api and play moves in it."""
+        self.login(user)
+        game = Game.objects.using(sharding.get_shard(user.id)).get(pk=self.client.post(reverse('game-create'), None, format='json').data['id'])
+        game.code = self.code
+        game.save(update_fields=['packed_code'])
+        for code in moves:
+            self.assertEqual(self.client.post(reverse('move-create'), {"game": game.id, "code": code}, format='json').status_code, status.HTTP_201_CREATED)
+        return game
+
+    def test_routing(self) -> None:
+        """Test that a user's games, moves and stats are all on their shard and every view finds them there."""
+
+        testuser1 = self.create_user('shard_1')
+        testuser2 = self.create_user('shard_2')
+        won = self.create_game(testuser1, [["blue", "blue", "blue", "blue"], self.code])
+        self.assertEqual(UserShard.objects.get(user=testuser1).shard, 'shard_1')
+        batch = self.create_game(testuser1, [])
+        response = self.client.post(reverse('move-batch-create'), {"game": batch.id, "codes": [["blue", "blue", "blue", "blue"]]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(reverse('game-solve'), {"code": self.code}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        other = self.create_game(testuser2, [self.code])
+
+        self.assertEqual(Game.objects.using('shard_1').filter(codebreaker=testuser1).count(), 3)
+        self.assertEqual(Move.objects.using('shard_1').count(), 3 + len(response.data['moves']))
+        self.assertEqual(Game.objects.using('shard_2').filter(codebreaker=testuser2).count(), 1)
+        self.assertFalse(Game.objects.using('default').exists())
+        # each shard's ids are congruent to its index + 1
+        self.assertEqual(set(game_id % settings.MAX_SHARDS for game_id in Game.objects.using('shard_1').values_list('id', flat=True)), {2})
+        self.assertEqual(other.id % settings.MAX_SHARDS, 3)
+
+        self.login(testuser1)
+        response = self.client.get(reverse('game-details', kwargs={'pk': won.id}))
+        self.assertEqual(response.data['status'], 'won')
+        self.assertEqual(len(response.data['moves']), 2)
+        response = self.client.get(reverse('game-create'))
+        self.assertEqual(len(response.data['results']), 3)
+        response = self.client.get(reverse('game-bulk-details'), {'ids': '{},{},{}'.format(won.id, batch.id, other.id)})
+        self.assertEqual(len(response.data['games']), 2)
+        self.assertEqual(response.data['missing'], [other.id])
+        response = self.client.get(reverse('game-hint', kwargs={'pk': batch.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(reverse('player-stats', kwargs={'pk': testuser1.id}))
+        self.assertEqual(response.data['username'], testuser1.username)
+        self.assertEqual(response.data['games_won'], 1)
+        response = self.client.get(reverse('leaderboard'))
+        self.assertEqual([row['username'] for row in response.data['leaderboard']], [testuser2.username, testuser1.username])
+
+        testuser1.is_staff = True
+        testuser1.save()
+        response = self.client.get(reverse('export'))
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        game_ids = [game_id for shard in settings.SHARD_DATABASES for game_id in Game.objects.using(shard).values_list('id', flat=True)]
+        self.assertEqual(len(game_ids), 4)
+        self.assertEqual(sorted(row['id'] for row in rows), sorted(game_ids))
+
+        # deleting a user deletes their rows on their shard
+        testuser2.delete()
+        self.assertFalse(Game.objects.using('shard_2').exists())
+        self.assertFalse(PlayerStats.objects.using('shard_2').exists())
+
+    def test_rebalance_shards(self) -> None:
+        """Test that users are moved with their games, moves and stats from the first shard to the one they're placed on."""
+
+        testuser1 = self.create_user('shard_1')
+        # games from before sharding are on the first shard
+        with sharding.use_shard('default'):
+            game = Game.objects.create(number_of_moves=12, codebreaker=testuser1, code=self.code)
+            game.record_move(True, Move(game=game, code=self.code, result=["black"] * 4))
+            PlayerStats.record_game(game)
+        self.assertEqual(sharding.get_shard(testuser1.id), 'default')
+        self.login(testuser1)
+        self.assertEqual(self.client.get(reverse('game-create')).data['results'][0]['id'], game.id)
+
+        out = StringIO()
+        call_command('rebalance_shards', '--dry-run', stdout=out)
+        self.assertIn('Would move 1 users from default to shard_1', out.getvalue())
+        self.assertTrue(Game.objects.using('default').exists())
+        call_command('rebalance_shards', batch_size=1, stdout=out)
+        self.assertIn('Moved 1 users with 1 games and 1 moves from default to shard_1', out.getvalue())
+        self.assertFalse(Game.objects.using('default').exists())
+        self.assertFalse(Move.objects.using('default').exists())
+        self.assertFalse(PlayerStats.objects.using('default').exists())
+        self.assertEqual(UserShard.objects.get(user=testuser1).shard, 'shard_1')
+
+        # the moved rows keep their ids
+        response = self.client.get(reverse('game-details', kwargs={'pk': game.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['moves'][0]['code'], self.code)
+        response = self.client.get(reverse('player-stats', kwargs={'pk': testuser1.id}))
+        self.assertEqual(response.data['moves_to_win_histogram'], {'1': 1})
+        # new games are created on the new shard
+        self.client.post(reverse('game-create'), None, format='json')
+        self.assertEqual(Game.objects.using('shard_1').count(), 2)
+        out = StringIO()
+        call_command('rebalance_shards', stdout=out)
+        self.assertEqual(out.getvalue(), '')
+
+    def test_no_shard_selected(self) -> None:
+        """Test that sharded models can't be queried without selecting a shard."""
+
+        with self.assertRaises(RuntimeError):
+            Game.objects.count()
+        with sharding.use_shard('shard_2'):
+            self.assertEqual(Game.objects.count(), 0)
+
+
+
+class ScoringTest(SimpleTestCase):
+    """Class to test the vectorized scoring engine."""
+
+    def reference_result(self, game_code: list, move_code: list) -> tuple:
+        """Score a single pair of codes the slow way to compare against."""
+        blacks = sum(1 for secret, guess in zip(game_code, move_code) if secret == guess)
+        shared = sum(min(game_code.count(color), move_code.count(color)) for color in set(game_code))
+        return blacks, shared - blacks
+
+    def test_score_all_pairs(self) -> None:
+        """Test that scoring every pair of 4 hole, 6 color codes matches the reference result."""
+
+        codes = np.array(list(itertools.product(range(6), repeat=4)))
+        secrets = np.repeat(codes, len(codes), axis=0)
+        guesses = np.tile(codes, (len(codes), 1))
+        blacks, whites = scoring.score(secrets, guesses, 6)
+        self.assertEqual(len(blacks), 1296 * 1296)
+        for i in range(0, len(secrets), 997):
+            self.assertEqual((blacks[i], whites[i]), self.reference_result(list(secrets[i]), list(guesses[i])))
+
+    def test_score_broadcast_single_secret(self) -> None:
+        """Test that a single secret is scored against many guesses."""
+
+        blacks, whites = scoring.score([0, 1, 2, 3], [[0, 1, 2, 3], [3, 2, 1, 0], [0, 0, 0, 0], [4, 4, 4, 4]], 6)
+        self.assertEqual(list(blacks), [4, 0, 1, 0])
+        self.assertEqual(list(whites), [0, 4, 0, 0])
+
+    def test_get_result(self) -> None:
+        """Test that the move result wrapper returns blacks before whites."""
+
+        game_code = ["red", "orange", "yellow", "green"]
+        self.assertEqual(Move.get_result(game_code, ["red", "orange", "green", "yellow"]), ["black", "black", "white", "white"])
+        self.assertEqual(Move.get_result(game_code, ["blue", "blue", "blue", "purple"]), [])
+        self.assertEqual(Move.get_result(["red", "red", "blue", "blue"], ["blue", "red", "red", "red"]), ["black", "white", "white"])
+
+    def test_get_result_wrong_length(self) -> None:
+        """Test that scoring a code with another number of colors than the game's code is rejected."""
+
+        with self.assertRaises(ValidationError):
+            Move.get_result(["red", "red", "blue", "blue"], ["red", "red", "blue"])
+        with self.assertRaises(ValidationError):
+            Move.get_results(["red", "red", "blue", "blue"], [["red", "red", "blue", "blue"], ["red", "red", "blue", "blue", "red"]])
+
+
+
+class FeedbackTableTest(SimpleTestCase):
+    """Class to test the precomputed feedback table."""
+
+    def setUp(self) -> None:
+        """Build the feedback tables in a temporary directory."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.addCleanup(feedback_table._tables.clear)
+        feedback_table._tables.clear()
+        settings_override = override_settings(FEEDBACK_TABLE_DIR=self.directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_build_feedback_table(self) -> None:
+        """Test that the table built by the management command matches the scoring engine."""
+
+        # a table built after a lookup missed it is used by the next lookup
+        self.assertIsNone(feedback_table.get_table(3, 4))
+        call_command('build_feedback_table', holes=3, colors=4, stdout=StringIO())
+        table = feedback_table.get_table(3, 4)
+        self.assertEqual(table.shape, (64, 64))
+        self.assertEqual(table.dtype, np.uint8)
+        self.assertFalse(table.flags.writeable)
+        codes = scoring.unpack_codes(np.arange(64), 3, 4)
+        for secret in codes:
+            blacks, whites = scoring.score(secret, codes, 4)
+            self.assertEqual(list(table[scoring.pack_codes(secret, 4)[0]]), list(feedback_table.encode_feedback(blacks, whites, 3)))
+
+    def test_build_feedback_table_too_large(self) -> None:
+        """Test that tables larger than the configured limit aren't built."""
+
+        with override_settings(FEEDBACK_TABLE_MAX_BYTES=64 * 64 - 1):
+            with self.assertRaises(CommandError):
+                call_command('build_feedback_table', holes=3, colors=4, stdout=StringIO())
+            with self.assertRaises(ValueError):
+                feedback_table.build_table(3, 4)
+        self.assertIsNone(feedback_table.get_table(3, 4))
+        self.assertEqual(feedback_table.build_table(3, 4).shape, (64, 64))
+
+    def test_narrow_with_table(self) -> None:
+        """Test that candidates narrowed with the table match the ones narrowed by scoring."""
+
+        codes = candidates.all_candidates(3, 4)
+        guess = scoring.unpack_codes(np.int64(6), 3, 4)
+        expected = candidates.narrow(codes, guess, 1, 1, 3, 4)
+        call_command('build_feedback_table', holes=3, colors=4, stdout=StringIO())
+        self.assertEqual(list(candidates.narrow(codes, guess, 1, 1, 3, 4)), list(expected))
+
+    def test_get_result_with_table(self) -> None:
+        """Test that move results are looked up from the default configuration's table."""
+
+        call_command('build_feedback_table', stdout=StringIO())
+        self.assertIsNotNone(feedback_table.get_table(Game.NUMBER_OF_HOLES, len(Game.CODE_COLOR_CHOICES)))
+        game_code = ["red", "orange", "yellow", "green"]
+        self.assertEqual(Move.get_result(game_code, ["red", "orange", "green", "yellow"]), ["black", "black", "white", "white"])
+        self.assertEqual(Move.get_result(game_code, ["red", "blue", "green", "blue"]), ["black", "white"])
+        self.assertEqual(Move.get_result(game_code, game_code), ["black", "black", "black", "black"])
+
+
+
+@override_settings(SOLVER_WORKERS=0)
+class OpeningBookTest(APITestCase):
+    """Class to test the precomputed opening book."""
+
+    def setUp(self) -> None:
+        """Keep the opening books in a temporary directory."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.addCleanup(opening_book._books.clear)
+        opening_book._books.clear()
+        settings_override = override_settings(OPENING_BOOK_DIR=self.directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_build_opening_book(self) -> None:
+        """Test that the book built by the management command holds the solver's guesses along each feedback path."""
+
+        # a book built after a lookup missed it is used by the next lookup
+        self.assertIsNone(opening_book.next_guess([], 4, 6, solver.MINIMAX))
+        call_command('build_opening_book', depth=2, stdout=StringIO())
+        book = opening_book.get_book(4, 6, solver.MINIMAX)
+        self.assertEqual(book.depth, 2)
+        # red red orange orange, Knuth's opening
+        self.assertEqual(book.next_guess([]), 7)
+        remaining = candidates.narrow(candidates.all_candidates(4, 6), scoring.unpack_codes(np.int64(7), 4, 6), 1, 1, 4, 6)
+        self.assertEqual(book.next_guess([(7, 1, 1)]), solver.choose_guess(remaining, 4, 6))
+        # the book doesn't cover games which left it or went past its depth
+        self.assertIsNone(book.next_guess([(8, 1, 1)]))
+        self.assertIsNone(book.next_guess([(7, 1, 1), (0, 0, 0)]))
+        self.assertIsNone(opening_book.next_guess([], 4, 6, solver.EXPECTED_SIZE))
+        moves = solver.play(1295, 4, 6, 12)
+        self.assertEqual(moves[0][0], 7)
+        self.assertEqual(moves[-1], (1295, 4, 0))
+
+    def test_game_hint_with_opening_book(self) -> None:
+        """Test that a hint suggests the book's guess while the game follows the book."""
+
+        root = opening_book.extend_key(0, 0, 0, 4)
+        book = opening_book.OpeningBook(np.array([0, root]), np.array([1295, 1294]), 4, 2)
+        opening_book.save_book(book, opening_book.book_path(4, 6, solver.MINIMAX))
+        testuser = User.objects.create_user('testuser1game', 'testuser1game@test.com', 'password1234')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=testuser).key)
+        game = Game.objects.create(number_of_moves=12, codebreaker=testuser, code=["red", "orange", "yellow", "green"])
+        game_hint_url = reverse('game-hint', kwargs={'pk': game.id})
+        response = self.client.get(game_hint_url, {'suggest': 1})
+        self.assertEqual(response.data['suggestion'], ["purple", "purple", "purple", "purple"])
+        self.client.post(reverse('move-create'), {"game": game.id, "code": ["purple", "purple", "purple", "purple"]}, format='json')
+        response = self.client.get(game_hint_url, {'suggest': 1})
+        self.assertEqual(response.data['suggestion'], ["purple", "purple", "purple", "blue"])
+        # a game which didn't play the book's guess gets a searched suggestion
+        game = Game.objects.create(number_of_moves=12, codebreaker=testuser, code=["red", "orange", "yellow", "green"])
+        self.client.post(reverse('move-create'), {"game": game.id, "code": ["blue", "blue", "blue", "blue"]}, format='json')
+        response = self.client.get(reverse('game-hint', kwargs={'pk': game.id}), {'suggest': 1})
+        self.assertNotIn("blue", response.data['suggestion'])
+
+
+
+class SimulationTest(SimpleTestCase):
+    """Class to test simulating games in memory."""
+
+    def test_simulate_chunk(self) -> None:
+        """Test that a chunk of games is won by every strategy and is reproducible from its seed."""
+
+        for name in simulation.STRATEGIES:
+            strategy_name, counts = simulation.simulate_chunk((name, 5, 3, 4, 10, 1))
+            self.assertEqual(strategy_name, name)
+            self.assertEqual(counts.sum(), 5)
+            # every strategy only guesses codes which could be the code, so it never runs out of moves for 3x4
+            self.assertEqual(counts[0], 0)
+            self.assertEqual(list(simulation.simulate_chunk((name, 5, 3, 4, 10, 1))[1]), list(counts))
+
+    def test_simulate_games(self) -> None:
+        """Test that the management command reports each strategy's games across a process pool."""
+
+        out = StringIO()
+        call_command('simulate_games', games=30, strategies=['first', 'random'], holes=3, colors=4, workers=2, chunk_size=7, seed=1, stdout=out)
+        report = out.getvalue()
+        self.assertIn('3x4 with 12 moves, 60 games', report)
+        self.assertRegex(report, r'first +30 +100\.00')
+        self.assertRegex(report, r'random +30 +100\.00')
+
+
+
+class BenchmarkLoadTest(SimpleTestCase):
+    """Class to test the load benchmark's client."""
+
+    def test_error_responses(self) -> None:
+        """Test that server errors and bodies which aren't JSON are counted as errors rather than raised."""
+
+        client = benchmark_load.Client('http://localhost:8000', 1)
+        responses = [(201, b'{"id": 1}'), (500, b'<h1>Server Error</h1>'), (200, b'<html></html>'), (400, b'{"code": ["required"]}')]
+        with mock.patch.object(client, 'connection') as connection:
+            for response_status, content in responses:
+                connection.getresponse.return_value = mock.Mock(status=response_status, read=mock.Mock(return_value=content))
+                client.request('create move', 'POST', '/api/moves/', {})
+            connection.getresponse.side_effect = ConnectionResetError
+            self.assertEqual(client.request('create move', 'POST', '/api/moves/', {}), (0, None))
+        self.assertEqual(client.errors, {'create move': 3})
+        self.assertEqual(len(client.latencies['create move']), 4)
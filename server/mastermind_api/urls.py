@@ -1,10 +1,25 @@
 from mastermind_api import views
+from django.conf import settings
 from django.urls import path
 
 
 
+# the busiest endpoints have async versions for ASGI servers, see the ASYNC_VIEWS setting
+if settings.ASYNC_VIEWS:
+    GameListCreate, GameDetails, MoveCreate = views.AsyncGameListCreate, views.AsyncGameDetails, views.AsyncMoveCreate
+else:
+    GameListCreate, GameDetails, MoveCreate = views.GameListCreate, views.GameDetails, views.MoveCreate
+
 urlpatterns = [
-    path('games/', views.GameCreate.as_view(), name='game-create'),
-    path('games/<int:pk>/', views.GameDetails.as_view(), name='game-details'),
-    path('moves/', views.MoveCreate.as_view(), name='move-create'),
+    path('games/', GameListCreate.as_view(), name='game-create'),
+    path('games/bulk/', views.GameBulkDetails.as_view(), name='game-bulk-details'),
+    path('games/solve/', views.GameSolve.as_view(), name='game-solve'),
+    path('games/<int:pk>/', GameDetails.as_view(), name='game-details'),
+    path('games/<int:pk>/events/', views.GameEvents.as_view(), name='game-events'),
+    path('games/<int:pk>/hint/', views.GameHint.as_view(), name='game-hint'),
+    path('moves/', MoveCreate.as_view(), name='move-create'),
+    path('moves/batch/', views.MoveBatchCreate.as_view(), name='move-batch-create'),
+    path('stats/leaderboard/', views.Leaderboard.as_view(), name='leaderboard'),
+    path('stats/<int:pk>/', views.PlayerStatsDetails.as_view(), name='player-stats'),
+    path('export/', views.Export.as_view(), name='export'),
 ]
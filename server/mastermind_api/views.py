@@ -1,20 +1,65 @@
-from mastermind_api.models import Game
+from mastermind_api.models import Game, Move, PlayerStats
+from users.models import User
+from mastermind_api import events, export, game_cache, opening_book, sharding, solver
+from django.db.models import Prefetch
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
-from mastermind_api.serializers import GameCreateSerializer, GameDetailsSerializer, MoveCreateSerializer
+from rest_framework import serializers, status
+from mastermind_api.serializers import GameCreateSerializer, GameDetailsSerializer, GameListSerializer, GameSolveSerializer, PlayerStatsSerializer, MoveCreateSerializer, MoveBatchCreateSerializer, MoveDetailsSerializer
 from rest_framework import permissions
 from mastermind_api.permissions import IsCodebreaker
-from typing import Dict
+from mastermind_api.pagination import GameCursorPagination
+from django.utils.http import parse_etags
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views import View
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
+from users.authentication import CachedTokenAuthentication
+from asgiref.sync import sync_to_async
+from mastermind.db_threads import ThreadedView
+from typing import AsyncIterator, Dict
+import asyncio
+import contextvars
+import itertools
+import json
 
 
 
-class GameCreate(APIView):
-    """Class to handle game creation."""
+class ShardedAPIView(APIView):
+    """Base class for views of the logged in user's games, which routes them to the user's shard."""
 
-    # user must be logged in to create a game
+    def dispatch(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        # the shard is set in a copy of the context, so it doesn't outlive the request
+        return contextvars.copy_context().run(super(ShardedAPIView, self).dispatch, request, *args, **kwargs)
+
+    def initial(self, request: Dict, *args, **kwargs) -> None:
+        super(ShardedAPIView, self).initial(request, *args, **kwargs)
+        if request.user.is_authenticated:
+            sharding.set_shard(sharding.get_shard(request.user.id))
+
+
+
+class GameListCreate(ShardedAPIView):
+    """Class to handle listing the logged in user's games and game creation."""
+
+    # user must be logged in to list or create games
     permission_classes = (permissions.IsAuthenticated,)
 
+    def get(self, request: Dict, format: str='json') -> Response:
+        """List the user's games newest first, a page at a time, optionally only those with the given statuses."""
+        games = Game.objects.filter(codebreaker_id=request.user.id)
+        # a comma separated list of statuses, e.g. won,lost
+        if request.query_params.get('status'):
+            statuses = dict((name, value) for value, name in Game.STATUS_CHOICES)
+            names = request.query_params['status'].split(',')
+            if not all(name in statuses for name in names):
+                return Response({'status': ['Status must be one of ' + str(list(statuses))]}, status=status.HTTP_400_BAD_REQUEST)
+            games = games.filter(status__in=[statuses[name] for name in names])
+        paginator = GameCursorPagination()
+        page = paginator.paginate_queryset(games, request, view=self)
+        return paginator.get_paginated_response(GameListSerializer(page, many=True).data)
+
     def post(self, request: Dict, format: str='json') -> Response:
         """Create a new game."""
         # set the game's codebreaker based on the logged in user's id
@@ -31,34 +76,249 @@ class GameCreate(APIView):
                 json = serializer.data
                 # append the color choies to the results,
                     # so the user knows which options they have for a move
-                json['color_choices'] = Game.CODE_COLOR_CHOICES
+                json['color_choices'] = game.color_choices
                 return Response(json, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 
-class GameDetails(APIView):
+class GameSolve(ShardedAPIView):
+    """Class to handle creating a game with the user's code, which the server plays as the codebreaker."""
+
+    # user must be logged in to create a game
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def post(self, request: Dict, format: str='json') -> Response:
+        """Create a new game and play it."""
+        # the logged in user owns the game
+        request.data['codebreaker'] = request.user.id
+        # serialize the request body
+        serializer = GameSolveSerializer(data=request.data)
+        # check that the request data was valid
+            # and that the code is valid for the game's configuration
+        if serializer.is_valid():
+            # play the game and save it with its moves to the database
+            game = serializer.save()
+            json = GameDetailsSerializer(game).data
+            json['color_choices'] = game.color_choices
+            return Response(json, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+
+class GameDetails(ShardedAPIView):
     """Class to get game details with move history."""
 
     # user must be logged in and own a game to get it
     permission_classes = (permissions.IsAuthenticated, IsCodebreaker,)
 
     def get(self, request: Dict, pk: int) -> Response:
+        # the number of moves the client already has,
+            # only the moves played after them are returned
+        since = request.query_params.get('since', '0')
+        # isdecimal rather than isdigit, which is true of digits int can't parse like superscripts
+        if not since.isdecimal():
+            return Response({'since': ['A non-negative integer is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        since = int(since)
         # get the game object by its primary key
         game = Game.objects.get(pk=pk)
         # check that the user is the codebreaker of the game
         self.check_object_permissions(self.request, game)
+        # the game only changes when a move is played,
+            # so a client that already has the current version doesn't need the move history again
+        etag = game.get_etag(since)
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
         # serialize the game object
-        serializer = GameDetailsSerializer(game)
+        serializer = GameDetailsSerializer(game, context={'since': since})
         json = serializer.data
         # append the color choies to the results,
             # so the user knows which options they have for a move
-        json['color_choices'] = Game.CODE_COLOR_CHOICES
+        json['color_choices'] = game.color_choices
+        return Response(json, status=status.HTTP_200_OK, headers=headers)
+
+
+
+class AsyncGameListCreate(ThreadedView):
+    """Async version of GameListCreate for ASGI servers, see ThreadedView."""
+
+    view_class = GameListCreate
+
+
+
+class AsyncGameDetails(ThreadedView):
+    """Async version of GameDetails for ASGI servers, see ThreadedView."""
+
+    view_class = GameDetails
+
+
+
+class GameBulkDetails(ShardedAPIView):
+    """Class to get the details with move history of several games at once."""
+
+    # the most games fetched by one request
+    MAX_IDS = 100
+
+    # user must be logged in, only their own games are returned
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get(self, request: Dict) -> Response:
+        # a comma separated list of game ids
+        ids = request.query_params.get('ids', '').split(',')
+        if not all(game_id.isdecimal() for game_id in ids) or len(ids) > self.MAX_IDS:
+            error = 'A comma separated list of at most ' + str(self.MAX_IDS) + ' game ids is required.'
+            return Response({'ids': [error]}, status=status.HTTP_400_BAD_REQUEST)
+        ids = list(dict.fromkeys(int(game_id) for game_id in ids))
+        # the user's games are selected by the query rather than checked one by one,
+            # and all of their moves are fetched in order by a second query
+        games = Game.objects.filter(pk__in=ids, codebreaker_id=request.user.id).prefetch_related(
+            Prefetch('moves', queryset=Move.objects.order_by('id'))
+        )
+        games = dict((game.id, game) for game in games)
+        json = {'games': [], 'missing': []}
+        # return the games in the order they were asked for,
+            # games that don't exist or aren't the user's are listed as missing
+        for game_id in ids:
+            if game_id not in games:
+                json['missing'].append(game_id)
+                continue
+            game_json = GameDetailsSerializer(games[game_id]).data
+            game_json['color_choices'] = games[game_id].color_choices
+            json['games'].append(game_json)
+        return Response(json, status=status.HTTP_200_OK)
+
+
+
+class GameEvents(View):
+    """Class to stream a game's moves as server-sent events as soon as they're created.
+
+    This is a plain async django view rather than a rest framework one, so idle subscribers only cost a coroutine each.
+    Moves after the Last-Event-ID header or the since parameter are sent first, so reconnecting clients catch up,
+        then each new move is pushed until the game ends.
+    It needs an ASGI server: under WSGI django reads the whole stream before sending any of it, which never ends for a game in progress.
+    """
+
+    async def get(self, request: HttpRequest, pk: int) -> HttpResponse:
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse({'detail': 'Game events are only served by ASGI servers, such as uvicorn.'}, status=status.HTTP_501_NOT_IMPLEMENTED)
+        # browsers' EventSource can't send headers, so the token can also be given as a parameter
+        key = request.GET.get('token')
+        authorization = request.META.get('HTTP_AUTHORIZATION', '').split()
+        if len(authorization) == 2 and authorization[0] == 'Token':
+            key = authorization[1]
+        if not key:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+        try:
+            user, _ = await sync_to_async(CachedTokenAuthentication().authenticate_credentials)(key)
+        except AuthenticationFailed as error:
+            return JsonResponse({'detail': error.detail}, status=status.HTTP_401_UNAUTHORIZED)
+        since = request.META.get('HTTP_LAST_EVENT_ID', request.GET.get('since', '0'))
+        if not since.isdecimal():
+            return JsonResponse({'since': ['A non-negative integer is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        shard = await sync_to_async(sharding.get_shard)(user.id)
+        game = await Game.objects.using(shard).filter(pk=pk).afirst()
+        if game is None:
+            return JsonResponse({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        # check that the user is the codebreaker of the game
+        if game.codebreaker_id != user.id:
+            return JsonResponse({'detail': 'You do not have permission to perform this action.'}, status=status.HTTP_403_FORBIDDEN)
+        # listen for new moves before reading the ones already played, so none are missed in between
+        await sync_to_async(events.get_notifier().start, thread_sensitive=False)()
+        subscription = events.broker.subscribe(game.id)
+        response = StreamingHttpResponse(self.stream(game, int(since), subscription, shard), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # ask proxies not to buffer the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream(self, game: Game, since: int, subscription: events.Subscription, shard: str) -> AsyncIterator[str]:
+        """Yield the moves after the first since moves, then each new move until the game ends or the subscription closes."""
+        try:
+            last = since
+            # read from the shard's primary, a replica may not have the moves notified before subscribing yet
+            if game.inline_moves is not None:
+                # the game's row holds its moves, read it again now that new moves are listened for
+                game = await Game.objects.using(shard).aget(pk=game.pk)
+                moves = game.get_moves(since)
+            else:
+                moves = [move async for move in game.moves.using(shard).order_by('id')[since:]]
+            for move in moves:
+                last += 1
+                event = move.get_event(last)
+                yield self.format_event(event)
+                if event['status'] != 'in_progress':
+                    return
+            if game.status != Game.STATUS_IN_PROGRESS and last >= game.moves_played:
+                return
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), settings.EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # a comment keeps the connection from being closed as idle
+                    yield ': keepalive\n\n'
+                    continue
+                # the subscription was closed, the client reconnects with the last event id to catch up
+                if event is None:
+                    return
+                # already sent while catching up
+                if event['moves_played'] <= last:
+                    continue
+                last = event['moves_played']
+                yield self.format_event(event)
+                if event['status'] != 'in_progress':
+                    return
+        finally:
+            events.broker.unsubscribe(subscription)
+
+    @staticmethod
+    def format_event(event: Dict) -> str:
+        """Return a move's event in the server-sent events format, its id being the number of the move in the game."""
+        return 'id: {}\nevent: move\ndata: {}\n\n'.format(event['moves_played'], json.dumps(event))
+
+
+
+class GameHint(ShardedAPIView):
+    """Class to get how many codes are still possible for a game, with an optional suggested next move."""
+
+    # user must be logged in and own a game to get a hint for it
+    permission_classes = (permissions.IsAuthenticated, IsCodebreaker,)
+
+    def get(self, request: Dict, pk: int) -> Response:
+        suggest = request.query_params.get('suggest', 'false').lower()
+        if suggest not in serializers.BooleanField.TRUE_VALUES | serializers.BooleanField.FALSE_VALUES:
+            return Response({'suggest': ['A boolean is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        with sharding.atomic():
+            # get the game object by its primary key,
+                # locking it while its candidate codes are narrowed by the moves played since the last hint
+            game = Game.objects.select_for_update().filter(pk=pk).first()
+            if game is None:
+                return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+            # check that the user is the codebreaker of the game
+            self.check_object_permissions(self.request, game)
+            if game.get_number_of_codes() > Game.MAX_CANDIDATES:
+                error = 'Hints are only available for games with at most ' + str(Game.MAX_CANDIDATES) + ' possible codes.'
+                return Response({'non_field_errors': [error]}, status=status.HTTP_400_BAD_REQUEST)
+            candidates = game.update_candidates()
+            # moves narrow the candidates from now on
+            game_cache.store(game)
+        json = {'game': game.id, 'remaining_codes': len(candidates)}
+        # suggest the next move outside of the transaction so the game isn't locked while searching
+        if suggest in serializers.BooleanField.TRUE_VALUES and len(candidates):
+            suggestion = None
+            # follow the configuration's opening book while the game's moves are still in it
+            book = opening_book.get_book(game.number_of_holes, game.number_of_colors, solver.MINIMAX)
+            if book is not None and game.moves_played < book.depth:
+                suggestion = book.next_guess([(move.packed_code, move.blacks, move.whites) for move in game.get_moves()])
+            if suggestion is None:
+                suggestion = solver.suggest_guess(candidates, game.number_of_holes, game.number_of_colors)
+            json['suggestion'] = game.unpack_code(suggestion)
         return Response(json, status=status.HTTP_200_OK)
 
 
 
-class MoveCreate(APIView):
+class MoveCreate(ShardedAPIView):
     """Class to create a move for a given game."""
 
     # user must be logged in and own a game to create a move for it
@@ -78,3 +338,129 @@ class MoveCreate(APIView):
             if move:
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+
+class AsyncMoveCreate(ThreadedView):
+    """Async version of MoveCreate for ASGI servers, see ThreadedView."""
+
+    view_class = MoveCreate
+
+
+
+class MoveBatchCreate(ShardedAPIView):
+    """Class to create an ordered list of moves for a given game in one request."""
+
+    # user must be logged in and own a game to create moves for it
+    permission_classes = (permissions.IsAuthenticated, IsCodebreaker,)
+
+    def post(self, request: Dict, format: str='json') -> Response:
+        # serialize the request body
+        serializer = MoveBatchCreateSerializer(data=request.data)
+        # check that the request data was valid
+            # and calculate the results of all code guesses
+        if serializer.is_valid():
+            # check that the user is the codebreaker of the game
+            self.check_object_permissions(self.request, serializer.validated_data['game'])
+            # save the new Move objects to the database,
+                # stopping at a winning move or when the game runs out of moves
+            moves = serializer.save()
+            # the moves hold the locked game with its updated state
+            game = moves[0].game
+            json = {
+                'game': game.id,
+                'moves_played': game.moves_played,
+                'status': game.get_status_display(),
+                'moves': MoveDetailsSerializer(moves, many=True).data
+            }
+            return Response(json, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+
+class PlayerStatsDetails(APIView):
+    """Class to get a user's games played, games won and moves to win."""
+
+    # user must be logged in to see stats
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get(self, request: Dict, pk: int) -> Response:
+        # the stats are kept up to date as games end, so this is a single row lookup on the user's shard
+        shard = sharding.get_shard(pk, assign=False) if sharding.is_sharded() else None
+        stats = sharding.select_user(PlayerStats.objects.using(shard)).filter(user_id=pk).first()
+        if stats is None:
+            # users who haven't finished a game yet don't have a stats row
+            user = User.objects.filter(pk=pk).first()
+            if user is None:
+                return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+            stats = PlayerStats(user=user)
+        sharding.load_users([stats])
+        return Response(PlayerStatsSerializer(stats).data, status=status.HTTP_200_OK)
+
+
+
+class Leaderboard(APIView):
+    """Class to get the users who won the most games, ties going to the fewest moves spent winning them."""
+
+    # the most users on the leaderboard
+    MAX_LIMIT = 100
+
+    # user must be logged in to see the leaderboard
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get(self, request: Dict) -> Response:
+        limit = request.query_params.get('limit', '10')
+        if not limit.isdecimal() or not 1 <= int(limit) <= self.MAX_LIMIT:
+            return Response({'limit': ['An integer from 1 to ' + str(self.MAX_LIMIT) + ' is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        # read the top of the leaderboard index of each shard, then merge them
+        stats = []
+        for shard in sharding.shards():
+            top = PlayerStats.objects.using(shard).filter(games_won__gt=0).order_by('-games_won', 'total_moves_to_win', 'user')
+            stats.extend(sharding.select_user(top)[:int(limit)])
+        stats = sorted(stats, key=lambda row: (-row.games_won, row.total_moves_to_win, row.user_id))[:int(limit)]
+        sharding.load_users(stats)
+        return Response({'leaderboard': PlayerStatsSerializer(stats, many=True).data}, status=status.HTTP_200_OK)
+
+
+
+class Export(APIView):
+    """Class to stream every game or move as NDJSON or CSV for analytics."""
+
+    TABLES = {'games': (export.game_rows, export.GAME_FIELDS), 'moves': (export.move_rows, export.MOVE_FIELDS)}
+    OUTPUTS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+    # only admin users can export every user's games
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request: Dict) -> StreamingHttpResponse:
+        """Stream the rows as they're fetched, so memory use doesn't grow with the number of rows, under WSGI as under ASGI."""
+        table = request.query_params.get('table', 'games')
+        # not named format, which rest framework uses to pick a renderer
+        output = request.query_params.get('output', 'ndjson')
+        errors = {}
+        if table not in self.TABLES:
+            errors['table'] = ['Table must be one of ' + str(list(self.TABLES))]
+        if output not in self.OUTPUTS:
+            errors['output'] = ['Output must be one of ' + str(list(self.OUTPUTS))]
+        # optional inclusive id range and codebreaker
+        filters = {}
+        for name in ('min_id', 'max_id', 'user'):
+            value = request.query_params.get(name)
+            filters[name] = None
+            if value is None:
+                continue
+            if value.isdecimal():
+                filters[name] = int(value)
+            else:
+                errors[name] = ['A non-negative integer is required.']
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        table_rows, fields = self.TABLES[table]
+        # one shard after the other, each in id order
+        rows = itertools.chain.from_iterable(table_rows(using=shard, **filters) for shard in sharding.shards())
+        lines = export.ndjson_lines(rows) if output == 'ndjson' else export.csv_lines(rows, fields)
+        if isinstance(request._request, ASGIRequest):
+            lines = export.async_lines(lines)
+        response = StreamingHttpResponse(lines, content_type=self.OUTPUTS[output])
+        response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(table, output)
+        return response
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 
 class UsersConfig(AppConfig):
     name = 'users'
+
+    def ready(self) -> None:
+        """Keep the in process token cache in sync with users and their tokens."""
+        from rest_framework.authtoken.models import Token
+        from users import signals
+        post_save.connect(signals.invalidate_user_tokens, sender=self.get_model('User'))
+        post_delete.connect(signals.invalidate_user_tokens, sender=self.get_model('User'))
+        post_save.connect(signals.invalidate_token_user, sender=Token)
+        post_delete.connect(signals.invalidate_token_user, sender=Token)
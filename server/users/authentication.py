@@ -0,0 +1,107 @@
+from collections import OrderedDict
+from django.conf import settings
+from mastermind.metrics import TOKEN_CACHE_LOOKUPS, TOKEN_CACHE_SIZE
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from typing import Dict, Optional, Set, Tuple
+import threading
+import time
+
+
+
+class TokenCache:
+    """A thread safe least recently used cache of auth tokens with their users, bounded in size and time to live.
+
+    The cache is per process, other processes only see a token's user change or a token's deletion once it expires.
+    With record_metrics its lookups and size are also exported on the metrics endpoint, see mastermind.metrics.
+    """
+
+    def __init__(self, max_size: int, ttl: float, record_metrics: bool = False) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.record_metrics = record_metrics
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # token key to (expiry time, token with its user), least recently used first
+        self._tokens: 'OrderedDict[str, Tuple[float, Token]]' = OrderedDict()
+        # user id to the keys of their cached tokens, so a user's tokens can be evicted without a scan
+        self._user_keys: Dict[int, Set[str]] = {}
+
+    def get(self, key: str) -> Optional[Token]:
+        """Return the cached token for a key, or None if it isn't cached or has expired."""
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    self._evict(key)
+                self.misses += 1
+                if self.record_metrics:
+                    TOKEN_CACHE_LOOKUPS.labels('miss').inc()
+                return None
+            self._tokens.move_to_end(key)
+            self.hits += 1
+            if self.record_metrics:
+                TOKEN_CACHE_LOOKUPS.labels('hit').inc()
+            return entry[1]
+
+    def set(self, token: Token) -> None:
+        """Cache a token with its user, evicting the least recently used tokens when full."""
+        with self._lock:
+            self._tokens[token.key] = (time.monotonic() + self.ttl, token)
+            self._tokens.move_to_end(token.key)
+            self._user_keys.setdefault(token.user_id, set()).add(token.key)
+            while len(self._tokens) > self.max_size:
+                self._evict(next(iter(self._tokens)))
+            self._record_size()
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Evict every cached token of a user."""
+        with self._lock:
+            for key in list(self._user_keys.get(user_id, ())):
+                self._evict(key)
+            self._record_size()
+
+    def clear(self) -> None:
+        """Evict every cached token and reset the counters."""
+        with self._lock:
+            self._tokens.clear()
+            self._user_keys.clear()
+            self.hits = 0
+            self.misses = 0
+            self._record_size()
+
+    def stats(self) -> Dict:
+        """Return the cache's size and hit and miss counters."""
+        with self._lock:
+            return {'size': len(self._tokens), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses}
+
+    def _record_size(self) -> None:
+        """Export the cache's size, the lock must already be held."""
+        if self.record_metrics:
+            TOKEN_CACHE_SIZE.set(len(self._tokens))
+
+    def _evict(self, key: str) -> None:
+        """Evict a token, the lock must already be held."""
+        _, token = self._tokens.pop(key)
+        user_keys = self._user_keys.get(token.user_id)
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._user_keys[token.user_id]
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL, record_metrics=True)
+
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication which keeps recently used tokens and their users in memory instead of querying them on every request."""
+
+    def authenticate_credentials(self, key: str) -> Tuple:
+        token = token_cache.get(key)
+        if token is None:
+            # the parent class checks the token exists and its user is active
+            user, token = super(CachedTokenAuthentication, self).authenticate_credentials(key)
+            token_cache.set(token)
+        return (token.user, token)
@@ -1,12 +1,13 @@
 from .models import User
 from rest_framework import serializers
+from mastermind.metrics import SerializerTimingMixin
 from rest_framework.validators import UniqueValidator
 from django.contrib.auth import authenticate
 from typing import Dict
 
 
 
-class UserRegisterSerializer(serializers.ModelSerializer):
+class UserRegisterSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     """Serializer to handle user registration."""
 
     username = serializers.CharField(min_length=4, max_length=32, validators=[UniqueValidator(queryset=User.objects.all())])
@@ -24,7 +25,7 @@ class UserRegisterSerializer(serializers.ModelSerializer):
 
 
 
-class UserLoginSerializer(serializers.Serializer):
+class UserLoginSerializer(SerializerTimingMixin, serializers.Serializer):
     """Serializer to handle user login."""
 
     username = serializers.CharField(required=True)
@@ -0,0 +1,14 @@
+from rest_framework.authtoken.models import Token
+from users.authentication import token_cache
+from .models import User
+
+
+
+def invalidate_user_tokens(sender: type, instance: User, **kwargs) -> None:
+    """Evict a user's cached tokens when the user changes, e.g. when they are deactivated."""
+    token_cache.invalidate_user(instance.pk)
+
+
+def invalidate_token_user(sender: type, instance: Token, **kwargs) -> None:
+    """Evict a user's cached tokens when one of their tokens is issued, rotated or deleted."""
+    token_cache.invalidate_user(instance.user_id)
@@ -2,6 +2,11 @@ from .models import User
 from rest_framework.test import APITestCase
 from django.urls import reverse
 from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIRequestFactory
+from users.authentication import CachedTokenAuthentication, TokenCache, token_cache
+from prometheus_client import REGISTRY
 
 
 
@@ -254,3 +259,94 @@ class UsersTest(APITestCase):
         response = self.client.post(self.user_login_url, data, format='json')
         self.assertEqual(User.objects.count(), 1)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+
+
+class TokenCacheTest(APITestCase):
+    """Class to test the cached token authentication."""
+
+    def setUp(self) -> None:
+        """Initial set up for testing the token cache."""
+        token_cache.clear()
+        self.testuser = User.objects.create_user('testuser', 'testuser@test.com', 'password1234')
+        self.token = Token.objects.create(user=self.testuser)
+        self.authentication = CachedTokenAuthentication()
+
+    def authenticate(self, key: str) -> tuple:
+        """Authenticate a request with the given token key."""
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION='Token ' + key)
+        return self.authentication.authenticate(request)
+
+    def test_token_cache_hit(self) -> None:
+        """Test that a cached token is authenticated without querying the database."""
+
+        with self.assertNumQueries(1):
+            user, token = self.authenticate(self.token.key)
+        self.assertEqual(user, self.testuser)
+        with self.assertNumQueries(0):
+            user, token = self.authenticate(self.token.key)
+        self.assertEqual(user, self.testuser)
+        self.assertEqual(token.key, self.token.key)
+        self.assertEqual(token_cache.stats()['hits'], 1)
+        self.assertEqual(token_cache.stats()['misses'], 1)
+
+    def test_token_cache_metrics(self) -> None:
+        """Test that the token cache's lookups and size are exported on the metrics endpoint."""
+
+        def lookups(result: str) -> float:
+            return REGISTRY.get_sample_value('mastermind_token_cache_lookups_total', {'result': result}) or 0
+
+        hits, misses = lookups('hit'), lookups('miss')
+        self.authenticate(self.token.key)
+        self.authenticate(self.token.key)
+        self.authenticate(self.token.key)
+        self.assertEqual((lookups('hit') - hits, lookups('miss') - misses), (2, 1))
+        self.assertEqual(REGISTRY.get_sample_value('mastermind_token_cache_size'), 1)
+        # caches other than the process's token cache aren't exported
+        TokenCache(max_size=2, ttl=60).set(Token(key='0', user=self.testuser))
+        self.assertEqual(REGISTRY.get_sample_value('mastermind_token_cache_size'), 1)
+        metrics = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('mastermind_token_cache_lookups_total{result="hit"}', metrics)
+        self.assertIn('mastermind_token_cache_size 1.0', metrics)
+
+    def test_token_cache_user_deactivated(self) -> None:
+        """Test that a cached token is no longer authenticated once its user is deactivated."""
+
+        self.authenticate(self.token.key)
+        self.testuser.is_active = False
+        self.testuser.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(self.token.key)
+
+    def test_token_cache_token_rotated(self) -> None:
+        """Test that a cached token is no longer authenticated once it is replaced by a new token."""
+
+        self.authenticate(self.token.key)
+        old_key = self.token.key
+        self.token.delete()
+        response = self.client.post(reverse('user-login'), {'username': 'testuser', 'password': 'password1234'}, format='json')
+        self.assertNotEqual(response.data['token'], old_key)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(old_key)
+        user, token = self.authenticate(response.data['token'])
+        self.assertEqual(user, self.testuser)
+
+    def test_token_cache_bounded(self) -> None:
+        """Test that the least recently used tokens are evicted from a full cache and expired tokens are missed."""
+
+        cache = TokenCache(max_size=2, ttl=60)
+        tokens = [Token(key=str(i), user=self.testuser) for i in range(3)]
+        cache.set(tokens[0])
+        cache.set(tokens[1])
+        cache.get('0')
+        cache.set(tokens[2])
+        self.assertIsNone(cache.get('1'))
+        self.assertEqual(cache.get('0'), tokens[0])
+        self.assertEqual(cache.stats()['size'], 2)
+        cache.invalidate_user(self.testuser.id)
+        self.assertEqual(cache.stats()['size'], 0)
+
+        cache = TokenCache(max_size=2, ttl=0)
+        cache.set(tokens[0])
+        self.assertIsNone(cache.get('0'))